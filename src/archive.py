@@ -0,0 +1,347 @@
+"""
+Frame archives for recorded sessions.
+
+An archive is one file: a fixed 4 KiB header, the frames, then an index. Raw
+archives store the uint8 frames back to back from the end of the header, so a
+reader memory-maps the file and every frame is a zero-copy view found by
+arithmetic alone. Compressed archives store chunks of frames, each compressed
+on its own with lz4, zstd (both optional dependencies) or zlib, and the index
+holds each chunk's offset and size; reading a frame decompresses only its
+chunk. The index also holds every frame's capture time.
+
+A raw archive that was never closed (the recorder crashed) is still readable:
+its frame count is taken from the file size.
+
+::
+
+    python archive.py pack ../temp/synthetic session.frames
+    python archive.py pack session.frames session.lz4.frames --codec lz4
+    python archive.py info session.frames
+"""
+
+__all__ = [
+    'CODECS',
+    'ArchiveWriter',
+    'ArchiveReader',
+    'ArchiveCapture',
+    'map_chunks',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import argparse
+import mmap
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b'PKFRAMES'
+VERSION = 1
+HEADER_SIZE = 4096
+
+CODECS = ('raw', 'lz4', 'zstd', 'zlib')
+
+# magic, version, codec, height, width, channels, frames, frames per chunk, index offset, fps
+_HEADER = struct.Struct('<8sHHIIIQIQd')
+
+
+def _compressor(codec: str, level: Optional[int]) -> Callable[[bytes], bytes]:
+    if codec == 'lz4':
+        import lz4.frame
+        return lambda data: lz4.frame.compress(data, compression_level=level or 0)
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=level or 3).compress
+    return lambda data: zlib.compress(data, 1 if level is None else level)
+
+
+def _decompressor(codec: str) -> Callable[[bytes], bytes]:
+    if codec == 'lz4':
+        import lz4.frame
+        return lz4.frame.decompress
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress
+    return zlib.decompress
+
+
+class ArchiveWriter:
+    """Append frames of one shape to a new archive.
+
+    :param path: Archive file, replaced if it exists
+    :param codec: One of :data:`CODECS`, ``raw`` for an uncompressed, memory mappable archive
+    :param frames_per_chunk: Frames compressed together, for the compressed codecs
+    :param level: Compression level, the codec's fast default if None
+    :param fps: Nominal frame rate, kept in the header for players
+    """
+
+    def __init__(self, path: Path, codec: str = 'raw', frames_per_chunk: int = 4,
+                 level: int = None, fps: float = 0.0):
+        if codec not in CODECS:
+            raise ValueError(f"codec must be one of {CODECS}, got {codec!r}")
+        self.path = Path(path)
+        self.codec = codec
+        self.frames_per_chunk = 1 if codec == 'raw' else frames_per_chunk
+        self.fps = fps
+        self.shape: Optional[Tuple[int, int, int]] = None
+        self.timestamps: List[float] = []
+        self._compress = None if codec == 'raw' else _compressor(codec, level)
+        self._chunks: List[Tuple[int, int]] = []
+        self._pending: List[bytes] = []
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'wb')
+        self._file.write(bytes(HEADER_SIZE))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def is_open(self) -> bool:
+        return not self._file.closed
+
+    def append(self, frame: np.ndarray, timestamp: float = None):
+        """Add a (height, width) or (height, width, channels) uint8 frame."""
+        frame = np.ascontiguousarray(frame, dtype=np.uint8)
+        shape = frame.shape if frame.ndim == 3 else frame.shape + (1,)
+        if self.shape is None:
+            self.shape = shape
+            # An unclosed raw archive is recovered from the size of its frames
+            self._write_header(0, 0)
+        elif shape != self.shape:
+            raise ValueError(f"frame shape {shape} differs from the archive's {self.shape}")
+        self.timestamps.append(time.time() if timestamp is None else timestamp)
+        if self._compress is None:
+            self._file.write(frame.data)
+            return
+        self._pending.append(frame.tobytes())
+        if len(self._pending) == self.frames_per_chunk:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        data = self._compress(b''.join(self._pending))
+        self._chunks.append((self._file.tell(), len(data)))
+        self._file.write(data)
+        self._pending = []
+
+    def _write_header(self, n_frames: int, index_offset: int):
+        h, w, c = self.shape or (0, 0, 0)
+        header = _HEADER.pack(MAGIC, VERSION, CODECS.index(self.codec), h, w, c, n_frames,
+                              self.frames_per_chunk, index_offset, self.fps)
+        position = self._file.tell()
+        self._file.seek(0)
+        self._file.write(header)
+        self._file.seek(position)
+
+    def close(self):
+        """Write the index and the final header."""
+        if not self.is_open:
+            return
+        self._flush()
+        index_offset = self._file.tell()
+        self._file.write(np.array(self.timestamps, dtype='<f8').tobytes())
+        self._file.write(np.array(self._chunks, dtype='<u8').reshape(-1, 2).tobytes())
+        self._write_header(len(self.timestamps), index_offset)
+        self._file.close()
+
+
+class ArchiveReader:
+    """Random access to the frames of an archive.
+
+    Frames of raw archives are read-only views into the memory-mapped file.
+    """
+
+    def __init__(self, path: Path, cached_chunks: int = 4):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, codec, h, w, c, n_frames, frames_per_chunk, index_offset, fps = \
+            _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a frame archive")
+        if version != VERSION:
+            raise ValueError(f"{self.path} is archive version {version}, expected {VERSION}")
+        self.codec = CODECS[codec]
+        self.shape = (h, w, c)
+        self.frames_per_chunk = frames_per_chunk
+        self.fps = fps
+        self.frame_bytes = h * w * c
+        buffer = memoryview(self._mmap)
+
+        if index_offset == 0:
+            if self.codec != 'raw':
+                raise ValueError(f"{self.path} was not closed, only raw archives can be recovered")
+            n_frames = (len(self._mmap) - HEADER_SIZE) // self.frame_bytes if self.frame_bytes else 0
+            self.timestamps = np.full(n_frames, np.nan)
+            chunks = np.empty((0, 2), dtype=np.uint64)
+        else:
+            self.timestamps = np.frombuffer(buffer, '<f8', n_frames, index_offset)
+            n_chunks = -(-n_frames // frames_per_chunk) if self.codec != 'raw' else 0
+            chunks = np.frombuffer(buffer, '<u8', n_chunks * 2,
+                                   index_offset + 8 * n_frames).reshape(-1, 2)
+        self.n_frames = n_frames
+        self._chunks = chunks
+        if self.codec == 'raw':
+            self.frames = np.ndarray((n_frames, h, w, c), np.uint8, buffer, HEADER_SIZE)
+        else:
+            self.frames = None
+            self._decompress = _decompressor(self.codec)
+            self.chunk = lru_cache(maxsize=cached_chunks)(self._read_chunk)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.n_frames
+
+    def __getitem__(self, i: int) -> np.ndarray:
+        if i < 0:
+            i += self.n_frames
+        if not 0 <= i < self.n_frames:
+            raise IndexError(f"frame {i} of {self.n_frames}")
+        if self.frames is not None:
+            return self.frames[i]
+        return self.chunk(i // self.frames_per_chunk)[i % self.frames_per_chunk]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for start, frames in self.chunks():
+            yield from frames
+
+    def _read_chunk(self, chunk: int) -> np.ndarray:
+        offset, size = (int(value) for value in self._chunks[chunk])
+        data = self._decompress(self._mmap[offset:offset + size])
+        frames = np.frombuffer(data, np.uint8).reshape(-1, *self.shape)
+        return frames
+
+    def chunks(self, start: int = 0, stop: int = None,
+               size: int = None) -> Iterator[Tuple[int, np.ndarray]]:
+        """(first frame, frames) of consecutive blocks of frames in ``[start, stop)``.
+
+        Blocks follow the compressed chunks, or are ``size`` frames (default 256) long in a
+        raw archive.
+        """
+        stop = self.n_frames if stop is None else min(stop, self.n_frames)
+        if self.frames is not None:
+            size = size or 256
+            for first in range(start, stop, size):
+                yield first, self.frames[first:min(first + size, stop)]
+            return
+        per = self.frames_per_chunk
+        for chunk in range(start // per, -(-stop // per)):
+            first = chunk * per
+            frames = self._read_chunk(chunk)
+            lo, hi = max(start - first, 0), min(stop - first, len(frames))
+            yield first + lo, frames[lo:hi]
+
+    def close(self):
+        # Views into the map must be gone before it can close
+        self.frames = None
+        self.timestamps = None
+        self._chunks = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+
+
+def _map_range(path: Path, func: Callable, start: int, stop: int) -> list:
+    with ArchiveReader(path) as reader:
+        return [func(first, frames) for first, frames in reader.chunks(start, stop)]
+
+
+def map_chunks(path: Path, func: Callable[[int, np.ndarray], object], processes: int = None,
+               span: int = 1024) -> list:
+    """``func(first frame, frames)`` over every block of an archive, in a process pool.
+
+    Each task opens the archive itself and covers ``span`` frames, so only paths and
+    results cross between processes.
+    """
+    with ArchiveReader(path) as reader:
+        n_frames, per = len(reader), reader.frames_per_chunk
+    span = -(-span // per) * per
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [pool.submit(_map_range, path, func, start, start + span)
+                   for start in range(0, n_frames, span)]
+        return [result for future in futures for result in future.result()]
+
+
+class ArchiveCapture:
+    """A frame source replaying an archive in place of :class:`window.WindowCapture`."""
+
+    def __init__(self, path: Path):
+        self.reader = ArchiveReader(path)
+        self.h, self.w = self.reader.shape[:2]
+        self._index = 0
+
+    @property
+    def rect(self):
+        from rectangle import Rectangle
+        return Rectangle(0, 0, self.w, self.h, "ArchiveTable")
+
+    def get_screenshot(self) -> Optional[np.ndarray]:
+        if self._index >= len(self.reader):
+            return None
+        frame = self.reader[self._index]
+        self._index += 1
+        return frame
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack = commands.add_parser('pack', help='pack a directory of png frames, or another '
+                                            'archive, into an archive')
+    pack.add_argument('source', type=Path)
+    pack.add_argument('archive', type=Path)
+    pack.add_argument('--codec', choices=CODECS, default='raw')
+    pack.add_argument('--level', type=int)
+    info = commands.add_parser('info', help='describe an archive and time reading it')
+    info.add_argument('archive', type=Path)
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        import cv2
+        start = time.perf_counter()
+        with ArchiveWriter(args.archive, args.codec, level=args.level) as writer:
+            if args.source.is_dir():
+                for file in sorted(args.source.glob('*.png')):
+                    writer.append(cv2.imread(str(file), cv2.IMREAD_COLOR), file.stat().st_mtime)
+            else:
+                with ArchiveReader(args.source) as reader:
+                    writer.fps = reader.fps
+                    for frame, timestamp in zip(reader, reader.timestamps):
+                        writer.append(frame, timestamp)
+        print(f"Packed {len(writer)} frames in {time.perf_counter() - start:.2f}s, "
+              f"{args.archive.stat().st_size / 2 ** 20:.1f} MB")
+    else:
+        with ArchiveReader(args.archive) as reader:
+            print(f"{len(reader)} frames of {reader.shape}, {reader.codec}, "
+                  f"{args.archive.stat().st_size / 2 ** 20:.1f} MB")
+            start = time.perf_counter()
+            total = sum(frames.sum(dtype=np.uint64) for _, frames in reader.chunks())
+            seconds = time.perf_counter() - start
+            print(f"Sequential read: {len(reader) / seconds:.0f} frames/s")
+            indices = np.random.default_rng(0).integers(len(reader), size=200)
+            start = time.perf_counter()
+            for i in indices:
+                reader[int(i)]
+            print(f"Random access: {(time.perf_counter() - start) / len(indices) * 1e6:.1f} "
+                  f"us/frame")
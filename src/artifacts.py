@@ -0,0 +1,134 @@
+"""
+Cached binary artifacts.
+
+Derived data (parsed tables, rendered templates, precomputed indexes) is built
+once from its source files and stored as raw ``.npy`` arrays, which load far
+faster than re-parsing the sources and can be memory-mapped. An artifact is
+rebuilt whenever one of its sources changes.
+"""
+
+__all__ = [
+    'ARTIFACTS_PATH',
+    'attached',
+    'load',
+    'load_times',
+    'save',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import json
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import numpy as np
+
+PROJECT_PATH = Path(__file__).parent.parent.resolve()
+ARTIFACTS_PATH = PROJECT_PATH / 'temp' / 'artifacts'
+
+# Artifact name -> seconds spent in the last load (or build) of it.
+load_times: Dict[str, float] = {}
+
+# Artifact name -> arrays attached from shared memory (see :mod:`shared`), used instead of
+# the cache files.
+attached: Dict[str, Dict[str, np.ndarray]] = {}
+
+
+def _stamp(sources: List[Path]) -> list:
+    return [[str(src), src.stat().st_mtime_ns, src.stat().st_size] for src in sources]
+
+
+def _is_current(directory: Path, sources: List[Path]) -> bool:
+    try:
+        with open(directory / 'sources.json', 'r') as f:
+            return json.load(f) == _stamp(sources)
+    except (FileNotFoundError, ValueError):
+        return False
+
+
+@contextmanager
+def _locked(name: str):
+    """Hold an artifact's lock file, so processes loading it at once build it only once."""
+    ARTIFACTS_PATH.mkdir(parents=True, exist_ok=True)
+    with open(ARTIFACTS_PATH / f'{name}.lock', 'a+b') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    pass  # LK_LOCK gives up after 10 seconds, a build can take longer
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def save(name: str, arrays: Dict[str, np.ndarray], sources: List[Path] = ()):
+    """Write an artifact, replacing any previous version of it.
+
+    The arrays are written to a staging directory that is then renamed into place, so
+    the artifact's directory never holds a partly written version.
+    """
+    ARTIFACTS_PATH.mkdir(parents=True, exist_ok=True)
+    directory = ARTIFACTS_PATH / name
+    staging = Path(tempfile.mkdtemp(prefix=f'.{name}.', dir=ARTIFACTS_PATH))
+    retired = Path(tempfile.mkdtemp(prefix=f'.{name}.', dir=ARTIFACTS_PATH))
+    try:
+        for key, array in arrays.items():
+            np.save(staging / f'{key}.npy', np.ascontiguousarray(array))
+        with open(staging / 'sources.json', 'w') as f:
+            json.dump(_stamp(list(sources)), f)
+        # A directory can't be renamed over a non-empty one, the old version moves aside first
+        if directory.exists():
+            os.replace(directory, retired / name)
+        os.replace(staging, directory)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(retired, ignore_errors=True)
+
+
+def load(name: str, build: Callable[[], Dict[str, np.ndarray]], sources: List[Path] = (),
+         mmap: bool = False) -> Dict[str, np.ndarray]:
+    """Load an artifact, building and caching it first if it is missing or stale.
+
+    :param name: Artifact name, also its directory under :data:`ARTIFACTS_PATH`
+    :param build: Builds the artifact's arrays from its sources
+    :param sources: Files the artifact is derived from
+    :param mmap: Memory-map the arrays read-only instead of reading them into memory
+    """
+    if name in attached:
+        return attached[name]
+    start = time.perf_counter()
+    sources = list(sources)
+    directory = ARTIFACTS_PATH / name
+    with _locked(name):
+        if not _is_current(directory, sources):
+            save(name, build(), sources)
+        arrays = {
+            file.stem: np.load(file, mmap_mode='r' if mmap else None, allow_pickle=False)
+            for file in directory.glob('*.npy')
+        }
+    load_times[name] = time.perf_counter() - start
+    return arrays
+
+
+if __name__ == '__main__':
+    pass
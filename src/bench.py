@@ -0,0 +1,298 @@
+"""
+Benchmarks.
+
+Each benchmark is a function registered with :func:`benchmark` that returns a
+callable to time and the number of items one call processes::
+
+    python bench.py              # run them all
+    python bench.py outs         # run the ones whose name contains 'outs'
+"""
+
+__all__ = ['benchmark', 'run']
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import sys
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+BENCHMARKS: Dict[str, Callable[[], Tuple[Callable, int]]] = {}
+
+
+def benchmark(func: Callable[[], Tuple[Callable, int]]):
+    """Register a benchmark setup function under its name."""
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+def time_call(func: Callable, min_seconds: float = 0.5) -> float:
+    """Best seconds per call over repeated runs, after one warmup call."""
+    func()
+    best = float('inf')
+    total = 0.0
+    while total < min_seconds:
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        best = min(best, seconds)
+        total += seconds
+    return best
+
+
+def format_seconds(seconds: float) -> str:
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.1f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def on_backend(backend: str, func: Callable) -> Optional[Callable]:
+    """``func`` run on a :mod:`jit` backend, None when the backend isn't available."""
+    import jit
+
+    if backend == 'numba' and not jit.available():
+        return None
+
+    def call():
+        with jit.using(backend):
+            return func()
+    return call
+
+
+def run(pattern: str = ''):
+    for name, setup in BENCHMARKS.items():
+        if pattern not in name:
+            continue
+        func, items = setup()
+        if func is None:
+            print(name.ljust(40, '.') + 'skipped'.rjust(12))
+            continue
+        seconds = time_call(func)
+        print(name.ljust(40, '.') + format_seconds(seconds).rjust(12)
+              + f"{items / seconds:,.0f}/s".rjust(25))
+
+
+@benchmark
+def evaluate_7_cards_1m():
+    from cards import to_mask
+    from evaluator import evaluate
+    from sampling import deal, stream
+
+    masks = to_mask(deal(1_000_000, 7, rng=stream(0)))
+    return on_backend('numpy', lambda: evaluate(masks)), len(masks)
+
+
+@benchmark
+def evaluate_7_cards_1m_numba():
+    from cards import to_mask
+    from evaluator import evaluate
+    from sampling import deal, stream
+
+    masks = to_mask(deal(1_000_000, 7, rng=stream(0)))
+    return on_backend('numba', lambda: evaluate(masks)), len(masks)
+
+
+@benchmark
+def deal_5_cards_1m():
+    from cards import card_mask
+    from sampling import deal, stream
+
+    rng, dead = stream(0), card_mask(['Ah', 'Kh'])
+    return lambda: deal(1_000_000, 5, dead, rng), 5_000_000
+
+
+@benchmark
+def deal_5_cards_1m_dead_per_row():
+    from sampling import deal, stream
+
+    rng = stream(0)
+    dead = np.tile([[12, 25, 38, 51]], (1_000_000, 1))
+    return lambda: deal(1_000_000, 5, dead, rng), 5_000_000
+
+
+@benchmark
+def find_outs_flop():
+    from cards import card_mask
+    from outs import find_outs
+
+    hole, board = card_mask(['Ah', 'Kh']), card_mask(['Qh', '7h', '2c'])
+    return lambda: find_outs(hole, board), 1
+
+
+@benchmark
+def analyze_outs_flop_vs_range():
+    from outs import analyze_outs
+    from ranges import top_range
+
+    villain_range = top_range(0.2)
+    return lambda: analyze_outs(['Ah', 'Kh'], ['Qh', '7h', '2c'], villain_range), 1
+
+
+@benchmark
+def hand_strength_flop_uncached():
+    from cards import card_codes
+    from strength import _compute
+
+    hole = tuple(card_codes(['Ah', 'Kh']).tolist())
+    board = tuple(card_codes(['Qh', '7h', '2c']).tolist())
+    weights = np.ones(1326)
+    return on_backend('numpy', lambda: _compute(hole, board, weights)), 1
+
+
+@benchmark
+def hand_strength_flop_uncached_numba():
+    from cards import card_codes
+    from strength import _compute
+
+    hole = tuple(card_codes(['Ah', 'Kh']).tolist())
+    board = tuple(card_codes(['Qh', '7h', '2c']).tolist())
+    weights = np.ones(1326)
+    return on_backend('numba', lambda: _compute(hole, board, weights)), 1
+
+
+@benchmark
+def hand_strength_flop_cached():
+    from strength import hand_strength
+
+    return lambda: hand_strength(['Ah', 'Kh'], ['Qh', '7h', '2c']), 1
+
+
+def _streets_each(turns, strength):
+    for turn in turns:
+        strength(['Qh', '7h', '2c', turn])
+        strength(['Qh', '7h', '2c', turn, '3d' if turn != '3d' else '4d'])
+
+
+@benchmark
+def hand_strength_turns_and_rivers_uncached():
+    from cards import card_codes
+    from strength import _compute
+
+    hole = tuple(card_codes(['Ah', 'Kh']).tolist())
+    weights = np.ones(1326)
+    turns = ['3d', '8s', 'Jc', 'Kd']
+    return lambda: _streets_each(
+        turns, lambda board: _compute(hole, tuple(card_codes(board).tolist()), weights)), 8
+
+
+@benchmark
+def hand_strength_turns_and_rivers_incremental():
+    from strength import StreetStrength
+
+    hand = StreetStrength(['Ah', 'Kh'], ['Qh', '7h', '2c'])
+    turns = ['3d', '8s', 'Jc', 'Kd']
+
+    def run():
+        hand._results.clear()
+        _streets_each(turns, hand.update)
+    return run, 8
+
+
+@benchmark
+def classify_hole_cards_1m():
+    from holecards import classify
+    from sampling import deal, stream
+
+    hands = deal(1_000_000, 2, 0, stream(0))
+    classify(hands[:1])
+    return lambda: classify(hands), 1_000_000
+
+
+@benchmark
+def parse_hole_card_text_1m():
+    from holecards import _parse_lines
+
+    text = np.frombuffer(b'AhKd\n7c2s\nTs9s\nQdQc\n' * 250_000, dtype=np.uint8)
+    return lambda: _parse_lines(text), 1_000_000
+
+
+@benchmark
+def texture_row_lookup():
+    from textures import texture_index
+
+    index = texture_index()
+    return lambda: index.row(['Qh', '7h', '2c']), 1
+
+
+@benchmark
+def preflop_equity_100k():
+    from equity import preflop_equity
+
+    return lambda: preflop_equity(['Ah', 'Kh'], trials=100_000, seed=0), 100_000
+
+
+@benchmark
+def pushfold_heads_up_chart():
+    from equity import preflop_equity_matrix
+    from pushfold import STACKS, solve
+
+    preflop_equity_matrix()
+    return lambda: solve(2, iterations=500), len(STACKS)
+
+
+def _board_card_crops(n: int) -> np.ndarray:
+    from classifier import _evaluation_crops
+    from layout import BASE_PROFILE
+
+    crops, labels = _evaluation_crops(BASE_PROFILE, 100, 0, seed=0)['board']
+    return crops[[bool(label) for label in labels]][:n]
+
+
+@benchmark
+def match_board_card_templates():
+    from recognition import CardTemplates
+    from layout import BASE_PROFILE
+
+    templates = CardTemplates.at_size(BASE_PROFILE.board_card_size)
+    crop = _board_card_crops(1)[0]
+    return lambda: templates.match(crop), 1
+
+
+@benchmark
+def match_board_card_glyphs():
+    from recognition import GlyphTemplates
+    from layout import BASE_PROFILE
+
+    glyphs = GlyphTemplates.at_size(BASE_PROFILE.board_card_size)
+    crop = _board_card_crops(1)[0]
+    return lambda: glyphs.match(crop), 1
+
+
+@benchmark
+def classify_board_cards_100():
+    from classifier import CardClassifier
+    from layout import BASE_PROFILE
+
+    classifier = CardClassifier.at_size(BASE_PROFILE.board_card_size)
+    crops = _board_card_crops(100)
+    return lambda: classifier.classify(crops), len(crops)
+
+
+def _cfr_river_iteration(backend: str):
+    from cfr import CFRSolver, RiverSpot
+    from ranges import top_range
+
+    solver = CFRSolver(RiverSpot(('Qh', '7h', '2c', '3d', 'Ks'), top_range(0.3), top_range(0.3)))
+
+    def iteration():
+        solver.run(solver.iteration + 1)
+
+    return on_backend(backend, iteration), 1
+
+
+@benchmark
+def cfr_river_iteration():
+    return _cfr_river_iteration('numpy')
+
+
+@benchmark
+def cfr_river_iteration_numba():
+    return _cfr_river_iteration('numba')
+
+
+if __name__ == '__main__':
+    run(sys.argv[1] if len(sys.argv) > 1 else '')
@@ -5,15 +5,19 @@ from enum import Enum
 from pathlib import Path
 from typing import Callable, Type
 
-import cv2
-import imagehash
 import numpy as np
 from loguru import logger
-from PIL import Image
 
+import layout
+from archive import ArchiveWriter
 from conf import YamlConf
 from hand import Hand
 from managers import WindowManager, CaptureManager
+from profiling import Profiler
+from recognition import CardRecognizer
+from recorder import Annotations, DebugRecorder
+from strength import HandStrength, StrengthWorker
+from renderer import StatusRenderer
 from window import WindowCapture, WindowElement
 from events import HandEvents, HandListener, HandState, BoardEvents, BoardListener, BoardState
 
@@ -23,54 +27,37 @@ IMAGES_PATH = SRC_PATH / 'images'
 CARD_IMAGES_PATH = IMAGES_PATH / 'cards'
 
 
-class BotOutput:
-    fps = 0
-    hand_state = HandState.SITTING_OUT
-    hole_cards = []
-    hand = None
-    board_state = BoardState.PREFLOP
-    community_cards = []
-
-    def print(self):
-        UP = "\x1B[8A"
-        CLR = "\x1B[0K"
-        HIDE_CURSOR = '\033[?25l'
-
-        left_width = 20
-        right_width = 57
-
-        print(
-            f"{HIDE_CURSOR}",
-            f"{UP}" + f" Texas Hold'em Bot ".center(left_width + right_width, '-'),
-            f"{CLR}\n",
-            f"FPS".ljust(left_width, '.')
-            + f"{self.fps}".rjust(right_width),
-            f"{CLR}\n",
-            f"Hand state".ljust(left_width, '.')
-            + f"{self.hand_state}".rjust(right_width),
-            f"{CLR}\n",
-            f"Hole cards".ljust(left_width, '.')
-            + f"{self.hole_cards}".rjust(right_width),
-            f"{CLR}\n",
-            f"Hand details".ljust(left_width, '.')
-            + f"{self.hand}".rjust(right_width),
-            f"{CLR}\n",
-            f"Board state".ljust(left_width, '.')
-            + f"{self.board_state}".rjust(right_width),
-            f"{CLR}\n",
-            f"Community cards".ljust(left_width, '.')
-            + f"{self.community_cards}".rjust(right_width),
-            f"{CLR}\n",
-        )
-
-
 class Bot:
     """The Ignition Poker Hold'em bot."""
 
-    def __init__(self):
-        self.window_capture = WindowCapture(YamlConf.window_name)
+    def __init__(self, capture=None, show_status: bool = True, recording: str = None,
+                 archive: str = None):
+        """
+        :param capture: Frame source with a ``get_screenshot()`` method and a ``rect``, defaults
+            to a :class:`WindowCapture` of the configured window
+        :param show_status: Render the terminal status display, off for headless runs
+        :param recording: Annotated debug recording to write (see :mod:`recorder`), defaults to
+            the configured one
+        :param archive: Frame archive to record the session to (see :mod:`archive`), defaults
+            to the configured one
+        """
+        if capture is None:
+            capture = WindowCapture(YamlConf.window_name)
+        if recording is None:
+            recording = YamlConf.debug_recording
+        if archive is None:
+            archive = YamlConf.session_archive
+        self.window_capture = capture
         self.window_manager = WindowManager('PokerBot', self.on_keypress)
-        self.capture_manager = CaptureManager(self.window_capture, self.window_manager)
+        self.recorder = DebugRecorder(
+            Path(recording), YamlConf.debug_recording_fps, YamlConf.debug_recording_queue,
+            YamlConf.debug_recording_drop) if recording else None
+        self.archive = ArchiveWriter(Path(archive), YamlConf.session_archive_codec) \
+            if archive else None
+        self.capture_manager = CaptureManager(self.window_capture, self.window_manager,
+                                              self.recorder, self.archive)
+        self._recorded_states = None
+        self.frame = None
         self.poll_times = defaultdict(dict)
         self.animation_frames = {}
         self.currently_animating = {}
@@ -81,14 +68,12 @@ class Bot:
             'h_cards': [],
             'h_check_pixel': Type[WindowElement],
         }
-        self.card_images = []
-        self.card_names = []
-        self.load_card_images()
-        self.hashed_cards = {}
-        self.hash_card_images()
+        self.profile = layout.select_profile(self.window_capture.w, self.window_capture.h)
+        self.recognizer = CardRecognizer(self.profile, YamlConf.card_recognizer)
         self.c_cards = []
         self.h_cards = []
         self.hand: Hand | None = None
+        self.strength_worker = StrengthWorker()
         self.init_elements()
         self.hand_events = HandEvents()
         self.hand_listener = HandListener(self)
@@ -96,76 +81,53 @@ class Bot:
         self.board_events = BoardEvents()
         self.board_listener = BoardListener(self)
         self.board_events.add(self.board_listener)
-        self.output = BotOutput()
+        self.show_status = show_status
+        self.output = StatusRenderer("Texas Hold'em Bot", {
+            'fps': 'FPS',
+            'hand_state': 'Hand state',
+            'hole_cards': 'Hole cards',
+            'hand': 'Hand details',
+            'strength': 'Hand strength',
+            'board_state': 'Board state',
+            'community_cards': 'Community cards',
+        }, YamlConf.status_refresh_rate)
+
+    @property
+    def strength(self) -> HandStrength | None:
+        """Strength of the hand on the board, None before the flop and while it's computed."""
+        return self.strength_worker.strength
 
     def init_elements(self):
+        rect = self.window_capture.rect
+
         # Hole cards
-        x = 442
-        y = 328
-        self.window_elements['h_cards'].append(
-            WindowElement(self.window_capture.rect, x, y, 35, 42))
-        x = 480
-        self.window_elements['h_cards'].append(
-            WindowElement(self.window_capture.rect, x, y, 35, 42))
+        for x, y, w, h in self.profile.h_cards:
+            self.window_elements['h_cards'].append(WindowElement(rect, x, y, w, h))
 
         # Hand
         x = self.window_elements['h_cards'][0].left
         y = self.window_elements['h_cards'][0].top
         w = self.window_elements['h_cards'][-1].right - x
         h = self.window_elements['h_cards'][-1].bottom - y
-        self.window_elements['hand'] = WindowElement(self.window_capture.rect, x, y, w, h)
+        self.window_elements['hand'] = WindowElement(rect, x, y, w, h)
 
         # Hole check pixel
-        self.window_elements['h_check_pixel'] = WindowElement(
-            self.window_capture.rect, 470, 330, 1, 1)
+        self.window_elements['h_check_pixel'] = WindowElement(rect, *self.profile.h_check_pixel)
 
         # Community cards
-        x = 335
-        y = 211
-        self.window_elements['c_cards'].append(
-            WindowElement(self.window_capture.rect, x, y, 49, 59))
-        x = 395
-        self.window_elements['c_cards'].append(
-            WindowElement(self.window_capture.rect, x, y, 49, 59))
-        x = 455
-        self.window_elements['c_cards'].append(
-            WindowElement(self.window_capture.rect, x, y, 49, 59))
-        x = 514
-        self.window_elements['c_cards'].append(
-            WindowElement(self.window_capture.rect, x, y, 49, 59))
-        x = 574
-        self.window_elements['c_cards'].append(
-            WindowElement(self.window_capture.rect, x, y, 49, 59))
+        for x, y, w, h in self.profile.c_cards:
+            self.window_elements['c_cards'].append(WindowElement(rect, x, y, w, h))
 
         # Board
         x = self.window_elements['c_cards'][0].left
         y = self.window_elements['c_cards'][0].top
         w = self.window_elements['c_cards'][-1].right - x
         h = self.window_elements['c_cards'][-1].bottom - y
-        self.window_elements['board'] = WindowElement(self.window_capture.rect, x, y, w, h)
+        self.window_elements['board'] = WindowElement(rect, x, y, w, h)
 
         # Community check pixels
-        self.window_elements['c_check_pixels'].append(
-            WindowElement(self.window_capture.rect, 496, 220, 1, 1))
-        self.window_elements['c_check_pixels'].append(
-            WindowElement(self.window_capture.rect, 556, 220, 1, 1))
-        self.window_elements['c_check_pixels'].append(
-            WindowElement(self.window_capture.rect, 612, 220, 1, 1))
-
-    def load_card_images(self):
-        files = Path(CARD_IMAGES_PATH).glob('*')
-        for file in files:
-            img = cv2.imread(str(file), cv2.IMREAD_UNCHANGED)
-            name = str(file)[-6:-4]
-            self.card_names.append(name)
-            self.card_images.append(img)
-
-    def hash_card_images(self):
-        files = Path(CARD_IMAGES_PATH).glob('*')
-        for file in files:
-            name = str(file)[-6:-4]
-            hash = imagehash.phash(Image.open(file))
-            self.hashed_cards[hash] = name
+        for x, y, w, h in self.profile.c_check_pixels:
+            self.window_elements['c_check_pixels'].append(WindowElement(rect, x, y, w, h))
 
     def on_keypress(self, keycode):
         """Handle a keypress.
@@ -199,22 +161,59 @@ class Bot:
             self.currently_animating[name] = False
 
     @logger.catch
-    def run(self):
-        """Run the main loop"""
+    def run(self, profiler: Profiler = None):
+        """Run the main loop, until the window is closed or the capture runs out of frames
+
+        :param profiler: Profiles the loop and ends the run when its window is over
+        """
         self.window_manager.create_window()
-        while self.window_manager.is_window_created:
-            self.capture_manager.enter_frame()
-            frame = self.capture_manager.frame
-            if np.any(frame):
-                self.poll(self.poll_animation, frame, 'hand', 1)
-                self.check_hand_events()
-                self.poll(self.poll_animation, frame, 'board', 1)
-                self.check_board_events()
-                self.update_output()
-                # cv2.imshow('test', self.window_elements['board'].region(frame))
-                # cv2.waitKey(-1)
-            self.capture_manager.exit_frame()
-            self.window_manager.process_events()
+        if self.show_status:
+            self.output.start()
+        self.strength_worker.start()
+        if self.recorder is not None:
+            self.recorder.start()
+        if profiler is not None:
+            profiler.start({
+                'capture': self.window_capture.get_screenshot,
+                'poll animation': self.poll,
+                'hand events': self.check_hand_events,
+                'board events': self.check_board_events,
+                # Within the hand and board events
+                'card recognition': self.recognizer.hole.match,
+                'hand strength': self.strength_worker.submit,
+                'status output': self.update_output,
+                'annotations': self.annotations,
+                'exit frame': self.capture_manager.exit_frame,
+            })
+        try:
+            while self.window_manager.is_window_created:
+                self.capture_manager.enter_frame()
+                frame = self.capture_manager.frame
+                self.frame = frame
+                if np.any(frame):
+                    self.poll(self.poll_animation, frame, 'hand', 1)
+                    self.check_hand_events()
+                    self.poll(self.poll_animation, frame, 'board', 1)
+                    self.check_board_events()
+                    self.update_output()
+                    if self.recorder is not None:
+                        self.capture_manager.annotate(self.annotations())
+                    # cv2.imshow('test', self.window_elements['board'].region(frame))
+                    # cv2.waitKey(-1)
+                self.capture_manager.exit_frame()
+                self.window_manager.process_events()
+                if frame is None:
+                    break
+                if profiler is not None and not profiler.frame():
+                    break
+        finally:
+            if profiler is not None:
+                profiler.stop()
+            self.output.stop()
+            if self.recorder is not None:
+                self.recorder.stop()
+            if self.archive is not None:
+                self.archive.close()
 
     def check_board_events(self):
         river_card_px: WindowElement = self.window_elements['c_check_pixels'][2]
@@ -222,11 +221,11 @@ class Bot:
         flop_card_px: WindowElement = self.window_elements['c_check_pixels'][0]
         # Wait for animation to stop
         if not self.currently_animating.get('board', False):
-            if np.mean(river_card_px.screenshot()) == 255:
+            if np.mean(river_card_px.region(self.frame)) == 255:
                 self.board_events.river()
-            elif np.mean(turn_card_px.screenshot()) == 255:
+            elif np.mean(turn_card_px.region(self.frame)) == 255:
                 self.board_events.turn()
-            elif np.mean(flop_card_px.screenshot()) == 255:
+            elif np.mean(flop_card_px.region(self.frame)) == 255:
                 self.board_events.flop()
             else:
                 self.board_events.preflop()
@@ -235,16 +234,49 @@ class Bot:
         hole_card_px: WindowElement = self.window_elements['h_check_pixel']
         # Wait for animation to stop
         if not self.currently_animating.get('hand', False):
-            if np.mean(hole_card_px.screenshot()) == 255:
+            if np.mean(hole_card_px.region(self.frame)) == 255:
                 self.hand_events.playing()
             else:
                 self.hand_events.sitting_out()
 
     def update_output(self):
-        self.output.fps = self.capture_manager.fps_estimate
-        self.output.hand_state = self.hand_events.current_state
-        self.output.hole_cards = self.h_cards
-        self.output.hand = self.hand
-        self.output.board_state = self.board_events.current_state
-        self.output.community_cards = self.c_cards
-        self.output.print()
+        if not self.output.is_running:
+            return
+        self.output.update(
+            fps=self.capture_manager.fps_estimate,
+            hand_state=self.hand_events.current_state,
+            hole_cards=list(self.h_cards),
+            hand=self.hand,
+            strength=self.strength,
+            board_state=self.board_events.current_state,
+            community_cards=list(self.c_cards),
+        )
+
+    def annotations(self) -> Annotations:
+        """Element boxes, recognized cards and state changes of the current frame."""
+        boxes = []
+        for name, cards in (('h_cards', self.h_cards), ('c_cards', self.c_cards)):
+            for i, element in enumerate(self.window_elements[name]):
+                card = cards[i] if i < len(cards) else ''
+                boxes.append((card, (element.left, element.top, element.width, element.height)))
+        for element in [self.window_elements['h_check_pixel'],
+                        *self.window_elements['c_check_pixels']]:
+            boxes.append(('', (element.left - 2, element.top - 2, 5, 5)))
+
+        states = (self.hand_events.current_state, self.board_events.current_state)
+        events = []
+        if self._recorded_states is not None:
+            events = [f"{before.name} -> {after.name}"
+                      for before, after in zip(self._recorded_states, states) if before != after]
+        self._recorded_states = states
+
+        fps = self.capture_manager.fps_estimate
+        lines = [
+            f"FPS {fps:.1f}" if fps else "FPS -",
+            f"Hand {states[0].name} {' '.join(self.h_cards)}",
+            f"Board {states[1].name} {' '.join(self.c_cards)}",
+        ]
+        if self.strength is not None:
+            lines.append(str(self.strength))
+        return Annotations(boxes, lines, events)
+
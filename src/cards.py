@@ -0,0 +1,127 @@
+"""
+Card encoding.
+
+Cards are the strings the recognizer returns (``'As'``, ``'Td'``, ...) or an int
+code ``suit * 13 + rank``, so bit ``code`` of a 52 bit mask is set for every card
+in a hand and each suit holds its own 13 bit rank mask.
+"""
+
+__all__ = [
+    'RANKS',
+    'SUITS',
+    'CARD_BITS',
+    'FULL_DECK',
+    'card_code',
+    'card_codes',
+    'card_name',
+    'card_names',
+    'card_mask',
+    'check_spot',
+    'to_mask',
+    'mask_to_codes',
+    'SUIT_PERMUTATIONS',
+    'permute_suits',
+    'canonical_spot',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from itertools import permutations
+from typing import Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+RANKS = '23456789TJQKA'
+SUITS = 'cdhs'
+
+# Single card masks, indexed by card code.
+CARD_BITS = np.left_shift(np.uint64(1), np.arange(52, dtype=np.uint64))
+FULL_DECK = (1 << 52) - 1
+
+
+def card_code(card: str) -> int:
+    """``'As'`` -> 51"""
+    return SUITS.index(card[-1]) * 13 + RANKS.index(card[0])
+
+
+def card_codes(cards: Iterable[str]) -> np.ndarray:
+    return np.array([card_code(card) for card in cards], dtype=np.int8)
+
+
+def card_name(code: int) -> str:
+    """51 -> ``'As'``"""
+    return RANKS[code % 13] + SUITS[code // 13]
+
+
+def card_names(codes: Iterable[int]) -> List[str]:
+    return [card_name(int(code)) for code in codes]
+
+
+def card_mask(cards: Iterable[str]) -> int:
+    """The 52 bit mask of a list of card strings."""
+    mask = 0
+    for card in cards:
+        mask |= 1 << card_code(card)
+    return mask
+
+
+def check_spot(hole: Sequence[str], board: Sequence[str] = (),
+               board_sizes: Sequence[int] = (0, 3, 4, 5)):
+    """Raise ValueError unless hole and board are two and ``board_sizes`` distinct cards."""
+    if len(hole) != 2:
+        raise ValueError(f"hole cards are two cards, got {len(hole)}")
+    if len(board) not in board_sizes:
+        sizes = ', '.join(map(str, board_sizes[:-1])) + ' or ' * (len(board_sizes) > 1) \
+            + str(board_sizes[-1])
+        raise ValueError(f"board must have {sizes} cards, got {len(board)}")
+    cards = list(hole) + list(board)
+    for card in cards:
+        if not isinstance(card, str) or len(card) != 2 or card[0] not in RANKS \
+                or card[1] not in SUITS:
+            raise ValueError(f"not a card: {card!r}")
+    if len(set(cards)) != len(cards):
+        repeated = sorted({card for card in cards if cards.count(card) > 1})
+        raise ValueError(f"cards dealt twice: {' '.join(repeated)}")
+
+
+def to_mask(codes: np.ndarray) -> np.ndarray:
+    """Masks of an (..., k) array of distinct card codes, reduced over the last axis."""
+    return np.bitwise_or.reduce(CARD_BITS[codes], axis=-1)
+
+
+def mask_to_codes(mask: int) -> np.ndarray:
+    """Codes of the cards set in a single mask, ascending."""
+    return np.flatnonzero((int(mask) >> np.arange(52)) & 1).astype(np.int8)
+
+
+# (24, 4) every relabelling of the suits, row p maps suit s to SUIT_PERMUTATIONS[p, s].
+SUIT_PERMUTATIONS = np.array(list(permutations(range(4))), dtype=np.int8)
+
+
+def permute_suits(codes: np.ndarray, perm: np.ndarray) -> np.ndarray:
+    """Card codes with their suits relabelled by one row of :data:`SUIT_PERMUTATIONS`."""
+    codes = np.asarray(codes)
+    return perm[codes // 13] * 13 + codes % 13
+
+
+def canonical_spot(hole: Iterable[int], board: Iterable[int]) -> Tuple[int, tuple, tuple]:
+    """The suit isomorphic representative of a spot.
+
+    Every spot whose cards differ only by a relabelling of the suits has the same
+    representative, so results computed for it can be shared.
+
+    :return: (row of :data:`SUIT_PERMUTATIONS` used, sorted hole codes, sorted board codes)
+    """
+    hole = np.asarray(list(hole), dtype=np.int16)
+    board = np.asarray(list(board), dtype=np.int16)
+    perm_hole = np.sort(SUIT_PERMUTATIONS[:, hole // 13] * 13 + hole % 13, axis=1)
+    perm_board = np.sort(SUIT_PERMUTATIONS[:, board // 13] * 13 + board % 13, axis=1)
+    keys = np.concatenate((perm_hole, perm_board), axis=1)
+    best = int(np.lexsort(keys.T[::-1])[0])
+    return best, tuple(perm_hole[best].tolist()), tuple(perm_board[best].tolist())
+
+
+if __name__ == '__main__':
+    pass
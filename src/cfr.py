@@ -0,0 +1,386 @@
+"""
+Counterfactual regret minimization for river subgames.
+
+A :class:`RiverSpot` fixes the board, both ranges, the pot and the stacks, and
+its betting tree is built from a few pot fraction bet and raise sizes. Every
+action node holds the regrets of all the acting player's hands at once, so one
+CFR+ iteration is a pass over the (small) betting tree whose updates and
+terminal payoffs are vector and matrix operations over the live combos, or
+linear passes over the combos sorted by value with the Numba backend of :mod:`jit`.
+
+Chance is handled by sampling: :func:`solve_spots` solves many spots, e.g. the
+rivers of a turn from :func:`river_samples`, in a process pool. Solvers save
+their state with :meth:`CFRSolver.save` and resume from it, and the
+exploitability of the average strategy is reported every iteration.
+"""
+
+__all__ = [
+    'RiverSpot',
+    'CFRSolver',
+    'SolveResult',
+    'river_samples',
+    'solve_spots',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from cards import card_mask, card_names
+from evaluator import evaluate
+from jit import kernel
+from ranges import COMBO_MASKS, COMBOS, remove_dead
+from sampling import deal, stream
+from shared import SharedTables
+
+OOP, IP = 0, 1
+
+
+def _matrix_values(order: np.ndarray, values: np.ndarray, cards: np.ndarray,
+                   reach: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    return matrix @ reach
+
+
+@kernel(_matrix_values)
+def _showdown_values(order, values, cards, reach, matrix):
+    """Showdown payoff sums of every hand, in O(n) over hands sorted by value.
+
+    Sums of the reach of strictly weaker (then stronger) hands are kept in total and
+    per card, so the hands sharing a card with the hero can be taken out again.
+    """
+    n = len(order)
+    result = np.zeros(n)
+    for sign, start, stop, step in ((1.0, 0, n, 1), (-1.0, n - 1, -1, -1)):
+        total = 0.0
+        card_totals = np.zeros(52)
+        i = start
+        while i != stop:
+            j = i
+            while j != stop and values[order[j]] == values[order[i]]:
+                hand = order[j]
+                result[hand] += sign * (total - card_totals[cards[hand, 0]]
+                                        - card_totals[cards[hand, 1]])
+                j += step
+            while i != j:
+                hand = order[i]
+                total += reach[hand]
+                card_totals[cards[hand, 0]] += reach[hand]
+                card_totals[cards[hand, 1]] += reach[hand]
+                i += step
+    return result
+
+
+def _fold_matrix_values(cards: np.ndarray, reach: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    return matrix @ reach
+
+
+@kernel(_fold_matrix_values)
+def _fold_values(cards, reach, matrix):
+    """Reach of the hands compatible with every hand, in O(n)."""
+    total = reach.sum()
+    card_totals = np.zeros(52)
+    for hand in range(len(reach)):
+        card_totals[cards[hand, 0]] += reach[hand]
+        card_totals[cards[hand, 1]] += reach[hand]
+    result = np.empty(len(reach))
+    for hand in range(len(reach)):
+        # The hand itself was taken out twice
+        result[hand] = total - card_totals[cards[hand, 0]] - card_totals[cards[hand, 1]] \
+            + reach[hand]
+    return result
+
+
+class RiverSpot(NamedTuple):
+    board: Tuple[str, ...]
+    oop_range: np.ndarray
+    ip_range: np.ndarray
+    pot: float = 1.0
+    stack: float = 1.0
+    bet_sizes: Tuple[float, ...] = (0.5, 1.0)
+    raise_sizes: Tuple[float, ...] = (1.0,)
+    max_bets: int = 3
+
+
+class Node:
+    """A betting tree node, terminal when it has no actions."""
+
+    def __init__(self, history: str, player: int, bets: Tuple[float, float]):
+        self.history = history
+        self.player = player
+        self.bets = bets
+        self.actions: List[str] = []
+        self.children: List['Node'] = []
+        self.folder: Optional[int] = None
+        self.index = -1
+
+    @property
+    def terminal(self) -> bool:
+        return not self.children
+
+
+def build_tree(spot: RiverSpot) -> List[Node]:
+    """Every node of the spot's betting tree, action nodes numbered in ``Node.index``."""
+    nodes = []
+
+    def child(node: Node, action: str, player: int, bets) -> Node:
+        history = f"{node.history}/{action}" if node.history else action
+        new = Node(history, player, bets)
+        node.actions.append(action)
+        node.children.append(new)
+        return new
+
+    def expand(node: Node, n_bets: int, checked: bool):
+        nodes.append(node)
+        player, bets = node.player, node.bets
+        to_call = bets[1 - player] - bets[player]
+        if to_call > 0:
+            fold = child(node, 'fold', -1, bets)
+            fold.folder = player
+            nodes.append(fold)
+            nodes.append(child(node, 'call', -1, (bets[1 - player],) * 2))
+        elif checked:
+            nodes.append(child(node, 'check', -1, bets))
+        else:
+            expand(child(node, 'check', 1 - player, bets), n_bets, True)
+
+        if n_bets < spot.max_bets and bets[1 - player] < spot.stack:
+            pot = spot.pot + sum(bets)
+            sizes = spot.raise_sizes if to_call > 0 else spot.bet_sizes
+            name = 'raise' if to_call > 0 else 'bet'
+            totals = {}
+            for fraction in sizes:
+                total = min(bets[1 - player] + fraction * (pot + to_call), spot.stack)
+                label = 'allin' if total == spot.stack else f"{name} {fraction:.0%}"
+                totals.setdefault(total, label)
+            for total, label in sorted(totals.items()):
+                new_bets = (total, bets[1]) if player == OOP else (bets[0], total)
+                expand(child(node, label, 1 - player, new_bets), n_bets + 1, False)
+
+    expand(Node('', OOP, (0.0, 0.0)), 0, False)
+    for i, node in enumerate(n for n in nodes if not n.terminal):
+        node.index = i
+    return nodes
+
+
+class SolveResult(NamedTuple):
+    board: Tuple[str, ...]
+    hands: np.ndarray
+    strategies: Dict[str, np.ndarray]
+    actions: Dict[str, List[str]]
+    exploitability: np.ndarray
+
+
+class CFRSolver:
+    """CFR+ with alternating updates and linearly weighted strategy averaging."""
+
+    def __init__(self, spot: RiverSpot):
+        self.spot = spot
+        board_mask = card_mask(spot.board)
+        if bin(board_mask).count('1') != 5:
+            raise ValueError(f"a river spot needs 5 distinct board cards, got {spot.board}")
+        live = np.flatnonzero((COMBO_MASKS & np.uint64(board_mask)) == 0)
+        self.hands = live
+        self.reach = [remove_dead(np.asarray(r, dtype=np.float64), board_mask)[live]
+                      for r in (spot.oop_range, spot.ip_range)]
+
+        masks = COMBO_MASKS[live]
+        self.cards = COMBOS[live].astype(np.int64)
+        self.compatible = ((masks[:, None] & masks[None, :]) == 0).astype(np.float64)
+        self.values = evaluate(masks | np.uint64(board_mask)).astype(np.int64)
+        self.order = np.argsort(self.values, kind='stable')
+        self.showdown = np.sign(self.values[:, None] - self.values[None, :]) * self.compatible
+        self.pairs = float(self.reach[OOP] @ self.compatible @ self.reach[IP])
+        if not self.pairs:
+            raise ValueError("the ranges share no compatible combos on this board")
+
+        self.nodes = build_tree(spot)
+        self.action_nodes = [node for node in self.nodes if not node.terminal]
+        shapes = [(len(live), len(node.actions)) for node in self.action_nodes]
+        self.regrets = [np.zeros(shape) for shape in shapes]
+        self.strategy_sums = [np.zeros(shape) for shape in shapes]
+        self.iteration = 0
+        self.exploitability: List[float] = []
+
+    def _utility(self, node: Node, player: int, opp_reach: np.ndarray) -> np.ndarray:
+        stake = self.spot.pot / 2 + node.bets[player if node.folder is None else node.folder]
+        if node.folder is None:
+            return stake * _showdown_values(self.order, self.values, self.cards, opp_reach,
+                                            self.showdown)
+        sign = -1.0 if node.folder == player else 1.0
+        return sign * stake * _fold_values(self.cards, opp_reach, self.compatible)
+
+    def _current(self, node: Node) -> np.ndarray:
+        regrets = self.regrets[node.index]
+        total = regrets.sum(axis=1, keepdims=True)
+        return np.where(total > 0, regrets / np.maximum(total, 1e-300), 1.0 / regrets.shape[1])
+
+    def average_strategy(self, node: Node) -> np.ndarray:
+        sums = self.strategy_sums[node.index]
+        total = sums.sum(axis=1, keepdims=True)
+        return np.where(total > 0, sums / np.maximum(total, 1e-300), 1.0 / sums.shape[1])
+
+    def _traverse(self, node: Node, player: int, reach: np.ndarray,
+                  opp_reach: np.ndarray) -> np.ndarray:
+        if node.terminal:
+            return self._utility(node, player, opp_reach)
+        strategy = self._current(node)
+        if node.player != player:
+            return sum(self._traverse(child, player, reach, opp_reach * strategy[:, a])
+                       for a, child in enumerate(node.children))
+
+        values = np.stack([self._traverse(child, player, reach * strategy[:, a], opp_reach)
+                           for a, child in enumerate(node.children)], axis=1)
+        value = (strategy * values).sum(axis=1)
+        regrets = self.regrets[node.index]
+        regrets += values - value[:, None]
+        np.maximum(regrets, 0, out=regrets)
+        self.strategy_sums[node.index] += self.iteration * reach[:, None] * strategy
+        return value
+
+    def _best_response(self, node: Node, player: int, opp_reach: np.ndarray) -> np.ndarray:
+        if node.terminal:
+            return self._utility(node, player, opp_reach)
+        if node.player == player:
+            return np.max([self._best_response(child, player, opp_reach)
+                           for child in node.children], axis=0)
+        strategy = self.average_strategy(node)
+        return sum(self._best_response(child, player, opp_reach * strategy[:, a])
+                   for a, child in enumerate(node.children))
+
+    def best_response_values(self) -> Tuple[float, float]:
+        """Each player's value per compatible deal when best responding to the other."""
+        root = self.nodes[0]
+        return tuple(
+            float(self.reach[p] @ self._best_response(root, p, self.reach[1 - p])) / self.pairs
+            for p in (OOP, IP))
+
+    def compute_exploitability(self) -> float:
+        """Mean of the best response gains, in chips per deal."""
+        return sum(self.best_response_values()) / 2
+
+    def run(self, iterations: int, checkpoint: Path = None, checkpoint_every: int = 100,
+            callback: Callable[[int, float], None] = None) -> List[float]:
+        """Run until ``iterations`` iterations in total are done, resuming a checkpoint."""
+        if checkpoint is not None and Path(checkpoint).is_file():
+            self.load(checkpoint)
+        root = self.nodes[0]
+        while self.iteration < iterations:
+            self.iteration += 1
+            for player in (OOP, IP):
+                self._traverse(root, player, self.reach[player], self.reach[1 - player])
+            self.exploitability.append(self.compute_exploitability())
+            if callback is not None:
+                callback(self.iteration, self.exploitability[-1])
+            if checkpoint is not None and (self.iteration % checkpoint_every == 0
+                                           or self.iteration == iterations):
+                self.save(checkpoint)
+        return self.exploitability
+
+    def save(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        arrays = {'iteration': np.array(self.iteration),
+                  'exploitability': np.array(self.exploitability)}
+        for node in self.action_nodes:
+            arrays[f'regrets_{node.index}'] = self.regrets[node.index]
+            arrays[f'strategy_sums_{node.index}'] = self.strategy_sums[node.index]
+        # Write then rename, so an interrupted save keeps the previous checkpoint
+        temp = path.with_name(path.name + '.tmp.npz')
+        np.savez(temp, **arrays)
+        temp.replace(path)
+
+    def load(self, path: Path):
+        with np.load(Path(path)) as arrays:
+            for node in self.action_nodes:
+                regrets = arrays[f'regrets_{node.index}']
+                if regrets.shape != self.regrets[node.index].shape:
+                    raise ValueError(f"checkpoint {path} is for a different spot")
+                self.regrets[node.index] = regrets
+                self.strategy_sums[node.index] = arrays[f'strategy_sums_{node.index}']
+            self.iteration = int(arrays['iteration'])
+            self.exploitability = arrays['exploitability'].tolist()
+
+    def result(self) -> SolveResult:
+        return SolveResult(
+            board=tuple(self.spot.board),
+            hands=self.hands,
+            strategies={node.history or 'root': self.average_strategy(node)
+                        for node in self.action_nodes},
+            actions={node.history or 'root': list(node.actions) for node in self.action_nodes},
+            exploitability=np.array(self.exploitability))
+
+    def frequencies(self, history: str = '') -> Dict[str, float]:
+        """Range weighted action frequencies at a node, ``''`` for the root."""
+        node = next(n for n in self.action_nodes if n.history == history)
+        reach = self.reach[node.player].copy()
+        path = self.nodes[0]
+        for action in filter(None, history.split('/')):
+            a = path.actions.index(action)
+            if path.player == node.player:
+                reach *= self.average_strategy(path)[:, a]
+            path = path.children[a]
+        frequencies = reach @ self.average_strategy(node) / max(reach.sum(), 1e-300)
+        return dict(zip(node.actions, frequencies.tolist()))
+
+
+def river_samples(turn: Sequence[str], n: int, seed: int = None) -> List[Tuple[str, ...]]:
+    """Rivers of a turn board, ``n`` of them sampled without replacement."""
+    dead = card_mask(turn)
+    n = min(n, 52 - len(turn))
+    rivers = deal(1, n, dead, stream(seed), ordered=True)[0]
+    return [tuple(turn) + (river,) for river in card_names(rivers)]
+
+
+def _solve(args) -> SolveResult:
+    spot, iterations, checkpoint = args
+    solver = CFRSolver(spot)
+    solver.run(iterations, checkpoint)
+    logger.debug(f"Solved {''.join(spot.board)}, exploitability "
+                 f"{solver.exploitability[-1] / spot.pot:.2%} of the pot")
+    return solver.result()
+
+
+def solve_spots(spots: Sequence[RiverSpot], iterations: int, processes: int = None,
+                checkpoint_dir: Path = None, tables: SharedTables = None) -> List[SolveResult]:
+    """Solve independent spots, such as sampled rivers, in a process pool.
+
+    :param tables: Tables the workers attach instead of loading their own copies
+    """
+    jobs = [(spot, iterations,
+             None if checkpoint_dir is None else Path(checkpoint_dir) / f"{''.join(spot.board)}.npz")
+            for spot in spots]
+    if processes == 1:
+        return [_solve(job) for job in jobs]
+    pool = ProcessPoolExecutor(processes) if tables is None else tables.pool(processes)
+    with pool:
+        return list(pool.map(_solve, jobs))
+
+
+if __name__ == '__main__':
+    import time
+
+    from ranges import top_range
+
+    spot = RiverSpot(('Qh', '7h', '2c', '3d', 'Ks'), top_range(0.3), top_range(0.3))
+    solver = CFRSolver(spot)
+    start = time.perf_counter()
+    solver.run(300, callback=lambda t, e: print(f"{t:>4} exploitability {e / spot.pot:.3%} pot")
+               if t % 50 == 0 else None)
+    print(f"{len(solver.action_nodes)} action nodes, {len(solver.hands)} hands, "
+          f"{(time.perf_counter() - start) / solver.iteration * 1e3:.1f} ms per iteration")
+    print('OOP root', {a: round(f, 3) for a, f in solver.frequencies().items()})
+    print('IP vs check', {a: round(f, 3) for a, f in solver.frequencies('check').items()})
+
+    spots = [spot._replace(board=board)
+             for board in river_samples(['Qh', '7h', '2c', '3d'], 8, seed=0)]
+    start = time.perf_counter()
+    results = solve_spots(spots, 200)
+    print(f"Solved {len(results)} rivers in {time.perf_counter() - start:.1f}s, exploitability "
+          + ', '.join(f"{r.exploitability[-1] / spot.pot:.2%}" for r in results))
@@ -0,0 +1,258 @@
+"""
+Learned card classifier.
+
+A nearest-centroid classifier in a PCA space of pooled crop pixels, trained
+offline per crop size on templates randomly shifted, scaled and re-lit on the
+table felt, plus an empty slot class (``''``). Pooling, PCA, the centroid
+distances and the calibrated temperature are all linear in the pixels, so they
+fold into one ``(pixels, classes)`` matrix: a batch of crops is classified with
+a single matrix multiply, and softmax over the result gives confidences. Models
+are cached artifacts, memory mapped on load.
+
+Run as a script to compare it with the template matchers on shifted synthetic
+crops at every layout scale.
+"""
+
+__all__ = [
+    'CardClassifier',
+    'train',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import artifacts
+from lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+# (width, height) grid crops are area-pooled to before PCA
+FEATURE_SIZE = (16, 20)
+N_COMPONENTS = 100
+# Shrinkage of the within-class covariance towards its average variance
+REGULARIZATION = 0.05
+SAMPLES_PER_CLASS = 150
+CALIBRATION_SAMPLES_PER_CLASS = 30
+
+# Largest augmentation shift, in pixels of a base (35 x 42) hole card
+MAX_SHIFT = 2.5
+
+# Below this confidence a crop is reported as no card.
+MIN_CONFIDENCE = 0.5
+
+_classifiers: Dict[Tuple[int, int], 'CardClassifier'] = {}
+
+
+def _pooling(n_in: int, n_out: int) -> np.ndarray:
+    """(n_out, n_in) area averaging weights, the linear map of ``cv2.INTER_AREA``."""
+    edges = np.linspace(0, n_in, n_out + 1)
+    pixels = np.arange(n_in)
+    overlap = np.clip(np.minimum(edges[1:, None], pixels + 1)
+                      - np.maximum(edges[:-1, None], pixels), 0, None)
+    return (overlap / overlap.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def _features(crops: np.ndarray, pool_y: np.ndarray, pool_x: np.ndarray) -> np.ndarray:
+    n, h, w, c = crops.shape
+    pooled = pool_y @ crops.astype(np.float32).reshape(n, h, w * c)
+    pooled = pooled.reshape(n, -1, w, c).swapaxes(2, 3) @ pool_x.T
+    return pooled.swapaxes(2, 3).reshape(n, -1)
+
+
+def _felt_patches(size: Tuple[int, int]) -> List[np.ndarray]:
+    """Empty card slots of the captured table, resized to ``size``."""
+    from layout import BASE_PROFILE
+    from synthetic import BACKGROUND_PATH, TableSynthesizer
+
+    background = TableSynthesizer.clear_slots(cv2.imread(str(BACKGROUND_PATH), cv2.IMREAD_COLOR))
+    return [cv2.resize(background[y:y + h, x:x + w], size, interpolation=cv2.INTER_AREA)
+            for x, y, w, h in BASE_PROFILE.h_cards + BASE_PROFILE.c_cards]
+
+
+def _augment(card: np.ndarray, felt: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """``card`` (None for an empty slot) shifted, scaled and re-lit over ``felt``."""
+    h, w = felt.shape[:2]
+    image = felt.copy()
+    if card is not None:
+        scale = rng.uniform(0.95, 1.05)
+        dx, dy = rng.uniform(-MAX_SHIFT, MAX_SHIFT, 2) * w / 35
+        matrix = np.array([[scale, 0, (1 - scale) * w / 2 + dx],
+                           [0, scale, (1 - scale) * h / 2 + dy]])
+        cv2.warpAffine(card, matrix, (w, h), dst=image, flags=cv2.INTER_LINEAR,
+                       borderMode=cv2.BORDER_TRANSPARENT)
+    image = image * rng.uniform(0.9, 1.1) + rng.uniform(-12, 12) \
+        + rng.normal(0, rng.uniform(0, 4), image.shape)
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    if rng.random() < 0.5:
+        _, buf = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, int(rng.integers(60, 96))])
+        image = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    return image
+
+
+def _samples(cards: List[np.ndarray], felts: List[np.ndarray], n: int,
+             rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    """``n`` augmented crops of each card and of an empty slot, and their class indices."""
+    crops, labels = [], []
+    for label, card in enumerate(cards + [None]):
+        for _ in range(n):
+            crops.append(_augment(card, felts[rng.integers(len(felts))], rng))
+            labels.append(label)
+    return np.stack(crops), np.array(labels)
+
+
+def _log_softmax(logits: np.ndarray) -> np.ndarray:
+    shifted = logits - logits.max(axis=1, keepdims=True)
+    return shifted - np.log(np.exp(shifted).sum(axis=1, keepdims=True))
+
+
+def train(size: Tuple[int, int], seed: int = 0) -> Dict[str, np.ndarray]:
+    """Build the arrays of a :class:`CardClassifier` artifact for (width, height) crops."""
+    from recognition import load_card_images
+
+    w, h = size
+    rng = np.random.default_rng(seed)
+    images = load_card_images()
+    cards = []
+    for img in images.values():
+        # The client renders card faces losslessly, the jpg templates don't
+        img = img.copy()
+        img[np.all(img >= 245, axis=-1)] = 255
+        cards.append(cv2.resize(img, size, interpolation=cv2.INTER_AREA))
+    felts = _felt_patches(size)
+    pool_y, pool_x = _pooling(h, FEATURE_SIZE[1]), _pooling(w, FEATURE_SIZE[0])
+
+    crops, labels = _samples(cards, felts, SAMPLES_PER_CLASS, rng)
+    features = _features(crops, pool_y, pool_x)
+    mean = features.mean(axis=0)
+    components = np.linalg.svd(features - mean, full_matrices=False)[2][:N_COMPONENTS].T
+    projected = (features - mean) @ components
+    centroids = np.stack([projected[labels == label].mean(axis=0)
+                          for label in range(len(cards) + 1)])
+
+    # Distances are measured in the spread the augmentation causes within a class, so
+    # lighting and shifts count for little and the rank and suit glyphs for a lot
+    within = projected - centroids[labels]
+    covariance = within.T @ within / len(within)
+    covariance += np.eye(len(covariance)) * np.trace(covariance) / len(covariance) * REGULARIZATION
+    precision = np.linalg.inv(covariance)
+
+    # -(z - c)' P (z - c) / 2 up to a per-crop constant, which softmax ignores
+    weights = components @ precision @ centroids.T
+    bias = -np.einsum('ck,kl,cl->c', centroids, precision, centroids) / 2 - mean @ weights
+
+    # Calibrate confidences with the temperature that fits held out crops best
+    crops, labels = _samples(cards, felts, CALIBRATION_SAMPLES_PER_CLASS, rng)
+    logits = _features(crops, pool_y, pool_x) @ weights + bias
+    temperatures = np.geomspace(1e-1, 1e5, 121)
+    nll = [-_log_softmax(logits / t)[np.arange(len(labels)), labels].mean() for t in temperatures]
+    temperature = temperatures[int(np.argmin(nll))]
+
+    # Fold the pooling into the weights, so they apply to raw crop pixels
+    weights = weights.reshape(FEATURE_SIZE[1], FEATURE_SIZE[0], 3, -1)
+    weights = np.tensordot(pool_x, np.tensordot(pool_y, weights, (0, 0)), (0, 1)).swapaxes(0, 1)
+    return {
+        'names': np.array(list(images) + ['']),
+        'weights': (weights.reshape(h * w * 3, -1) / temperature).astype(np.float32),
+        'bias': (bias / temperature).astype(np.float32),
+    }
+
+
+class CardClassifier:
+    """The trained classifier for one (width, height) crop size."""
+
+    def __init__(self, size: Tuple[int, int], names: np.ndarray, weights: np.ndarray,
+                 bias: np.ndarray):
+        self.size = size
+        self.names = names.tolist()
+        self.weights = weights
+        self.bias = bias
+
+    @classmethod
+    def at_size(cls, size: Tuple[int, int]) -> 'CardClassifier':
+        """Shared classifier for a crop size, loaded from the artifact cache on first use."""
+        if size not in _classifiers:
+            from recognition import card_image_files
+            from synthetic import BACKGROUND_PATH
+            arrays = artifacts.load(
+                f'classifier_{size[0]}x{size[1]}', lambda: train(size),
+                card_image_files() + [BACKGROUND_PATH, Path(__file__)], mmap=True)
+            _classifiers[size] = cls(size, **arrays)
+        return _classifiers[size]
+
+    def probabilities(self, crops: np.ndarray) -> np.ndarray:
+        """(n, classes) class probabilities of an (n, height, width, 3) batch of BGR crops."""
+        logits = crops.reshape(len(crops), -1).astype(np.float32) @ self.weights + self.bias
+        return np.exp(_log_softmax(logits))
+
+    def classify(self, crops: np.ndarray) -> Tuple[List[str], np.ndarray]:
+        """Card names (``''`` for none) and confidences of a batch of crops."""
+        probabilities = self.probabilities(crops)
+        best = probabilities.argmax(axis=1)
+        confidence = probabilities[np.arange(len(best)), best]
+        names = [self.names[i] if p >= MIN_CONFIDENCE else ''
+                 for i, p in zip(best, confidence)]
+        return names, confidence
+
+    def match(self, img: np.ndarray) -> str:
+        """Name of the card in ``img``, or an empty string if there is none."""
+        return self.classify(img[None])[0][0]
+
+
+def _evaluation_crops(profile, n_frames: int, max_shift: int,
+                      seed: int) -> Dict[str, Tuple[np.ndarray, List[str]]]:
+    """Hole and board crops of synthetic frames, cut up to ``max_shift`` pixels off the slots."""
+    from synthetic import TableSynthesizer
+
+    scale = profile.table_size[0] / 960
+    synthesizer = TableSynthesizer(noise=2.0, scale=scale, jpeg_quality=90, seed=seed)
+    rng = np.random.default_rng(seed)
+    crops = {'hole': ([], []), 'board': ([], [])}
+    for frame in synthesizer.frames(n_frames, sitting_out_rate=0.2):
+        for kind, rects, cards in (('hole', profile.h_cards, frame.hole_cards),
+                                   ('board', profile.c_cards, frame.community_cards)):
+            for i, (x, y, w, h) in enumerate(rects):
+                dx, dy = rng.integers(-max_shift, max_shift + 1, 2)
+                crops[kind][0].append(frame.image[y + dy:y + dy + h, x + dx:x + dx + w])
+                crops[kind][1].append(cards[i] if i < len(cards) else '')
+    return {kind: (np.stack(images), labels) for kind, (images, labels) in crops.items()}
+
+
+def evaluate(n_frames: int = 100, max_shift: int = 2, seed: int = 1):
+    """Print accuracy and time per crop of the matchers on every layout profile."""
+    import time
+    from layout import PROFILES
+    from recognition import CardTemplates, GlyphTemplates
+
+    print(f"{'profile':<10}{'crops':<7}{'shift':>6}{'matcher':>12}{'accuracy':>10}{'us/crop':>10}")
+    for profile in PROFILES.values():
+        for shift in (0, max_shift):
+            crops = _evaluation_crops(profile, n_frames, shift, seed)
+            for kind, size in (('hole', profile.hole_card_size),
+                               ('board', profile.board_card_size)):
+                images, labels = crops[kind]
+                templates, classifier = CardTemplates.at_size(size), CardClassifier.at_size(size)
+                glyphs = GlyphTemplates.at_size(size)
+                matchers = {
+                    'phash+L1': lambda: [templates.match(img) for img in images],
+                    'L1': lambda: [templates.best_match(img) for img in images],
+                    'glyphs': lambda: [glyphs.match(img) for img in images],
+                    'classifier': lambda: [classifier.match(img) for img in images],
+                    'batch': lambda: classifier.classify(images)[0],
+                }
+                for name, run in matchers.items():
+                    start = time.perf_counter()
+                    predicted = run()
+                    seconds = time.perf_counter() - start
+                    accuracy = np.mean([p == t for p, t in zip(predicted, labels)])
+                    print(f"{profile.name:<10}{kind:<7}{shift:>6}{name:>12}{accuracy:>10.2%}"
+                          f"{seconds / len(images) * 1e6:>10.1f}")
+
+
+if __name__ == '__main__':
+    evaluate()
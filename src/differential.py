@@ -0,0 +1,535 @@
+"""
+Differential testing of the fast paths.
+
+Deals are hero, villain and board cards, ``(n, 9)`` codes, drawn at random or
+from adversarial generators that force wheels, straights, flush ties,
+counterfeited two pair and double full houses. Every :class:`Check` turns a
+batch of deals into cases, runs a fast path on them and compares it with the
+:mod:`reference` evaluator or another slow path:
+
+- ``evaluate[numpy]``, ``evaluate[numba]``: :func:`evaluator.evaluate` on each
+  backend, on the 5, 6 and 7 card hands of both players
+- ``evaluate_cards``: the card string entry point on the same hands
+- ``showdown``: the pot shares :mod:`equity` deals Monte Carlo with
+- ``strength[river]``: exact river equity from :mod:`strength`, against a range
+- ``strength[cache]``: the cached, suit canonical :func:`strength.hand_strength`
+  against computing the spot as given, on flops, turns and rivers
+- ``strength[streets]``: :class:`strength.StreetStrength` carried from the flop to
+  the turn and river, against computing each street from scratch
+- ``equity``: :func:`equity.equity`, exact on the flop and turn and Monte Carlo
+  preflop, against sampling the reference evaluator, within 5 standard errors
+
+Work is split into tasks over a process pool, each dealing from its own
+:func:`sampling.stream`. Mismatches of deterministic checks are shrunk to a
+minimal reproducer by dropping cards and swapping them for lower ones while the
+mismatch persists. Run as a script::
+
+    python differential.py --deals 1000000
+    python differential.py --checks evaluate --generators wheel flush
+"""
+
+__all__ = [
+    'GENERATORS',
+    'CHECKS',
+    'Check',
+    'Failure',
+    'shrink',
+    'run',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import jit
+import reference
+from cards import CARD_BITS, card_names
+from sampling import stream
+
+# Standard errors two estimates may differ by before a statistical check fails
+TOLERANCE = 5.0
+EQUITY_TRIALS = 20_000
+REFERENCE_EQUITY_TRIALS = 1000
+MAX_SHRINK_STEPS = 5000
+
+HERO, VILLAIN, BOARD = slice(0, 2), slice(2, 4), slice(4, 9)
+
+
+# Generators: (n, rng) -> (n, 9) hero, villain and board codes
+
+def _fill(codes: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Codes with every -1 replaced by a distinct card not already in the row."""
+    codes = np.array(codes, dtype=np.int32)
+    keys = rng.random((len(codes), 52))
+    rows, columns = np.nonzero(codes >= 0)
+    keys[rows, codes[rows, columns]] = 2.0
+    live = np.argsort(keys, axis=1)
+    free = codes < 0
+    nth = np.maximum(np.cumsum(free, axis=1) - 1, 0)
+    codes[free] = np.take_along_axis(live, nth, axis=1)[free]
+    return codes
+
+
+def _suited(ranks: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Codes of ranks (-1 left free) in random suits, distinct within a row."""
+    n, k = ranks.shape
+    suits = np.argsort(rng.random((n, 13, 4)), axis=2)
+    earlier = (ranks[:, :, None] == ranks[:, None, :]) & np.tri(k, k, -1, dtype=bool)
+    suit = suits[np.arange(n)[:, None], np.maximum(ranks, 0), earlier.sum(axis=2)]
+    return np.where(ranks >= 0, suit * 13 + ranks, -1)
+
+
+def _shuffle(codes: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    return np.take_along_axis(codes, np.argsort(rng.random(codes.shape), axis=1), axis=1)
+
+
+def _shuffle_board(codes: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    codes = codes.copy()
+    codes[:, BOARD] = _shuffle(codes[:, BOARD], rng)
+    return codes
+
+
+def _distinct_ranks(n: int, k: int, rng: np.random.Generator) -> np.ndarray:
+    return np.argsort(rng.random((n, 13)), axis=1)[:, :k]
+
+
+def random_deals(n: int, rng: np.random.Generator) -> np.ndarray:
+    return _fill(np.full((n, 9), -1), rng)
+
+
+def wheel_deals(n: int, rng: np.random.Generator) -> np.ndarray:
+    """A-2-3-4-5 somewhere in the nine cards, sometimes suited, sometimes with the 6."""
+    ranks = np.full((n, 9), -1)
+    ranks[:, :5] = [12, 0, 1, 2, 3]
+    ranks[rng.random(n) < 0.5, 5] = 4
+    codes = _suited(ranks, rng)
+    steel = rng.random(n) < 0.3
+    codes[steel, :5] = rng.integers(0, 4, (steel.sum(), 1)) * 13 + ranks[steel, :5]
+    return _shuffle(_fill(codes, rng), rng)
+
+
+def straight_deals(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Seven ranks in a row, from ace low to ace high, five of them sometimes suited."""
+    ranks = np.full((n, 9), -1)
+    ranks[:, :7] = (rng.integers(-1, 7, (n, 1)) + np.arange(7)) % 13
+    codes = _suited(ranks, rng)
+    flush = rng.random(n) < 0.3
+    codes[flush, :5] = rng.integers(0, 4, (flush.sum(), 1)) * 13 + ranks[flush, :5]
+    return _shuffle(_fill(codes, rng), rng)
+
+
+def flush_deals(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Four or five board cards of a suit, the players holding that suit or not.
+
+    Both players often play the board's flush and tie, or split on their highest suited card.
+    """
+    ranks = _distinct_ranks(n, 7, rng)
+    suited = rng.integers(0, 4, (n, 1)) * 13 + ranks
+    codes = np.full((n, 9), -1)
+    codes[:, BOARD] = suited[:, :5]
+    codes[rng.random(n) < 0.3, 8] = -1
+    codes[:, 0] = np.where(rng.random(n) < 0.5, suited[:, 5], -1)
+    codes[:, 2] = np.where(rng.random(n) < 0.5, suited[:, 6], -1)
+    return _shuffle_board(_fill(codes, rng), rng)
+
+
+def two_pair_deals(n: int, rng: np.random.Generator) -> np.ndarray:
+    """A double paired board counterfeiting a pocket pair, or the kicker deciding it."""
+    ranks = _distinct_ranks(n, 5, rng)
+    layout = np.full((n, 9), -1)
+    layout[:, :3] = ranks[:, [0, 0, 4]]
+    layout[:, BOARD] = ranks[:, [1, 1, 2, 2, 3]]
+    return _shuffle_board(_fill(_suited(layout, rng), rng), rng)
+
+
+def full_house_deals(n: int, rng: np.random.Generator) -> np.ndarray:
+    """Both players filling up on an (a a b b c) board, with two trips among seven cards."""
+    ranks = _distinct_ranks(n, 3, rng)
+    layout = np.empty((n, 9), dtype=np.int64)
+    layout[:, :4] = ranks[:, [0, 2, 1, 2]]
+    layout[:, BOARD] = ranks[:, [0, 0, 1, 1, 2]]
+    return _shuffle_board(_suited(layout, rng), rng)
+
+
+GENERATORS: Dict[str, Callable[[int, np.random.Generator], np.ndarray]] = {
+    'random': random_deals,
+    'wheel': wheel_deals,
+    'straight': straight_deals,
+    'flush': flush_deals,
+    'two_pair': two_pair_deals,
+    'full_house': full_house_deals,
+}
+
+
+# Cases: deals -> (n, m) codes, -1 for no card
+
+def hands(deals: np.ndarray) -> np.ndarray:
+    """Hero's and villain's hands on the flop, turn and river, padded to seven cards."""
+    cases = np.full((len(deals), 6, 7), -1, dtype=np.int32)
+    for i, (player, street) in enumerate([(p, s) for p in (HERO, VILLAIN) for s in (3, 4, 5)]):
+        cases[:, i, :2] = deals[:, player]
+        cases[:, i, 2:2 + street] = deals[:, 4:4 + street]
+    return cases.reshape(-1, 7)
+
+
+def _streets(deals: np.ndarray, streets: Sequence[int]) -> np.ndarray:
+    """Hero's hole cards and board, the board cut to each of ``streets`` cards in turn."""
+    cases = np.concatenate((deals[:, HERO], deals[:, BOARD]), axis=1).astype(np.int32)
+    street = np.resize(np.asarray(streets), len(cases))
+    cases[np.arange(7) >= 2 + street[:, None]] = -1
+    return cases
+
+
+def spots(deals: np.ndarray) -> np.ndarray:
+    """Hero's spot on the flop, turn or river in turn, padded to seven cards."""
+    return _streets(deals, (3, 4, 5))
+
+
+def rivers(deals: np.ndarray) -> np.ndarray:
+    return _streets(deals, (5,))
+
+
+def equity_spots(deals: np.ndarray) -> np.ndarray:
+    """Hero's spot preflop, on the flop or on the turn in turn."""
+    return _streets(deals, (0, 3, 4))
+
+
+# Fast and slow paths: (n, m) cases -> (n, ...) results
+
+def _cards(case: np.ndarray) -> List[int]:
+    return [int(card) for card in case if card >= 0]
+
+
+def _masks(cases: np.ndarray) -> np.ndarray:
+    bits = np.where(cases >= 0, CARD_BITS[np.maximum(cases, 0)], np.uint64(0))
+    return np.bitwise_or.reduce(bits, axis=1)
+
+
+def _key(case: np.ndarray) -> int:
+    """A seed unique to the cards of a case, so a case replays the same on its own."""
+    return int(sum((int(card) + 1) * 53 ** i for i, card in enumerate(case)))
+
+
+def _case_range(case: np.ndarray) -> np.ndarray:
+    """A villain range that varies with the cards of a case, 10% to every hand."""
+    from ranges import top_range
+    return top_range(0.1 * (1 + sum(_cards(case)) % 10))
+
+
+def evaluate_numpy(cases: np.ndarray) -> np.ndarray:
+    from evaluator import evaluate
+    with jit.using('numpy'):
+        return evaluate(_masks(cases))
+
+
+def evaluate_numba(cases: np.ndarray) -> np.ndarray:
+    from evaluator import evaluate
+    with jit.using('numba'):
+        return evaluate(_masks(cases))
+
+
+def evaluate_card_strings(cases: np.ndarray) -> np.ndarray:
+    from evaluator import evaluate_cards
+    return np.array([evaluate_cards(card_names(_cards(case))) for case in cases])
+
+
+def reference_values(cases: np.ndarray) -> np.ndarray:
+    return np.array([reference.hand_value(_cards(case)) for case in cases])
+
+
+def showdown_shares(cases: np.ndarray) -> np.ndarray:
+    from equity import _showdown
+    return _showdown(cases[:, HERO], cases[:, VILLAIN], cases[:, BOARD])
+
+
+def reference_shares(cases: np.ndarray) -> np.ndarray:
+    return np.array([reference.showdown(case[HERO], case[VILLAIN], case[BOARD])
+                     for case in cases])
+
+
+def river_equity(cases: np.ndarray) -> np.ndarray:
+    from strength import hand_strength
+    return np.array([hand_strength(card_names(case[:2]), card_names(case[2:]),
+                                   _case_range(case)).equity for case in cases])
+
+
+def reference_river_equity(cases: np.ndarray) -> np.ndarray:
+    return np.array([reference.river_strength(case[:2], case[2:], _case_range(case))
+                     for case in cases])
+
+
+def cached_strength(cases: np.ndarray) -> np.ndarray:
+    """Every metric of :func:`strength.hand_strength`, the second call served from the cache."""
+    from strength import hand_strength
+    results = []
+    for case in cases:
+        hole, board = card_names(case[:2]), card_names(_cards(case[2:]))
+        hand_strength(hole, board, _case_range(case))
+        results.append(tuple(hand_strength(hole, board, _case_range(case))))
+    return np.array(results)
+
+
+def uncached_strength(cases: np.ndarray) -> np.ndarray:
+    from strength import _compute
+    return np.array([tuple(_compute(tuple(_cards(case[:2])), tuple(_cards(case[2:])),
+                                    _case_range(case))) for case in cases])
+
+
+def street_strength(cases: np.ndarray) -> np.ndarray:
+    """Flop, turn and river metrics of :class:`strength.StreetStrength`, one row per case."""
+    from strength import StreetStrength
+    results = []
+    for case in cases:
+        hole, board = card_names(case[:2]), card_names(case[2:])
+        hand = StreetStrength(hole, board[:3], _case_range(case))
+        results.append([tuple(hand.update(board[:street])) for street in (3, 4, 5)])
+    return np.array(results)
+
+
+def street_by_street(cases: np.ndarray) -> np.ndarray:
+    from strength import _compute
+    return np.array([[tuple(_compute(tuple(_cards(case[:2])), tuple(_cards(case[2:street])),
+                                     _case_range(case))) for street in (5, 6, 7)]
+                     for case in cases])
+
+
+def public_equity(cases: np.ndarray) -> np.ndarray:
+    """:func:`equity.equity` and how many trials it was estimated from, 0 when exact."""
+    from equity import equity
+    results = []
+    for case in cases:
+        board = _cards(case[2:])
+        results.append((equity(card_names(case[:2]), card_names(board), trials=EQUITY_TRIALS,
+                               seed=_key(case)), 0 if board else EQUITY_TRIALS))
+    return np.array(results)
+
+
+def reference_equity(cases: np.ndarray) -> np.ndarray:
+    return np.array([reference.sampled_equity(case[:2], _cards(case[2:]),
+                                              REFERENCE_EQUITY_TRIALS, stream(_key(case)))[0]
+                     for case in cases])
+
+
+def _equal(fast: np.ndarray, slow: np.ndarray) -> np.ndarray:
+    return fast == slow
+
+
+def _close(fast: np.ndarray, slow: np.ndarray) -> np.ndarray:
+    return np.isclose(fast, slow, rtol=0, atol=1e-9).reshape(len(fast), -1).all(axis=1)
+
+
+def _within_error(fast: np.ndarray, slow: np.ndarray) -> np.ndarray:
+    """Whether estimates differ by no more than their sampling error allows.
+
+    The error is taken at the fast path's equity, a share's variance being at most p (1 - p),
+    plus a few trials' worth so that equities near 0 or 1 don't fail on a single upset.
+    """
+    p, trials = fast[:, 0], fast[:, 1]
+    variance = p * (1 - p) * (1 / REFERENCE_EQUITY_TRIALS
+                              + np.where(trials > 0, 1 / np.maximum(trials, 1), 0))
+    return np.abs(p - slow) <= TOLERANCE * np.sqrt(variance) + 3 / REFERENCE_EQUITY_TRIALS
+
+
+class Check(NamedTuple):
+    """A fast path compared with a slow one on the cases of a batch of deals.
+
+    :param cases: Cases of each deal, (n, 9) deals to (n * k, m) codes padded with -1
+    :param fast: Results of a batch of cases
+    :param reference: Results to compare with, computed the slow way
+    :param agree: Whether each pair of results agrees, exact equality by default
+    :param every: The check runs on one in ``every`` deals, for slow references
+    :param fewest: Cards a shrunk case may be cut down to, dropping none at the number of
+        cards of a case; None if mismatches aren't shrunk, e.g. for statistical checks
+    """
+    cases: Callable[[np.ndarray], np.ndarray]
+    fast: Callable[[np.ndarray], np.ndarray]
+    reference: Callable[[np.ndarray], np.ndarray]
+    agree: Callable[[np.ndarray, np.ndarray], np.ndarray] = _equal
+    every: int = 1
+    fewest: Optional[int] = 7
+
+
+CHECKS: Dict[str, Check] = {
+    'evaluate[numpy]': Check(hands, evaluate_numpy, reference_values, fewest=5),
+    'evaluate[numba]': Check(hands, evaluate_numba, reference_values, fewest=5),
+    'evaluate_cards': Check(hands, evaluate_card_strings, reference_values, fewest=5),
+    'showdown': Check(lambda deals: deals, showdown_shares, reference_shares, every=4, fewest=9),
+    'strength[river]': Check(rivers, river_equity, reference_river_equity, _close, every=2000),
+    'strength[cache]': Check(spots, cached_strength, uncached_strength, _close, every=500),
+    'strength[streets]': Check(rivers, street_strength, street_by_street, _close, every=1000),
+    'equity': Check(equity_spots, public_equity, reference_equity, _within_error, every=5000,
+                    fewest=None),
+}
+
+
+def available_checks() -> List[str]:
+    return [name for name in CHECKS if name != 'evaluate[numba]' or jit.available()]
+
+
+def shrink(case: np.ndarray, fails: Callable[[np.ndarray], bool], fewest: int,
+           max_steps: int = MAX_SHRINK_STEPS) -> np.ndarray:
+    """A minimal variant of a failing case.
+
+    Greedily drops cards (down to ``fewest``) and swaps cards for lower unused codes
+    while the case still fails, until no single drop or swap keeps it failing.
+    """
+    case = np.array(case)
+    steps = 0
+    progress = True
+    while progress and steps < max_steps:
+        progress = False
+        for i in np.flatnonzero(case >= 0):
+            candidates = [-1] if (case >= 0).sum() > fewest else []
+            candidates += [code for code in range(case[i]) if code not in case]
+            for code in candidates:
+                trial = case.copy()
+                trial[i] = code
+                steps += 1
+                if fails(trial):
+                    case, progress = trial, True
+                    break
+                if steps >= max_steps:
+                    return case
+    return case
+
+
+class Failure(NamedTuple):
+    check: str
+    generator: str
+    deal: List[str]
+    case: List[str]
+    shrunk: List[str]
+    fast: list
+    reference: list
+
+    def __str__(self):
+        return f"{self.check} on {self.generator} deal {' '.join(self.deal)}\n" \
+               f"    case   {' '.join(self.case)}\n" \
+               f"    shrunk {' '.join(self.shrunk)}: fast {self.fast}, reference {self.reference}"
+
+
+# Per check: cases, mismatches, seconds in the fast path, seconds in the reference
+Stats = Dict[str, np.ndarray]
+
+
+def _task(args) -> Tuple[Stats, List[Failure]]:
+    seed, task, n_deals, generators, checks, max_failures = args
+    rng = stream(seed, task)
+    per_generator = max(1, n_deals // len(generators))
+    deals = np.concatenate([GENERATORS[name](per_generator, rng) for name in generators])
+    sources = np.repeat(generators, per_generator)
+
+    stats: Stats = {}
+    failures: List[Failure] = []
+    picked: Dict[int, np.ndarray] = {}
+    references: Dict[tuple, Tuple[np.ndarray, float]] = {}
+    for name in checks:
+        check = CHECKS[name]
+        if check.every not in picked:
+            picked[check.every] = np.arange(len(deals)) if check.every == 1 \
+                else np.flatnonzero(rng.random(len(deals)) < 1 / check.every)
+        rows = picked[check.every]
+        if not len(rows):
+            stats[name] = np.zeros(4)
+            continue
+        cases = check.cases(deals[rows])
+
+        start = time.perf_counter()
+        fast = check.fast(cases)
+        fast_seconds = time.perf_counter() - start
+        # Checks of the same cases against the same reference share its results
+        key = (check.cases, check.every, check.reference)
+        if key in references:
+            slow, slow_seconds = references[key][0], 0.0
+        else:
+            start = time.perf_counter()
+            slow = check.reference(cases)
+            slow_seconds = time.perf_counter() - start
+            references[key] = slow, slow_seconds
+        agree = check.agree(fast, slow)
+        stats[name] = np.array([len(cases), (~agree).sum(), fast_seconds, slow_seconds])
+
+        per_deal = len(cases) // max(len(rows), 1)
+        for i in np.flatnonzero(~agree)[:max_failures]:
+            def fails(case: np.ndarray) -> bool:
+                return not check.agree(check.fast(case[None]), check.reference(case[None]))[0]
+            shrunk = cases[i] if check.fewest is None else shrink(cases[i], fails, check.fewest)
+            deal = rows[i // per_deal]
+            failures.append(Failure(
+                name, str(sources[deal]), card_names(deals[deal]), card_names(_cards(cases[i])),
+                card_names(_cards(shrunk)), check.fast(shrunk[None])[0].tolist(),
+                check.reference(shrunk[None])[0].tolist()))
+    return stats, failures
+
+
+def run(deals: int, checks: Sequence[str] = None, generators: Sequence[str] = None,
+        seed: int = 0, processes: int = None, task_size: int = 10_000,
+        max_failures: int = 3) -> Tuple[Stats, List[Failure], float]:
+    """Run checks on ``deals`` deals, split evenly over the generators.
+
+    :param checks: Names in :data:`CHECKS`, every available one if None
+    :param generators: Names in :data:`GENERATORS`, all of them if None
+    :param processes: Pool size, or 1 to run in this process
+    :param task_size: Deals per task
+    :param max_failures: Mismatches shrunk and reported per check and task
+    :return: (stats per check, failures, wall seconds)
+    """
+    checks = available_checks() if checks is None else list(checks)
+    generators = list(GENERATORS) if generators is None else list(generators)
+    tasks = [(seed, task, min(task_size, deals - start), generators, checks, max_failures)
+             for task, start in enumerate(range(0, deals, task_size))]
+    start = time.perf_counter()
+    if processes == 1:
+        results = [_task(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(processes) as pool:
+            results = list(pool.map(_task, tasks))
+    seconds = time.perf_counter() - start
+
+    stats: Stats = {name: np.zeros(4) for name in checks}
+    failures: List[Failure] = []
+    for task_stats, task_failures in results:
+        for name, values in task_stats.items():
+            stats[name] += values
+        failures += task_failures
+    return stats, failures, seconds
+
+
+def report(stats: Stats, failures: List[Failure], seconds: float) -> str:
+    lines = [f"{'check':<20}{'cases':>12}{'failed':>8}{'fast/s':>14}{'reference/s':>14}"]
+    for name, (cases, failed, fast_seconds, slow_seconds) in stats.items():
+        fast_rate = f"{cases / fast_seconds:,.0f}" if fast_seconds else '-'
+        slow_rate = f"{cases / slow_seconds:,.0f}" if slow_seconds else 'shared'
+        lines.append(f"{name:<20}{cases:>12,.0f}{failed:>8,.0f}{fast_rate:>14}{slow_rate:>14}")
+    total = sum(values[0] for values in stats.values())
+    lines.append(f"Compared {total:,.0f} cases in {seconds:.1f}s, {total / seconds:,.0f} cases/s")
+    lines += [str(failure) for failure in failures]
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--deals', type=int, default=100_000)
+    parser.add_argument('--checks', nargs='+', metavar='NAME',
+                        help='checks whose name starts with NAME, default every available one')
+    parser.add_argument('--generators', nargs='+', choices=list(GENERATORS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int)
+    parser.add_argument('--task-size', type=int, default=10_000)
+    parser.add_argument('--max-failures', type=int, default=3)
+    args = parser.parse_args()
+
+    checks = None if args.checks is None else \
+        [name for name in available_checks() if any(name.startswith(prefix)
+                                                     for prefix in args.checks)]
+    stats, failures, seconds = run(args.deals, checks, args.generators, args.seed,
+                                   args.processes, args.task_size, args.max_failures)
+    print(report(stats, failures, seconds))
+    raise SystemExit(1 if failures else 0)
@@ -0,0 +1,306 @@
+"""
+Showdown equity.
+
+Postflop equity against a range is enumerated exactly through :mod:`strength`.
+Preflop it is estimated by Monte Carlo over batches of deals from :mod:`sampling`,
+and the equity of every preflop class against every other is generated once into
+a 169 x 169 matrix in the artifact cache, along with how many non-conflicting
+combo pairs each class pair has.
+
+:func:`anytime_equity` samples any street in growing batches instead of a fixed
+number of trials, stopping at a target standard error, a deadline, or as soon
+as the equity is clearly on one side of a threshold such as the pot odds, so
+easy spots cost a few batches and close ones get the trials they need.
+"""
+
+__all__ = [
+    'equity',
+    'preflop_equity',
+    'preflop_equities',
+    'Estimate',
+    'anytime_equity',
+    'PreflopEquity',
+    'preflop_equity_matrix',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import time
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+import artifacts
+from cards import card_codes, check_spot, to_mask
+from evaluator import evaluate
+from hand import HAND_RANKS_CSV
+from ranges import COMBO_CLASSES, COMBO_MASKS, COMBOS, remove_dead
+from sampling import deal, stream
+from strength import hand_strength
+
+N_CLASSES = 169
+BATCH_SIZE = 1 << 20
+
+# Anytime estimates: the first batch, trials before an early stop is trusted, and
+# standard errors between the estimate and a threshold for the spot to count as decided
+FIRST_BATCH = 2048
+MIN_TRIALS = 4096
+DECIDED_Z = 4.0
+
+
+def _showdown(hero: np.ndarray, villain: np.ndarray, board: np.ndarray) -> np.ndarray:
+    """Hero's share of the pot (1, 0.5 or 0) for rows of hole and board codes."""
+    board_masks = to_mask(board)
+    hero_values = evaluate(to_mask(hero) | board_masks)
+    villain_values = evaluate(to_mask(villain) | board_masks)
+    return (hero_values > villain_values) + (hero_values == villain_values) * 0.5
+
+
+def _live_weights(hero: np.ndarray, board: np.ndarray, villain_range: np.ndarray) -> np.ndarray:
+    """Villain combo probabilities, combos holding a known card removed."""
+    weights = np.ones(len(COMBOS)) if villain_range is None else np.asarray(villain_range)
+    weights = remove_dead(weights, int(to_mask(np.concatenate((hero, board)))))
+    if not weights.sum():
+        raise ValueError("villain range holds no live combos")
+    return weights / weights.sum()
+
+
+def _deal(hero: np.ndarray, board: np.ndarray, p: np.ndarray, n: int,
+          rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(hero, villain, board) codes of ``n`` deals of a villain combo and the rest of the board."""
+    villain = COMBOS[rng.choice(len(COMBOS), n, p=p)].astype(np.int64)
+    heroes = np.broadcast_to(hero, (n, 2))
+    boards = np.broadcast_to(board, (n, len(board)))
+    runout = deal(n, 5 - len(board), np.concatenate((heroes, villain, boards), axis=1), rng)
+    return heroes, villain, np.concatenate((boards, runout), axis=1)
+
+
+def _sample_shares(hero: np.ndarray, board: np.ndarray, p: np.ndarray, n: int,
+                   rng: np.random.Generator) -> np.ndarray:
+    """Hero's pot shares in ``n`` deals of a villain combo and the rest of the board."""
+    return _showdown(*_deal(hero, board, p, n, rng))
+
+
+def preflop_equity(hole: List[str], villain_range: np.ndarray = None,
+                   trials: int = 200_000, seed: int = None) -> float:
+    """Monte Carlo equity of hole cards against a range before the flop."""
+    check_spot(hole)
+    hero = card_codes(hole).astype(np.int64)
+    board = np.empty(0, dtype=np.int64)
+    p = _live_weights(hero, board, villain_range)
+    rng = stream(seed)
+    shares = 0.0
+    for start in range(0, trials, BATCH_SIZE):
+        shares += _sample_shares(hero, board, p, min(BATCH_SIZE, trials - start), rng).sum()
+    return float(shares / trials)
+
+
+def preflop_equities(spots: Sequence[Tuple[List[str], Optional[np.ndarray], int]],
+                     seed: int = None) -> np.ndarray:
+    """:func:`preflop_equity` of many ``(hole, villain_range, trials)`` spots at once.
+
+    Each spot deals from its own stream in the order :func:`preflop_equity` does, so
+    its equity is the same as when computed alone; the showdowns of every spot are
+    evaluated together, up to :data:`BATCH_SIZE` deals at a time.
+    """
+    shares = np.zeros(len(spots))
+    pending = []
+
+    def evaluate_pending():
+        spot = np.concatenate([np.full(len(deals[0]), i) for i, deals in pending])
+        hero, villain, board = (np.concatenate(parts) for parts in
+                                zip(*(deals for _, deals in pending)))
+        shares[:] += np.bincount(spot, _showdown(hero, villain, board), minlength=len(spots))
+        pending.clear()
+
+    for i, (hole, villain_range, trials) in enumerate(spots):
+        check_spot(hole)
+        hero = card_codes(hole).astype(np.int64)
+        board = np.empty(0, dtype=np.int64)
+        p = _live_weights(hero, board, villain_range)
+        rng = stream(seed)
+        for start in range(0, trials, BATCH_SIZE):
+            pending.append((i, _deal(hero, board, p, min(BATCH_SIZE, trials - start), rng)))
+            if sum(len(deals[0]) for _, deals in pending) >= BATCH_SIZE:
+                evaluate_pending()
+    if pending:
+        evaluate_pending()
+    return shares / np.array([trials for _, _, trials in spots])
+
+
+def equity(hole: List[str], board: List[str] = (), villain_range: np.ndarray = None,
+           trials: int = 200_000, seed: int = None) -> float:
+    """Showdown equity of hole cards against a range, ties counting half.
+
+    Exact on the flop, turn and river, Monte Carlo over ``trials`` deals preflop.
+    """
+    if len(board) == 0:
+        return preflop_equity(hole, villain_range, trials, seed)
+    return hand_strength(hole, board, villain_range).equity
+
+
+class Estimate(NamedTuple):
+    """An equity estimate and how it was reached.
+
+    ``stopped`` is empty while refining, then says why sampling ended: ``'target'``
+    (standard error reached), ``'decided'`` (clear of the threshold), ``'deadline'``
+    or ``'max_trials'``.
+    """
+    equity: float
+    stderr: float
+    trials: int
+    seconds: float
+    stopped: str = ''
+
+
+def anytime_equity(hole: List[str], board: Sequence[str] = (), villain_range: np.ndarray = None,
+                   target_error: float = 0.002, deadline: float = None, threshold: float = None,
+                   callback: Callable[[Estimate], None] = None, max_trials: int = 50_000_000,
+                   seed: int = None) -> Estimate:
+    """Monte Carlo equity on any street, refined in batches until it is good enough.
+
+    Batches double in size up to :data:`BATCH_SIZE`, and are cut short to what the
+    measured rate can deal before the deadline.
+
+    :param target_error: Stop once the standard error is this small
+    :param deadline: Seconds to spend at most
+    :param threshold: Stop once the equity is :data:`DECIDED_Z` standard errors above or below
+        it, e.g. the pot odds of a call
+    :param callback: Called with the running estimate after every batch
+    :param max_trials: Stop after this many deals regardless
+    """
+    start = time.perf_counter()
+    check_spot(hole, board)
+    hero = card_codes(hole).astype(np.int64)
+    board = card_codes(board).astype(np.int64)
+    p = _live_weights(hero, board, villain_range)
+    rng = stream(seed)
+
+    trials, total, total_squares = 0, 0.0, 0.0
+    batch = FIRST_BATCH
+    while True:
+        batch_start = time.perf_counter()
+        shares = _sample_shares(hero, board, p, batch, rng)
+        now = time.perf_counter()
+        trials += batch
+        total += shares.sum()
+        total_squares += (shares * shares).sum()
+        mean = total / trials
+        stderr = float(np.sqrt(max(total_squares / trials - mean * mean, 0.0) / trials))
+        estimate = Estimate(float(mean), stderr, trials, now - start)
+
+        if trials >= MIN_TRIALS and stderr <= target_error:
+            estimate = estimate._replace(stopped='target')
+        elif trials >= MIN_TRIALS and threshold is not None \
+                and abs(mean - threshold) >= DECIDED_Z * stderr:
+            estimate = estimate._replace(stopped='decided')
+        elif deadline is not None and now - start >= deadline:
+            estimate = estimate._replace(stopped='deadline')
+        elif trials >= max_trials:
+            estimate = estimate._replace(stopped='max_trials')
+        if callback is not None:
+            callback(estimate)
+        if estimate.stopped:
+            return estimate
+
+        # Deals per second of the batch just sampled, whatever size the next one is
+        rate = batch / max(now - batch_start, 1e-9)
+        batch = min(2 * batch, BATCH_SIZE, max_trials - trials)
+        if deadline is not None:
+            batch = max(1, min(batch, int(rate * (deadline - (now - start)))))
+
+
+def _class_combos() -> np.ndarray:
+    """(169, 12) combos of each class, repeated to fill the row."""
+    table = np.empty((N_CLASSES, 12), dtype=np.int64)
+    for row in range(N_CLASSES):
+        combos = np.flatnonzero(COMBO_CLASSES == row)
+        table[row] = np.resize(combos, 12)
+    return table
+
+
+def _combo_counts() -> np.ndarray:
+    """(169, 169) non-conflicting (hero combo, villain combo) pairs of each class pair."""
+    disjoint = ((COMBO_MASKS[:, None] & COMBO_MASKS[None, :]) == 0).astype(np.float64)
+    classes = np.zeros((len(COMBOS), N_CLASSES))
+    classes[np.arange(len(COMBOS)), COMBO_CLASSES] = 1.0
+    return (classes.T @ disjoint @ classes).astype(np.int32)
+
+
+def build_preflop_equity(trials: int = 4000, seed: int = 0):
+    """Estimate the equity of every class against every other.
+
+    Only the pairs above the diagonal are dealt, the rest follow from
+    ``equity[j, i] = 1 - equity[i, j]`` and a class against itself splitting evenly.
+    Every combo of a class meets the same number of live combos of another, so
+    dealing a uniform hero combo and then a uniform live villain combo is uniform
+    over the combo pairs.
+    """
+    rng = stream(seed)
+    class_combos = _class_combos()
+    combo_codes = COMBOS.astype(np.int64)
+    rows, columns = np.triu_indices(N_CLASSES, 1)
+    pairs = np.repeat(np.arange(len(rows)), trials)
+    shares = np.zeros(len(rows))
+    dealt = np.zeros(len(rows))
+    for start in range(0, len(pairs), BATCH_SIZE):
+        pair = pairs[start:start + BATCH_SIZE]
+        hero = class_combos[rows[pair], rng.integers(0, 12, len(pair))]
+        villain = class_combos[columns[pair], rng.integers(0, 12, len(pair))]
+        conflict = (COMBO_MASKS[hero] & COMBO_MASKS[villain]) != 0
+        while conflict.any():
+            redraw = np.flatnonzero(conflict)
+            villain[redraw] = class_combos[columns[pair[redraw]],
+                                           rng.integers(0, 12, len(redraw))]
+            conflict[redraw] = (COMBO_MASKS[hero[redraw]] & COMBO_MASKS[villain[redraw]]) != 0
+        hero, villain = combo_codes[hero], combo_codes[villain]
+        board = deal(len(pair), 5, np.concatenate((hero, villain), axis=1), rng)
+        shares += np.bincount(pair, _showdown(hero, villain, board), minlength=len(rows))
+        dealt += np.bincount(pair, minlength=len(rows))
+
+    matrix = np.full((N_CLASSES, N_CLASSES), 0.5)
+    matrix[rows, columns] = shares / dealt
+    matrix[columns, rows] = 1 - shares / dealt
+    return {'equity': matrix.astype(np.float32), 'counts': _combo_counts()}
+
+
+class PreflopEquity(NamedTuple):
+    """Class against class equity, rows and columns in ``hand_ranks()`` order."""
+    equity: np.ndarray
+    counts: np.ndarray
+
+
+_matrix: PreflopEquity = None
+
+
+def preflop_equity_matrix() -> PreflopEquity:
+    """The shared 169 x 169 preflop equity matrix from the artifact cache."""
+    global _matrix
+    if _matrix is None:
+        arrays = artifacts.load('preflop_equity', build_preflop_equity,
+                                [Path(__file__).resolve(), HAND_RANKS_CSV])
+        _matrix = PreflopEquity(arrays['equity'], arrays['counts'])
+    return _matrix
+
+
+if __name__ == '__main__':
+    from hand import hand_index
+    from ranges import top_range
+
+    print(f"AhKh vs any two: {equity(['Ah', 'Kh']):.3f}")
+    print(f"AhKh vs top 10%: {equity(['Ah', 'Kh'], villain_range=top_range(0.1)):.3f}")
+    print(f"AhKh on Qh7h2c: {equity(['Ah', 'Kh'], ['Qh', '7h', '2c']):.3f}")
+    for hole, board, threshold in ((['Ah', 'Ad'], [], None), (['7c', '6c'], ['Ac', 'Kh', '2c'], None),
+                                   (['7c', '6c'], ['Ac', 'Kh', '2c'], 0.25),
+                                   (['Qs', 'Qd'], ['Ks', '9h', '4d'], 0.33)):
+        estimate = anytime_equity(hole, board, threshold=threshold, deadline=2.0, seed=0)
+        print(f"{''.join(hole)} on {''.join(board) or 'preflop'} vs {threshold}: "
+              f"{estimate.equity:.3f} +- {estimate.stderr:.4f} after {estimate.trials:,} trials in "
+              f"{estimate.seconds * 1e3:.0f} ms, {estimate.stopped}")
+    matrix = preflop_equity_matrix()
+    for hero, villain in (('AA', 'KK'), ('AKo', 'QQ'), ('72o', 'AKs')):
+        print(f"{hero} vs {villain}: "
+              f"{matrix.equity[hand_index(hero), hand_index(villain)]:.3f}")
@@ -0,0 +1,215 @@
+"""
+Vectorized poker hand evaluator.
+
+Evaluates arrays of 5 to 7 card hands given as 52 bit card masks (see :mod:`cards`)
+with bitwise operations and 8192 entry rank-mask tables, so a batch of hands costs a
+fixed number of array operations regardless of its size. With the Numba backend
+of :mod:`jit` the same steps run as a compiled loop per hand instead. A hand's
+value is ``category << 20 | tiebreak``; a higher value is a better hand.
+"""
+
+__all__ = [
+    'HIGH_CARD',
+    'PAIR',
+    'TWO_PAIR',
+    'TRIPS',
+    'STRAIGHT',
+    'FLUSH',
+    'FULL_HOUSE',
+    'QUADS',
+    'STRAIGHT_FLUSH',
+    'CATEGORY_NAMES',
+    'evaluate',
+    'evaluate_cards',
+    'category',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from typing import Iterable
+
+import numpy as np
+
+from cards import card_mask
+from jit import kernel
+
+HIGH_CARD = 0
+PAIR = 1
+TWO_PAIR = 2
+TRIPS = 3
+STRAIGHT = 4
+FLUSH = 5
+FULL_HOUSE = 6
+QUADS = 7
+STRAIGHT_FLUSH = 8
+
+CATEGORY_NAMES = [
+    'High card', 'Pair', 'Two pair', 'Three of a kind', 'Straight', 'Flush', 'Full house',
+    'Four of a kind', 'Straight flush',
+]
+
+RANK_MASK = 0x1FFF
+WHEEL = 0b1000000001111
+
+
+def _build_tables():
+    masks = np.arange(1 << 13)
+    bits = (masks[:, None] >> np.arange(13)) & 1
+    popcount = bits.sum(axis=1).astype(np.int8)
+    high_bit = (12 - np.argmax(bits[:, ::-1], axis=1)).astype(np.int32)
+    high_bit[0] = 0
+
+    # Top n ranks packed into nibbles, highest rank in the most significant one
+    top = {}
+    packed = np.zeros_like(masks)
+    remaining = masks.copy()
+    for n in range(1, 6):
+        h = high_bit[remaining]
+        packed = (packed << 4) | np.where(remaining > 0, h, 0)
+        remaining = remaining & ~(1 << h)
+        top[n] = packed.astype(np.int32)
+
+    straight = np.full(1 << 13, -1, dtype=np.int32)
+    straight[(masks & WHEEL) == WHEEL] = 3
+    for high in range(4, 13):
+        pattern = 0b11111 << (high - 4)
+        straight[(masks & pattern) == pattern] = high
+    return popcount, high_bit, top, straight
+
+
+POPCOUNT, HIGH_BIT, TOP, STRAIGHT_HIGH = _build_tables()
+
+
+def _evaluate_arrays(masks, popcount, high_bit, top2, top3, top5, straight_high):
+    s0 = (masks & np.uint64(RANK_MASK)).astype(np.int32)
+    s1 = ((masks >> np.uint64(13)) & np.uint64(RANK_MASK)).astype(np.int32)
+    s2 = ((masks >> np.uint64(26)) & np.uint64(RANK_MASK)).astype(np.int32)
+    s3 = ((masks >> np.uint64(39)) & np.uint64(RANK_MASK)).astype(np.int32)
+
+    # Ranks held at least once, twice, three and four times
+    ranks = s0 | s1 | s2 | s3
+    twice = (s0 & s1) | (s0 & s2) | (s0 & s3) | (s1 & s2) | (s1 & s3) | (s2 & s3)
+    thrice = (s0 & s1 & s2) | (s0 & s1 & s3) | (s0 & s2 & s3) | (s1 & s2 & s3)
+    quads = s0 & s1 & s2 & s3
+
+    # At most one suit can hold five of seven cards
+    flush = np.where(popcount[s0] >= 5, s0, 0)
+    flush = np.where(popcount[s1] >= 5, s1, flush)
+    flush = np.where(popcount[s2] >= 5, s2, flush)
+    flush = np.where(popcount[s3] >= 5, s3, flush)
+
+    straight_flush = straight_high[flush]
+    straight = straight_high[ranks]
+
+    top_quad = high_bit[quads]
+    top_trips = high_bit[thrice]
+    top_pair = high_bit[twice]
+    full_pair = twice & ~(1 << top_trips)
+    second_pair = twice & ~(1 << top_pair)
+    top_second_pair = high_bit[second_pair]
+
+    conditions = [
+        straight_flush >= 0,
+        quads > 0,
+        (thrice > 0) & (full_pair > 0),
+        flush > 0,
+        straight >= 0,
+        thrice > 0,
+        second_pair > 0,
+        twice > 0,
+    ]
+    values = [
+        (STRAIGHT_FLUSH << 20) | straight_flush,
+        (QUADS << 20) | (top_quad << 4) | high_bit[ranks & ~(1 << top_quad)],
+        (FULL_HOUSE << 20) | (top_trips << 4) | high_bit[full_pair],
+        (FLUSH << 20) | top5[flush],
+        (STRAIGHT << 20) | straight,
+        (TRIPS << 20) | (top_trips << 8) | top2[ranks & ~(1 << top_trips)],
+        (TWO_PAIR << 20) | (top_pair << 8) | (top_second_pair << 4)
+        | high_bit[ranks & ~(1 << top_pair) & ~(1 << top_second_pair)],
+        (PAIR << 20) | (top_pair << 12) | top3[ranks & ~(1 << top_pair)],
+    ]
+    return np.select(conditions, values, (HIGH_CARD << 20) | top5[ranks]).astype(np.int32)
+
+
+@kernel(_evaluate_arrays)
+def _evaluate_loop(masks, popcount, high_bit, top2, top3, top5, straight_high):
+    values = np.empty(len(masks), dtype=np.int32)
+    for i in range(len(masks)):
+        mask = masks[i]
+        s0 = np.int64(mask & np.uint64(RANK_MASK))
+        s1 = np.int64((mask >> np.uint64(13)) & np.uint64(RANK_MASK))
+        s2 = np.int64((mask >> np.uint64(26)) & np.uint64(RANK_MASK))
+        s3 = np.int64((mask >> np.uint64(39)) & np.uint64(RANK_MASK))
+        ranks = s0 | s1 | s2 | s3
+        twice = (s0 & s1) | (s0 & s2) | (s0 & s3) | (s1 & s2) | (s1 & s3) | (s2 & s3)
+        thrice = (s0 & s1 & s2) | (s0 & s1 & s3) | (s0 & s2 & s3) | (s1 & s2 & s3)
+        quads = s0 & s1 & s2 & s3
+
+        flush = 0
+        if popcount[s0] >= 5:
+            flush = s0
+        elif popcount[s1] >= 5:
+            flush = s1
+        elif popcount[s2] >= 5:
+            flush = s2
+        elif popcount[s3] >= 5:
+            flush = s3
+
+        top_trips = high_bit[thrice]
+        full_pair = twice & ~(1 << top_trips)
+        if flush and straight_high[flush] >= 0:
+            values[i] = (STRAIGHT_FLUSH << 20) | straight_high[flush]
+        elif quads:
+            top_quad = high_bit[quads]
+            values[i] = (QUADS << 20) | (top_quad << 4) | high_bit[ranks & ~(1 << top_quad)]
+        elif thrice and full_pair:
+            values[i] = (FULL_HOUSE << 20) | (top_trips << 4) | high_bit[full_pair]
+        elif flush:
+            values[i] = (FLUSH << 20) | top5[flush]
+        elif straight_high[ranks] >= 0:
+            values[i] = (STRAIGHT << 20) | straight_high[ranks]
+        elif thrice:
+            values[i] = (TRIPS << 20) | (top_trips << 8) | top2[ranks & ~(1 << top_trips)]
+        elif twice:
+            top_pair = high_bit[twice]
+            second_pair = twice & ~(1 << top_pair)
+            if second_pair:
+                top_second_pair = high_bit[second_pair]
+                values[i] = (TWO_PAIR << 20) | (top_pair << 8) | (top_second_pair << 4) \
+                    | high_bit[ranks & ~(1 << top_pair) & ~(1 << top_second_pair)]
+            else:
+                values[i] = (PAIR << 20) | (top_pair << 12) | top3[ranks & ~(1 << top_pair)]
+        else:
+            values[i] = (HIGH_CARD << 20) | top5[ranks]
+    return values
+
+
+def evaluate(masks) -> np.ndarray:
+    """Values of an array of 5 to 7 card masks."""
+    masks = np.asarray(masks, dtype=np.uint64)
+    values = _evaluate_loop(np.ascontiguousarray(masks.reshape(-1)), POPCOUNT, HIGH_BIT,
+                            TOP[2], TOP[3], TOP[5], STRAIGHT_HIGH)
+    return values.reshape(masks.shape)
+
+
+def evaluate_cards(cards: Iterable[str]) -> int:
+    """Value of a single hand of card strings."""
+    return int(evaluate(np.array([card_mask(cards)], dtype=np.uint64))[0])
+
+
+def category(values):
+    """Hand category (:data:`HIGH_CARD` ... :data:`STRAIGHT_FLUSH`) of hand values."""
+    return np.asarray(values) >> 20
+
+
+if __name__ == '__main__':
+    from cards import to_mask
+
+    rng = np.random.default_rng(0)
+    hands = np.argsort(rng.random((1_000_000, 52)), axis=1)[:, :7]
+    counts = np.bincount(category(evaluate(to_mask(hands))), minlength=9)
+    for name, count in zip(CATEGORY_NAMES, counts):
+        print(name.ljust(20, '.') + f"{count / len(hands):.4f}".rjust(10))
@@ -11,10 +11,6 @@ __status__ = 'Development'
 from abc import ABC, abstractmethod
 from enum import Enum
 
-import cv2
-import imagehash
-import numpy as np
-from PIL import Image
 from loguru import logger
 
 from hand import Hand
@@ -86,55 +82,28 @@ class BoardListener(Listener):
         if event.current_state == BoardState.PREFLOP:
             self.bot.c_cards = []
         elif event.current_state == BoardState.FLOP:
-            c0_rect = self.bot.window_elements['c_cards'][0]
-            c1_rect = self.bot.window_elements['c_cards'][1]
-            c2_rect = self.bot.window_elements['c_cards'][2]
-            c0_img = cv2.resize(c0_rect.screenshot(), (35, 42))
-            c1_img = cv2.resize(c1_rect.screenshot(), (35, 42))
-            c2_img = cv2.resize(c2_rect.screenshot(), (35, 42))
-            try:
-                self.bot.c_cards.append(self.bot.hashed_cards[self.get_hash(c0_img)])
-            except KeyError:
-                self.bot.c_cards.append(self.get_best_match(c0_img))
-            try:
-                self.bot.c_cards.append(self.bot.hashed_cards[self.get_hash(c1_img)])
-            except KeyError:
-                self.bot.c_cards.append(self.get_best_match(c1_img))
-            try:
-                self.bot.c_cards.append(self.bot.hashed_cards[self.get_hash(c2_img)])
-            except KeyError:
-                self.bot.c_cards.append(self.get_best_match(c2_img))
+            for c_rect in self.bot.window_elements['c_cards'][:3]:
+                self.bot.c_cards.append(self.recognize(c_rect))
         elif event.current_state == BoardState.TURN:
             c3_rect = self.bot.window_elements['c_cards'][3]
-            c3_img = cv2.resize(c3_rect.screenshot(), (35, 42))
-            try:
-                self.bot.c_cards.append(self.bot.hashed_cards[self.get_hash(c3_img)])
-            except KeyError:
-                self.bot.c_cards.append(self.get_best_match(c3_img))
+            self.bot.c_cards.append(self.recognize(c3_rect))
         elif event.current_state == BoardState.RIVER:
-            c4_rect = self.bot.window_elements['c_cards'][4]
-            c4_img = cv2.resize(c4_rect.screenshot(), (35, 42))
             if len(self.bot.c_cards) >= 5:
                 return
-            try:
-                self.bot.c_cards.append(self.bot.hashed_cards[self.get_hash(c4_img)])
-            except KeyError:
-                self.bot.c_cards.append(self.get_best_match(c4_img))
-
-    def get_hash(self, img: np.ndarray):
-        img = Image.fromarray(img)
-        return imagehash.phash(img)
-
-    def get_best_match(self, img):
-        best_match = ""
-        best_rank = 1000
-        for card_img, card_name in zip(self.bot.card_images, self.bot.card_names):
-            dif = cv2.absdiff(card_img, img)
-            rank = int(np.sum(dif) / 255)
-            if rank < best_rank:
-                best_rank = rank
-                best_match = card_name
-        return best_match
+            c4_rect = self.bot.window_elements['c_cards'][4]
+            self.bot.c_cards.append(self.recognize(c4_rect))
+        self.update_strength()
+
+    def update_strength(self):
+        cards = self.bot.h_cards + self.bot.c_cards
+        if len(self.bot.h_cards) == 2 and len(self.bot.c_cards) >= 3 \
+                and all(cards) and len(set(cards)) == len(cards):
+            self.bot.strength_worker.submit(self.bot.h_cards, self.bot.c_cards)
+        else:
+            self.bot.strength_worker.clear()
+
+    def recognize(self, c_rect) -> str:
+        return self.bot.recognizer.community_card(c_rect.region(self.bot.frame))
 
 
 class HandState(Enum):
@@ -164,35 +133,14 @@ class HandListener(Listener):
         if event.current_state == HandState.SITTING_OUT:
             self.bot.h_cards = []
             self.bot.hand = None
+            self.bot.strength_worker.clear()
         elif event.current_state == HandState.PLAYING:
-            c0_rect = self.bot.window_elements['h_cards'][0]
-            c1_rect = self.bot.window_elements['h_cards'][1]
-            c0_img = cv2.resize(c0_rect.screenshot(), (35, 42))
-            c1_img = cv2.resize(c1_rect.screenshot(), (35, 42))
-            try:
-                self.bot.h_cards.append(self.bot.hashed_cards[self.get_hash(c0_img)])
-            except KeyError:
-                self.bot.h_cards.append(self.get_best_match(c0_img))
-            try:
-                self.bot.h_cards.append(self.bot.hashed_cards[self.get_hash(c1_img)])
-            except KeyError:
-                self.bot.h_cards.append(self.get_best_match(c1_img))
+            for c_rect in self.bot.window_elements['h_cards']:
+                self.bot.h_cards.append(self.recognize(c_rect))
             self.bot.hand = Hand(self.bot.h_cards)
 
-    def get_hash(self, img: np.ndarray):
-        img = Image.fromarray(img)
-        return imagehash.phash(img)
-
-    def get_best_match(self, img):
-        best_match = ""
-        best_rank = 1000
-        for card_img, card_name in zip(self.bot.card_images, self.bot.card_names):
-            dif = cv2.absdiff(card_img, img)
-            rank = int(np.sum(dif) / 255)
-            if rank < best_rank:
-                best_rank = rank
-                best_match = card_name
-        return best_match
+    def recognize(self, c_rect) -> str:
+        return self.bot.recognizer.hole_card(c_rect.region(self.bot.frame))
 
 
 if __name__ == '__main__':
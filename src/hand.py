@@ -8,15 +8,57 @@ __author__ = 'Dusti Johnson'
 __copyright__ = '2023, Dusti Johnson'
 __status__ = 'Development'
 
+import csv
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
 import numpy as np
-import pandas as pd
+
+import artifacts
 
 HAND_RANKS_CSV = Path(__file__).parent.joinpath('hand_ranks.csv').resolve()
 
-SKLANSKY_CHUBUKOV = pd.read_csv(str(HAND_RANKS_CSV)).replace('inf', np.inf).set_index('Hand')
+_hand_ranks: Dict[str, np.ndarray] = {}
+_hand_index: Dict[str, int] = {}
+
+
+def read_hand_ranks_csv() -> Dict[str, np.ndarray]:
+    with open(HAND_RANKS_CSV, 'r', encoding='utf-8-sig', newline='') as f:
+        rows = list(csv.reader(f))
+    header, rows = rows[0], rows[1:]
+    columns = {
+        name.lower().replace(' ', '_').replace('-', '_'): [row[i] for row in rows]
+        for i, name in enumerate(header)
+    }
+    arrays = {'hand': np.array(columns.pop('hand'))}
+    arrays['ranking'] = np.array(columns.pop('ranking'), dtype=np.int16)
+    for name, values in columns.items():
+        arrays[name] = np.array(values, dtype=np.float64)
+    return arrays
+
+
+def hand_ranks() -> Dict[str, np.ndarray]:
+    """Columns of ``hand_ranks.csv``, loaded from the cached binary artifact."""
+    if not _hand_ranks:
+        _hand_ranks.update(artifacts.load('hand_ranks', read_hand_ranks_csv, [HAND_RANKS_CSV]))
+        _hand_index.update({hand: i for i, hand in enumerate(_hand_ranks['hand'].tolist())})
+    return _hand_ranks
+
+
+def hand_index(hand: str) -> int:
+    """Row of a hand, e.g. ``'AKs'``, in :func:`hand_ranks`."""
+    hand_ranks()
+    return _hand_index[hand]
+
+
+def __getattr__(name):
+    # The pandas table is only built for code that still asks for it
+    if name == 'SKLANSKY_CHUBUKOV':
+        import pandas as pd
+        table = pd.read_csv(str(HAND_RANKS_CSV)).replace('inf', np.inf).set_index('Hand')
+        globals()[name] = table
+        return table
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class Hand:
@@ -31,31 +73,26 @@ class Hand:
         self.hand = self.parse_hand()
 
     def __eq__(self, other):
-        return (
-                SKLANSKY_CHUBUKOV.loc[self.hand, 'Ranking']
-                == SKLANSKY_CHUBUKOV.loc[other.hand, 'Ranking']
-        )
+        return self.ranking == other.ranking
 
     def __lt__(self, other):
-        return (
-                SKLANSKY_CHUBUKOV.loc[self.hand, 'Ranking']
-                > SKLANSKY_CHUBUKOV.loc[other.hand, 'Ranking']
-        )
+        return self.ranking > other.ranking
 
     def __gt__(self, other):
-        return (
-                SKLANSKY_CHUBUKOV.loc[self.hand, 'Ranking']
-                < SKLANSKY_CHUBUKOV.loc[other.hand, 'Ranking']
-        )
+        return self.ranking < other.ranking
 
     def __repr__(self):
         return f"{self.hand} <{self.get_hand(verbose=True)}> | " \
-               f"ranking= {SKLANSKY_CHUBUKOV.loc[self.hand, 'Ranking']} | " \
+               f"ranking= {self.ranking} | " \
                f"percentile= {self.precentile * 100:.2f}"
 
+    @property
+    def ranking(self) -> int:
+        return int(hand_ranks()['ranking'][hand_index(self.hand)])
+
     @property
     def precentile(self) -> float:
-        return SKLANSKY_CHUBUKOV.loc[self.hand, 'Percentile']
+        return float(hand_ranks()['percentile'][hand_index(self.hand)])
 
     def get_hand(self, verbose: bool = False) -> str:
         if verbose:
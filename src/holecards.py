@@ -0,0 +1,177 @@
+"""
+Bulk hole card classification.
+
+Maps an ``(n, 2)`` array of card codes (see :mod:`cards`) to the 169 preflop
+classes of ``hand_ranks.csv`` with a single lookup into a table over every
+ordered pair of cards, then to the class's Sklansky-Chubukov ranking,
+percentile and pair / suited / offsuit flags with more lookups by class, so
+classifying costs a few array gathers per hand. Codes of -1 stand for unknown
+cards and classify as no class (-1).
+
+:func:`read_hole_cards` streams hole cards out of files too large to load at
+once: ``.npy`` arrays are memory-mapped, text is parsed a block of bytes at a
+time, taking the first two cards (``'Ah'``, ``'Td'``) on each line, so plain
+lists (``AhKd``), CSV and JSON lines such as ``synthetic.py`` labels all work.
+"""
+
+__all__ = [
+    'HoleCardClasses',
+    'classify',
+    'read_hole_cards',
+    'class_counts',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from pathlib import Path
+from typing import Dict, Iterator, NamedTuple
+
+import numpy as np
+
+from cards import RANKS, SUITS
+from hand import hand_index, hand_ranks
+
+N_CLASSES = 169
+CHUNK_BYTES = 1 << 24
+CHUNK_ROWS = 1 << 22
+
+PAIR, SUITED, OFFSUIT = 0, 1, 2
+
+_tables: Dict[str, np.ndarray] = {}
+
+
+def _build_tables() -> Dict[str, np.ndarray]:
+    """Class of every (code + 1, code + 1) pair, and per class columns with a no class row last."""
+    from ranges import class_name
+
+    pair_class = np.full((53, 53), -1, dtype=np.int16)
+    for c1 in range(52):
+        for c2 in range(52):
+            if c1 != c2:
+                pair_class[c1 + 1, c2 + 1] = hand_index(class_name(c1, c2))
+    names = hand_ranks()['hand'].tolist()
+    kind = [PAIR if len(name) == 2 else SUITED if name[-1] == 's' else OFFSUIT for name in names]
+    return {
+        'pair_class': pair_class.ravel(),
+        'ranking': np.append(hand_ranks()['ranking'], 0).astype(np.int16),
+        'percentile': np.append(hand_ranks()['percentile'], np.nan),
+        'kind': np.append(kind, -1).astype(np.int8),
+    }
+
+
+def _table(name: str) -> np.ndarray:
+    if not _tables:
+        _tables.update(_build_tables())
+    return _tables[name]
+
+
+class HoleCardClasses(NamedTuple):
+    """Columns for a batch of hole cards, -1 / 0 / NaN / False where a hand has no class."""
+    index: np.ndarray
+    ranking: np.ndarray
+    percentile: np.ndarray
+    pair: np.ndarray
+    suited: np.ndarray
+    offsuit: np.ndarray
+
+
+def classify(codes: np.ndarray) -> HoleCardClasses:
+    """Classes of an (n, 2) array of hole card codes, in either order.
+
+    :return: Row in :func:`hand.hand_ranks` of each hand, its ranking (1 is best), percentile
+        and pair / suited / offsuit flags
+    """
+    codes = np.asarray(codes)
+    first = codes[..., 0].astype(np.int32)
+    second = codes[..., 1].astype(np.int32)
+    index = _table('pair_class')[(first + 1) * 53 + second + 1]
+    kind = _table('kind')[index]
+    return HoleCardClasses(index, _table('ranking')[index], _table('percentile')[index],
+                           kind == PAIR, kind == SUITED, kind == OFFSUIT)
+
+
+# Rank and suit of each byte, -1 for any other character
+_RANK_OF_BYTE = np.full(256, -1, dtype=np.int8)
+_RANK_OF_BYTE[np.frombuffer(RANKS.encode(), dtype=np.uint8)] = np.arange(len(RANKS))
+_SUIT_OF_BYTE = np.full(256, -1, dtype=np.int8)
+_SUIT_OF_BYTE[np.frombuffer(SUITS.encode(), dtype=np.uint8)] = np.arange(len(SUITS))
+
+
+def _parse_lines(text: np.ndarray) -> np.ndarray:
+    """(n, 2) codes of the first two cards of each line of a uint8 buffer that has two."""
+    ranks = _RANK_OF_BYTE[text[:-1]]
+    suits = _SUIT_OF_BYTE[text[1:]]
+    starts = np.flatnonzero((ranks >= 0) & (suits >= 0))
+    codes = (suits[starts].astype(np.int8) * 13 + ranks[starts])
+    lines = np.cumsum(text == ord('\n'))[starts]
+    first = np.flatnonzero(np.concatenate(([True], lines[1:] != lines[:-1])))
+    first = first[first + 1 < len(starts)]
+    first = first[lines[first + 1] == lines[first]]
+    return np.stack((codes[first], codes[first + 1]), axis=1)
+
+
+def read_hole_cards(path: Path, chunk_bytes: int = CHUNK_BYTES,
+                    chunk_rows: int = CHUNK_ROWS) -> Iterator[np.ndarray]:
+    """Hole card codes of a file, as consecutive (n, 2) int8 blocks.
+
+    :param path: ``.npy`` array of (n, 2) codes, or text with a hand on each line
+    :param chunk_bytes: Bytes of text parsed at a time
+    :param chunk_rows: Rows of a ``.npy`` file per block
+    """
+    path = Path(path)
+    if path.suffix == '.npy':
+        codes = np.load(path, mmap_mode='r')
+        for start in range(0, len(codes), chunk_rows):
+            yield np.asarray(codes[start:start + chunk_rows], dtype=np.int8)
+        return
+    with open(path, 'rb') as f:
+        rest = b''
+        while True:
+            block = f.read(chunk_bytes)
+            text = rest + block
+            # Lines cut by the end of the block wait for the next one
+            end = len(text) if not block else text.rfind(b'\n') + 1
+            rest = text[end:]
+            if end:
+                yield _parse_lines(np.frombuffer(text[:end] + b'\n', dtype=np.uint8))
+            if not block:
+                return
+
+
+def class_counts(path: Path) -> np.ndarray:
+    """Hands of each class in a file, in :func:`hand.hand_ranks` order."""
+    counts = np.zeros(N_CLASSES, dtype=np.int64)
+    for codes in read_hole_cards(path):
+        index = classify(codes).index
+        counts += np.bincount(index[index >= 0], minlength=N_CLASSES)
+    return counts
+
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+
+    from cards import card_codes, card_names
+
+    print(classify(card_codes(['Ah', 'Kh', 'Ks', 'Ad', '7c', '2d', '9s', '9d']).reshape(-1, 2)))
+
+    rng = np.random.default_rng(0)
+    n = 10_000_000
+    hands = np.argsort(rng.random((1000, 52)), axis=1)[:, :2].astype(np.int8)
+    hands = hands[rng.integers(0, len(hands), n)]
+    start = time.perf_counter()
+    classes = classify(hands)
+    print(f"Classified {n:,} hands in {time.perf_counter() - start:.2f}s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / 'hands.txt'
+        names = np.array([''.join(card_names(hand)) for hand in hands[:1000]])
+        lines = names[rng.integers(0, 1000, n)]
+        path.write_text('\n'.join(lines) + '\n')
+        start = time.perf_counter()
+        counts = class_counts(path)
+        print(f"Read and classified {counts.sum():,} hands of {path.stat().st_size / 2 ** 20:.0f} "
+              f"MB of text in {time.perf_counter() - start:.2f}s, "
+              f"{counts[hand_index('AA')]:,} AA")
@@ -0,0 +1,106 @@
+"""
+Optional JIT backend.
+
+Some inner loops are branchy per item and only vectorize as a fixed number of
+passes over whole arrays. :func:`kernel` pairs a plain loop version of such a
+function, compiled by Numba on first use, with the NumPy version it replaces.
+Calls go to the compiled loop while the ``numba`` backend is selected and to
+the NumPy version otherwise, so Numba stays an optional dependency.
+
+The backend defaults to ``numba`` when it is installed, and can be chosen with
+the ``POKER_JIT`` environment variable (``numba`` or ``numpy``), :func:`use` or
+:func:`using`.
+"""
+
+__all__ = [
+    'available',
+    'backend',
+    'use',
+    'using',
+    'kernel',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import os
+from contextlib import contextmanager
+from importlib.util import find_spec
+from typing import Callable
+
+from loguru import logger
+
+BACKENDS = ('numba', 'numpy')
+
+
+def available() -> bool:
+    """Whether Numba is installed."""
+    return find_spec('numba') is not None
+
+
+def _default() -> str:
+    name = os.environ.get('POKER_JIT', 'numba' if available() else 'numpy')
+    if name not in BACKENDS:
+        raise ValueError(f"POKER_JIT must be one of {BACKENDS}, got {name!r}")
+    if name == 'numba' and not available():
+        logger.warning("POKER_JIT=numba but numba isn't installed, using numpy")
+        return 'numpy'
+    return name
+
+
+_backend = _default()
+
+
+def backend() -> str:
+    return _backend
+
+
+def use(name: str):
+    """Select the backend used by every kernel from now on."""
+    global _backend
+    if name not in BACKENDS:
+        raise ValueError(f"backend must be one of {BACKENDS}, got {name!r}")
+    if name == 'numba' and not available():
+        raise RuntimeError("the numba backend needs numba installed")
+    _backend = name
+
+
+@contextmanager
+def using(name: str):
+    previous = _backend
+    use(name)
+    try:
+        yield
+    finally:
+        use(previous)
+
+
+class Kernel:
+    """A loop compiled by Numba on first call, or its NumPy fallback."""
+
+    def __init__(self, loop: Callable, fallback: Callable):
+        self.loop = loop
+        self.fallback = fallback
+        self.compiled = None
+        self.__name__ = loop.__name__
+        self.__doc__ = loop.__doc__
+
+    def __call__(self, *args):
+        if _backend != 'numba':
+            return self.fallback(*args)
+        if self.compiled is None:
+            import numba
+            self.compiled = numba.njit(cache=True, nogil=True)(self.loop)
+        return self.compiled(*args)
+
+
+def kernel(fallback: Callable) -> Callable[[Callable], Kernel]:
+    """Decorate a loop taking the same arguments as ``fallback`` and returning the same result."""
+    def decorate(loop: Callable) -> Kernel:
+        return Kernel(loop, fallback)
+    return decorate
+
+
+if __name__ == '__main__':
+    print(f"numba {'installed' if available() else 'not installed'}, backend {backend()}")
@@ -0,0 +1,112 @@
+"""
+Table layout profiles.
+
+The client scales the whole table with its window, so every profile is the base
+layout scaled to one table size. The profile for a capture is picked from the
+frame dimensions.
+"""
+
+__all__ = [
+    'LayoutProfile',
+    'BASE_PROFILE',
+    'PROFILES',
+    'select_profile',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from typing import List, NamedTuple, Tuple
+
+Rect = Tuple[int, int, int, int]
+
+
+class LayoutProfile(NamedTuple):
+    """Element coordinates for one table size.
+
+    Rectangles are (x, y, width, height) relative to the table, border and titlebar cropped.
+    """
+    name: str
+    table_size: Tuple[int, int]
+    h_cards: List[Rect]
+    h_check_pixel: Rect
+    c_cards: List[Rect]
+    c_check_pixels: List[Rect]
+
+    @property
+    def hole_card_size(self) -> Tuple[int, int]:
+        """(width, height) of a hole card crop."""
+        return self.h_cards[0][2], self.h_cards[0][3]
+
+    @property
+    def board_card_size(self) -> Tuple[int, int]:
+        """(width, height) of a community card crop."""
+        return self.c_cards[0][2], self.c_cards[0][3]
+
+    def scaled(self, factor: float) -> 'LayoutProfile':
+        """A copy of the profile for a table ``factor`` times the size."""
+        w, h = self.table_size
+        table_size = (round(w * factor), round(h * factor))
+
+        def scale_rect(rect: Rect) -> Rect:
+            x, y, w, h = rect
+            # Pixels stay pixels
+            if w == 1 and h == 1:
+                return round(x * factor), round(y * factor), 1, 1
+            return round(x * factor), round(y * factor), round(w * factor), round(h * factor)
+
+        return LayoutProfile(
+            name='x'.join(map(str, table_size)),
+            table_size=table_size,
+            h_cards=[scale_rect(r) for r in self.h_cards],
+            h_check_pixel=scale_rect(self.h_check_pixel),
+            c_cards=[scale_rect(r) for r in self.c_cards],
+            c_check_pixels=[scale_rect(r) for r in self.c_check_pixels],
+        )
+
+
+BASE_PROFILE = LayoutProfile(
+    name='960x560',
+    table_size=(960, 560),
+    h_cards=[
+        (442, 328, 35, 42),
+        (480, 328, 35, 42),
+    ],
+    h_check_pixel=(470, 330, 1, 1),
+    c_cards=[
+        (335, 211, 49, 59),
+        (395, 211, 49, 59),
+        (455, 211, 49, 59),
+        (514, 211, 49, 59),
+        (574, 211, 49, 59),
+    ],
+    c_check_pixels=[
+        (496, 220, 1, 1),
+        (556, 220, 1, 1),
+        (612, 220, 1, 1),
+    ],
+)
+
+PROFILES = {
+    profile.name: profile for profile in (
+        BASE_PROFILE.scaled(0.75),
+        BASE_PROFILE,
+        BASE_PROFILE.scaled(1.25),
+        BASE_PROFILE.scaled(1.5),
+        BASE_PROFILE.scaled(2.0),
+    )
+}
+
+
+def select_profile(width: int, height: int) -> LayoutProfile:
+    """The profile whose table size is closest to a (width, height) frame."""
+    return min(
+        PROFILES.values(),
+        key=lambda p: abs(p.table_size[0] - width) + abs(p.table_size[1] - height),
+    )
+
+
+if __name__ == '__main__':
+    for profile in PROFILES.values():
+        print(profile.name, profile.hole_card_size, profile.board_card_size)
@@ -0,0 +1,35 @@
+"""
+Deferred imports for heavy modules.
+"""
+
+__all__ = ['lazy_import']
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import importlib
+import sys
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """Stand-in for a module that is imported on first attribute access."""
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)
+        # Later lookups hit the instance dict and skip __getattr__ entirely
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Return ``name`` if it is already imported, otherwise a :class:`LazyModule` for it."""
+    try:
+        return sys.modules[name]
+    except KeyError:
+        return LazyModule(name)
+
+
+if __name__ == '__main__':
+    pass
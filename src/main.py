@@ -8,10 +8,12 @@ __author__ = 'Dusti Johnson'
 __copyright__ = '2023, Dusti Johnson'
 __status__ = 'Development'
 
+import argparse
 from pathlib import Path
 
 from loguru import logger
 
+import profiling
 from bot import Bot
 
 PROJECT_PATH = Path(__file__).parent.parent.resolve()
@@ -19,4 +21,18 @@ LOG_PATH = PROJECT_PATH / 'temp' / 'logs' / 'log.log'
 logger.add(LOG_PATH, rotation='50KB', retention=3)
 
 if __name__ == '__main__':
-    Bot().run()
+    parser = argparse.ArgumentParser(description='Run the bot on the poker client window.')
+    parser.add_argument('--replay', type=Path, metavar='PATH',
+                        help='replay a frame archive, or a directory of frames, instead of '
+                             'capturing the window')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    capture = None
+    if args.replay is not None and args.replay.is_dir():
+        from synthetic import ReplayCapture
+        capture = ReplayCapture(args.replay)
+    elif args.replay is not None:
+        from archive import ArchiveCapture
+        capture = ArchiveCapture(args.replay)
+    Bot(capture, show_status=args.replay is None).run(profiling.from_args(args))
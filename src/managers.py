@@ -13,7 +13,9 @@ __status__ = 'Development'
 
 import time
 
-import cv2
+from lazy import lazy_import
+
+cv2 = lazy_import('cv2')
 
 
 class WindowManager:
@@ -46,8 +48,16 @@ class WindowManager:
 
 
 class CaptureManager:
-    def __init__(self, capture, preview_window_manager=None):
+    def __init__(self, capture, preview_window_manager=None, recorder=None, archive=None):
+        """
+        :param recorder: :class:`recorder.DebugRecorder` that frames, their annotations and
+            image writes are handed to, instead of writing on the frame loop
+        :param archive: :class:`archive.ArchiveWriter` every raw frame is appended to
+        """
         self.preview_window_manager = preview_window_manager
+        self.recorder = recorder
+        self.archive = archive
+        self.annotations = None
         self._capture = capture
         self._entered_frame = False
         self._frame = None
@@ -59,7 +69,7 @@ class CaptureManager:
 
     @property
     def frame(self):
-        if self._entered_frame is not None and self._frame is None:
+        if self._entered_frame and self._frame is None:
             self._frame = self._capture.get_screenshot()
         return self._frame
 
@@ -72,7 +82,7 @@ class CaptureManager:
         # But first, check that any previous frame was exited.
         assert not self._entered_frame, 'previous enter_frame() had no matching exit_frame()'
         if self._capture is not None:
-            self._entered_frame = self._capture.get_screenshot()
+            self._entered_frame = True
 
     def exit_frame(self):
         """Draw to the window. Write to files. Release the frame."""
@@ -93,17 +103,31 @@ class CaptureManager:
         if self.preview_window_manager is not None:
             self.preview_window_manager.show(self._frame)
 
+        # Archive the raw frame, if archiving
+        if self.archive is not None:
+            self.archive.append(self._frame)
+
+        # Record the annotated frame, if recording
+        if self.recorder is not None and self.annotations is not None:
+            self.recorder.submit(self._frame, self.annotations)
+
         # Write to the image file, if any
         if self.is_writing_image:
-            if self._img is not None:
-                cv2.imwrite(self._image_filename, self._img)
+            img = self._img if self._img is not None else self._frame
+            if self.recorder is not None:
+                self.recorder.submit(img, filename=self._image_filename)
             else:
-                cv2.imwrite(self._image_filename, self._frame)
+                cv2.imwrite(self._image_filename, img)
 
         # Release the frame
         self._frame = None
+        self.annotations = None
         self._entered_frame = False
 
+    def annotate(self, annotations):
+        """Set the :class:`recorder.Annotations` recorded with the current frame."""
+        self.annotations = annotations
+
     def write_image(self, filename, img=None):
         """Write frame or image to file."""
         if img is not None:
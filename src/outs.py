@@ -0,0 +1,129 @@
+"""
+Outs and draw analysis for the flop and turn.
+
+Every unseen card is dealt in a single vectorized pass over card masks. A card is
+an out when it raises the hero's hand category to one the board alone doesn't
+make.
+"""
+
+__all__ = [
+    'Outs',
+    'find_outs',
+    'analyze_outs',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from cards import CARD_BITS, FULL_DECK, card_mask, card_names, check_spot, mask_to_codes
+from evaluator import category, evaluate
+from ranges import COMBO_MASKS, remove_dead
+
+
+class Outs(NamedTuple):
+    """Outs of a flop or turn spot."""
+    category: int
+    by_category: Dict[int, List[str]]
+    clean: List[str]
+    tainted: List[str]
+    rule_odds: float
+    next_card_odds: float
+    river_odds: Optional[float]
+
+    @property
+    def cards(self) -> List[str]:
+        return [card for cards in self.by_category.values() for card in cards]
+
+
+def _improves(known: int, board_mask: int,
+              dealt: np.ndarray) -> Tuple[int, np.ndarray, np.ndarray]:
+    """Current category, and whether each dealt mask improves on it and to which category.
+
+    The hero's hands, the board alone and the current hand go through one evaluation.
+    """
+    n = len(dealt)
+    values = evaluate(np.concatenate(([known], known | dealt, board_mask | dealt)))
+    categories = category(values)
+    current, new, board = categories[0], categories[1:n + 1], categories[n + 1:]
+    return int(current), (new > current) & (new > board), new
+
+
+def find_outs(hole_mask: int, board_mask: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Codes of the outs and the category each one makes. Cheap enough for whole histories."""
+    known = hole_mask | board_mask
+    live = mask_to_codes(FULL_DECK & ~known)
+    _, improved, new = _improves(known, board_mask, CARD_BITS[live])
+    return live[improved], new[improved]
+
+
+def analyze_outs(hole: List[str], board: List[str], villain_range: np.ndarray = None,
+                 clean_threshold: float = 0.9) -> Outs:
+    """Outs of a spot, and how they hold up against a range.
+
+    :param hole: Hero's hole cards
+    :param board: The flop or turn
+    :param villain_range: Combo weights (see :mod:`ranges`), without one every out is clean
+    :param clean_threshold: Share of the range an out must beat to be clean. An out that
+        leaves no combo of the range live can't be beaten, so it is clean.
+    """
+    check_spot(hole, board, (3, 4))
+    hole_mask = card_mask(hole)
+    board_mask = card_mask(board)
+    known = hole_mask | board_mask
+    live = mask_to_codes(FULL_DECK & ~known)
+    current, improved, new = _improves(known, board_mask, CARD_BITS[live])
+    codes, categories = live[improved], new[improved]
+
+    by_category = {}
+    for cat in np.unique(categories)[::-1]:
+        by_category[int(cat)] = card_names(codes[categories == cat])
+
+    clean, tainted = card_names(codes), []
+    if villain_range is not None and len(codes):
+        weights = remove_dead(villain_range, known)
+        if not weights.sum() > 0:
+            raise ValueError("villain range holds no live combos")
+        in_range = np.flatnonzero(weights)
+        combos = COMBO_MASKS[in_range]
+        out_bits = CARD_BITS[codes]
+        hero = evaluate(known | out_bits)
+        villain = evaluate((board_mask | out_bits)[:, None] | combos[None, :])
+        w = np.where(combos[None, :] & out_bits[:, None], 0.0, weights[in_range][None, :])
+        beaten = ((hero[:, None] > villain) * w + (hero[:, None] == villain) * w / 2).sum(axis=1)
+        total = w.sum(axis=1)
+        share = np.divide(beaten, total, out=np.ones_like(beaten), where=total > 0)
+        clean = card_names(codes[share >= clean_threshold])
+        tainted = card_names(codes[share < clean_threshold])
+
+    n_outs, n_live = len(codes), len(live)
+    next_card_odds = n_outs / n_live
+    if len(board) == 3:
+        rule_odds = min(n_outs * 4 / 100, 1.0)
+        # Exact, every turn and river, runner-runner draws included
+        i, j = np.triu_indices(n_live, 1)
+        runouts = CARD_BITS[live[i]] | CARD_BITS[live[j]]
+        _, improved, _ = _improves(known, board_mask, runouts)
+        river_odds = float(improved.mean())
+    else:
+        rule_odds = min(n_outs * 2 / 100, 1.0)
+        river_odds = None
+
+    return Outs(current, by_category, clean, tainted, rule_odds, next_card_odds, river_odds)
+
+
+if __name__ == '__main__':
+    from evaluator import CATEGORY_NAMES
+    from ranges import top_range
+
+    outs = analyze_outs(['Ah', 'Kh'], ['Qh', '7h', '2c'], top_range(0.2))
+    print(f"Currently {CATEGORY_NAMES[outs.category]}")
+    for cat, cards in outs.by_category.items():
+        print(f"{CATEGORY_NAMES[cat]}".ljust(20, '.') + f"{' '.join(cards)}".rjust(57))
+    print(f"Clean: {outs.clean}\nTainted: {outs.tainted}")
+    print(f"Rule of 4: {outs.rule_odds:.3f}, next card: {outs.next_card_odds:.3f}, "
+          f"by the river: {outs.river_odds:.3f}")
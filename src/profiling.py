@@ -0,0 +1,277 @@
+"""
+Profiling of bot runs.
+
+A :class:`Profiler` handed to :meth:`bot.Bot.run` profiles a window of the
+frame loop, given in frames and/or seconds after skipping the first frames,
+and then ends the run. Two modes are available:
+
+- ``cprofile``: deterministic, every call is counted. Writes ``profile.pstats``
+  and collapsed stacks rebuilt from the caller graph, so the time of a function
+  called from several places is split by how much each caller spent in it.
+- ``sampling``: a thread samples the frame loop's stack every ``interval``
+  seconds. Barely slows the run down and the collapsed stacks are exact, but
+  there is no pstats file.
+
+Both write ``profile.collapsed`` (``flamegraph.pl`` / speedscope input) and
+``summary.txt``: time per frame in each stage of the loop and the top functions
+by cumulative time. :func:`add_arguments` and :func:`from_args` give entry
+points the same command line switches.
+"""
+
+__all__ = [
+    'MODES',
+    'Profiler',
+    'add_arguments',
+    'from_args',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import argparse
+import cProfile
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from types import CodeType
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+PROFILES_PATH = Path(__file__).parent.parent.resolve() / 'temp' / 'profiles'
+
+MODES = ('cprofile', 'sampling')
+
+# A function as pstats names it: (filename, first line, name)
+Function = Tuple[str, int, str]
+
+# Deeper call paths are cut off when rebuilding stacks from the caller graph
+MAX_DEPTH = 64
+
+# So are paths holding less than this share of the profiled time, whose number grows
+# exponentially with the depth of a large caller graph
+MIN_SHARE = 1e-4
+
+
+def _key(code: CodeType) -> Function:
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def _label(function: Function) -> str:
+    filename, line, name = function
+    if filename == '~':
+        return name  # builtins, e.g. "<built-in method numpy.core...>"
+    return f"{Path(filename).stem}.{name}:{line}"
+
+
+class Profiler:
+    """Profile a window of a bot run and write the results to a directory.
+
+    :param path: Directory for the results, a new timestamped one under ``temp/profiles`` if None
+    :param mode: One of :data:`MODES`
+    :param frames: Frames to profile, unlimited if None
+    :param seconds: Seconds to profile, unlimited if None
+    :param skip: Frames to run before profiling starts, e.g. to leave out warmup
+    :param interval: Seconds between stack samples in ``sampling`` mode
+    :param top: Functions listed in the summary
+    """
+
+    def __init__(self, path: Path = None, mode: str = 'cprofile', frames: int = None,
+                 seconds: float = None, skip: int = 0, interval: float = 0.001, top: int = 30):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+        self.path = Path(path) if path is not None \
+            else PROFILES_PATH / datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.mode = mode
+        self.frames = frames
+        self.seconds = seconds
+        self.skip = skip
+        self.interval = interval
+        self.top = top
+        self.stages: Dict[str, Function] = {}
+        self.frames_seen = 0
+        self.frames_profiled = 0
+        self.elapsed = 0.0
+        self.is_profiling = False
+        self.is_done = False
+        self._start = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._samples: Counter = Counter()
+        self._sampler: Optional[threading.Thread] = None
+        self._target: Optional[int] = None
+
+    def start(self, stages: Dict[str, Callable] = None):
+        """Called by the profiled loop before its first frame.
+
+        :param stages: Functions making up the loop by stage name, broken down in the summary
+        """
+        for name, func in (stages or {}).items():
+            func = getattr(func, '__func__', func)
+            self.stages[name] = _key(func.__code__)
+        if self.skip == 0:
+            self._begin()
+
+    def frame(self) -> bool:
+        """Called by the profiled loop after each frame, False once the window is over."""
+        self.frames_seen += 1
+        if self.is_profiling:
+            self.frames_profiled += 1
+            if (self.frames is not None and self.frames_profiled >= self.frames) or \
+                    (self.seconds is not None
+                     and time.perf_counter() - self._start >= self.seconds):
+                self.stop()
+        elif not self.is_done and self.frames_seen >= self.skip:
+            self._begin()
+        return not self.is_done
+
+    def _begin(self):
+        self.is_profiling = True
+        self._start = time.perf_counter()
+        if self.mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._target = threading.get_ident()
+            self._sampler = threading.Thread(target=self._sample, name='Profiler', daemon=True)
+            self._sampler.start()
+
+    def stop(self):
+        """End profiling, if it is on, and write the results."""
+        if not self.is_profiling:
+            return
+        self.is_profiling = False
+        self.is_done = True
+        self.elapsed = time.perf_counter() - self._start
+        if self._profile is not None:
+            self._profile.disable()
+        else:
+            self._sampler.join()
+        self.write()
+
+    def _sample(self):
+        while self.is_profiling:
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(_key(frame.f_code))
+                frame = frame.f_back
+            self._samples[tuple(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def stacks(self) -> Dict[Tuple[Function, ...], float]:
+        """Seconds spent in each call stack, outermost call first."""
+        if self.mode == 'sampling':
+            total = sum(self._samples.values())
+            per_sample = self.elapsed / total if total else 0.0
+            return {stack: count * per_sample for stack, count in self._samples.items()}
+        return _rebuild_stacks(pstats.Stats(self._profile).stats)
+
+    def functions(self) -> Dict[Function, Tuple[int, float, float]]:
+        """Calls (0 when sampled), cumulative seconds and own seconds of each function."""
+        if self.mode == 'cprofile':
+            return {function: (nc, ct, tt) for function, (cc, nc, tt, ct, callers)
+                    in pstats.Stats(self._profile).stats.items()}
+        totals: Dict[Function, List[float]] = {}
+        for stack, seconds in self.stacks().items():
+            for function in set(stack):
+                totals.setdefault(function, [0, 0.0, 0.0])[1] += seconds
+            totals[stack[-1]][2] += seconds
+        return {function: tuple(values) for function, values in totals.items()}
+
+    def summary(self) -> str:
+        functions = self.functions()
+        frames = max(self.frames_profiled, 1)
+        lines = [
+            f"{self.mode} profile of {self.frames_profiled} frames in {self.elapsed:.2f}s "
+            f"({self.frames_profiled / self.elapsed if self.elapsed else 0:.1f} fps)",
+            '',
+            f"{'stage':<24}{'ms/frame':>10}{'share':>8}",
+        ]
+        for name, function in self.stages.items():
+            calls, cumulative, own = functions.get(function, (0, 0.0, 0.0))
+            share = cumulative / self.elapsed if self.elapsed else 0.0
+            lines.append(f"{name:<24}{cumulative / frames * 1e3:>10.3f}{share:>8.1%}")
+        lines += ['', f"{'cumulative s':>12}{'own s':>10}{'calls':>10}  function"]
+        ranked = sorted(functions.items(), key=lambda item: item[1][1], reverse=True)
+        for function, (calls, cumulative, own) in ranked[:self.top]:
+            lines.append(f"{cumulative:>12.3f}{own:>10.3f}{calls or '':>10}  {_label(function)}")
+        return '\n'.join(lines)
+
+    def write(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        if self._profile is not None:
+            self._profile.dump_stats(self.path / 'profile.pstats')
+        with open(self.path / 'profile.collapsed', 'w') as f:
+            for stack, seconds in self.stacks().items():
+                # Integer microseconds, as flamegraph tools expect whole sample counts
+                if (weight := round(seconds * 1e6)) > 0:
+                    f.write(f"{';'.join(_label(function) for function in stack)} {weight}\n")
+        summary = self.summary()
+        (self.path / 'summary.txt').write_text(summary + '\n')
+        logger.info(f"Profile written to {self.path}\n{summary}")
+
+
+def _rebuild_stacks(stats: dict) -> Dict[Tuple[Function, ...], float]:
+    """Approximate call stacks from a pstats caller graph.
+
+    Every path from the outermost calls down is followed, each function's own time
+    split over its paths in proportion to the time each caller spent in it. Paths under
+    :data:`MIN_SHARE` of the total are left out.
+    """
+    callees: Dict[Function, List[Function]] = {}
+    for function, (cc, nc, tt, ct, callers) in stats.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(function)
+    roots = [function for function, (cc, nc, tt, ct, callers) in stats.items()
+             if not callers or all(caller not in stats for caller in callers)]
+
+    min_seconds = sum(stats[root][3] for root in roots) * MIN_SHARE
+    stacks: Dict[Tuple[Function, ...], float] = {}
+
+    def visit(stack: Tuple[Function, ...], seconds: float):
+        function = stack[-1]
+        own, cumulative = stats[function][2], stats[function][3]
+        if cumulative <= 0:
+            return
+        scale = seconds / cumulative
+        stacks[stack] = stacks.get(stack, 0.0) + own * scale
+        if len(stack) >= MAX_DEPTH:
+            return
+        for callee in callees.get(function, ()):
+            if callee in stack:
+                continue  # recursion, its time is already in the outer call
+            spent = stats[callee][4][function][3] * scale
+            if spent > min_seconds:
+                visit(stack + (callee,), spent)
+
+    for root in roots:
+        visit((root,), stats[root][3])
+    return stacks
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    """Add the profiling switches to an entry point's parser."""
+    group = parser.add_argument_group('profiling')
+    group.add_argument('--profile', nargs='?', const='', metavar='DIR',
+                       help='profile the run, writing to DIR (default a new directory under '
+                            'temp/profiles)')
+    group.add_argument('--profile-mode', choices=MODES, default='cprofile')
+    group.add_argument('--profile-frames', type=int, metavar='N',
+                       help='stop after profiling N frames')
+    group.add_argument('--profile-seconds', type=float, metavar='S',
+                       help='stop after profiling for S seconds')
+    group.add_argument('--profile-skip', type=int, default=0, metavar='N',
+                       help='run N frames before profiling starts')
+
+
+def from_args(args: argparse.Namespace) -> Optional[Profiler]:
+    """The :class:`Profiler` the switches from :func:`add_arguments` ask for, if any."""
+    if args.profile is None:
+        return None
+    return Profiler(args.profile or None, args.profile_mode, args.profile_frames,
+                    args.profile_seconds, args.profile_skip)
@@ -0,0 +1,220 @@
+"""
+Push/fold equilibrium for short stacks.
+
+With every player all-in or folding, a hand reduces to a matrix game over the
+169 preflop classes, played on the class against class equity matrix of
+:mod:`equity`. Both sides are solved by fictitious play: every iteration takes a
+best response to the opponents' average strategies, computed for all classes and
+all stack depths at once with a handful of matrix products.
+
+Heads-up is exact. With more players the first player in pushes and each player
+behind calls or folds as if they were the only one who could call, so overcalls
+and the card removal of the players who folded in between are ignored.
+
+Push and call ranges are fitted to a percentile threshold, so a hand is in them
+exactly when :meth:`hand.Hand.in_range` says so.
+"""
+
+__all__ = [
+    'POSITIONS',
+    'PushFoldChart',
+    'solve',
+    'pushfold_chart',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+import artifacts
+from equity import N_CLASSES, preflop_equity_matrix
+from hand import HAND_RANKS_CSV, Hand, hand_ranks
+from ranges import COMBO_CLASSES
+
+# Seat names from the first to act, the last n are used at an n handed table.
+POSITIONS = ('UTG', 'UTG+1', 'UTG+2', 'LJ', 'HJ', 'CO', 'BTN', 'SB', 'BB')
+
+# Effective stacks in big blinds.
+STACKS = np.arange(1.0, 20.5, 0.5)
+
+SMALL_BLIND = 0.5
+BIG_BLIND = 1.0
+
+_SOURCES = [Path(__file__).resolve(), Path(__file__).with_name('equity.py').resolve(),
+            HAND_RANKS_CSV]
+
+
+def _blinds(n_players: int) -> np.ndarray:
+    blinds = np.zeros(n_players)
+    blinds[-2:] = SMALL_BLIND, BIG_BLIND
+    return blinds
+
+
+def _percentile_thresholds(ranges: np.ndarray) -> np.ndarray:
+    """Percentile threshold of every class frequency vector in ``ranges`` (..., 169).
+
+    The threshold selects the classes at or above it whose combos best cover the
+    range, and is infinite when folding everything fits best.
+    """
+    percentile = hand_ranks()['percentile']
+    combos = np.bincount(COMBO_CLASSES, minlength=N_CLASSES).astype(np.float64)
+    candidates = np.append(np.unique(percentile), np.inf)
+    selected = (percentile[None, :] >= candidates[:, None]).astype(np.float64)
+    # Combos wrongly left out plus combos wrongly put in, for every candidate
+    missed = (1 - selected) @ (combos * ranges)[..., None]
+    extra = selected @ (combos * (1 - ranges))[..., None]
+    return candidates[np.argmin((missed + extra)[..., 0], axis=-1)]
+
+
+def _solve_pusher(pusher: int, n_players: int, stacks: np.ndarray, ante: float,
+                  iterations: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Fictitious play between the first player in and every player behind.
+
+    :return: (push frequencies (stacks, 169), call frequencies of the players behind
+        (callers, stacks, 169), largest best response gain per stack in big blinds)
+    """
+    matrix = preflop_equity_matrix()
+    counts = matrix.counts.astype(np.float64)
+    weighted_equity = counts * matrix.equity
+    class_counts = counts.sum(axis=1)
+    combos = np.bincount(COMBO_CLASSES, minlength=N_CLASSES).astype(np.float64)
+
+    blinds = _blinds(n_players)
+    callers = np.arange(pusher + 1, n_players)
+    pot = blinds.sum() + n_players * ante
+    stack = stacks[:, None]
+    # Pot when called, every dead blind and ante included
+    called_pot = (2 * stack)[None] + (pot - blinds[pusher] - blinds[callers])[:, None, None]
+    fold_value = -blinds[pusher]
+    steal_value = pot - blinds[pusher]
+
+    push = np.full((len(stacks), N_CLASSES), 0.5)
+    call = np.full((len(callers), len(stacks), N_CLASSES), 0.5)
+
+    def values(push, call):
+        # Pusher holding class i against each caller's range
+        call_chance = (call @ counts.T) / class_counts
+        showdown = (called_pot * (call @ weighted_equity.T) - stack * (call @ counts.T)) \
+            / class_counts
+        reach = np.cumprod(np.concatenate((np.ones_like(call[:1]), 1 - call_chance[:-1])), axis=0)
+        push_value = reach[-1] * (1 - call_chance[-1]) * steal_value + (reach * showdown).sum(axis=0)
+        # Caller holding class j against the pushing range, alone to act
+        facing = push @ counts.T
+        call_value = np.where(facing > 0, called_pot * (push @ weighted_equity.T)
+                              / np.maximum(facing, 1e-12) - stack, -np.inf)
+        return push_value, call_value
+
+    for t in range(1, iterations + 1):
+        push_value, call_value = values(push, call)
+        best_push = (push_value > fold_value).astype(np.float64)
+        best_call = (call_value > -blinds[callers][:, None, None]).astype(np.float64)
+        push += (best_push - push) / (t + 1)
+        call += (best_call - call) / (t + 1)
+
+    # How much a best response would still gain against the average strategies
+    push_value, call_value = values(push, call)
+    push_gain = (np.maximum(push_value, fold_value)
+                 - (push * push_value + (1 - push) * fold_value)) @ combos / combos.sum()
+    fold_values = -blinds[callers][:, None, None]
+    facing = np.where(np.isfinite(call_value), call_value, fold_values)
+    call_gain = (np.maximum(facing, fold_values)
+                 - (call * facing + (1 - call) * fold_values)) @ combos / combos.sum()
+    gain = np.maximum(push_gain, call_gain.max(axis=0))
+    return push, call, gain
+
+
+def solve(n_players: int = 2, stacks: np.ndarray = STACKS, ante: float = 0.0,
+          iterations: int = 2000) -> Dict[str, np.ndarray]:
+    """Push and call frequencies for every first-in position and stack depth.
+
+    :param n_players: Players dealt in, 2 to 9
+    :param stacks: Effective stacks in big blinds
+    :param ante: Ante each player posts, in big blinds
+    :param iterations: Fictitious play iterations
+    :return: ``push`` (pushers, stacks, 169), ``call`` (pushers, players, stacks, 169),
+        their percentile thresholds, ``gain`` the largest best response gain per stack
+    """
+    if not 2 <= n_players <= len(POSITIONS):
+        raise ValueError(f"push/fold needs 2 to {len(POSITIONS)} players, got {n_players}")
+    stacks = np.asarray(stacks, dtype=np.float64)
+    n_pushers = n_players - 1
+    push = np.zeros((n_pushers, len(stacks), N_CLASSES))
+    call = np.zeros((n_pushers, n_players, len(stacks), N_CLASSES))
+    gain = np.zeros(len(stacks))
+    for pusher in range(n_pushers):
+        push[pusher], call[pusher, pusher + 1:], pusher_gain = \
+            _solve_pusher(pusher, n_players, stacks, ante, iterations)
+        gain = np.maximum(gain, pusher_gain)
+    return {
+        'stacks': stacks,
+        'push': push.astype(np.float32),
+        'call': call.astype(np.float32),
+        'push_percentile': _percentile_thresholds(push),
+        'call_percentile': _percentile_thresholds(call),
+        'gain': gain,
+    }
+
+
+class PushFoldChart:
+    """Solved push/fold ranges of an n handed table, looked up at the nearest stack."""
+
+    def __init__(self, n_players: int, arrays: Dict[str, np.ndarray]):
+        self.n_players = n_players
+        self.positions = POSITIONS[-n_players:]
+        self.arrays = arrays
+        self.stacks = arrays['stacks']
+
+    def _stack_index(self, stack: float) -> int:
+        return int(np.abs(self.stacks - stack).argmin())
+
+    def _position(self, position: str) -> int:
+        return self.positions.index(position)
+
+    def push_percentile(self, position: str, stack: float) -> float:
+        """Threshold for :meth:`hand.Hand.in_range` of the hands to push first in."""
+        return float(self.arrays['push_percentile'][self._position(position),
+                                                    self._stack_index(stack)])
+
+    def call_percentile(self, pusher: str, caller: str, stack: float) -> float:
+        """Threshold for :meth:`hand.Hand.in_range` of the hands to call a push with."""
+        return float(self.arrays['call_percentile'][self._position(pusher),
+                                                    self._position(caller),
+                                                    self._stack_index(stack)])
+
+    def should_push(self, cards: List[str], position: str, stack: float) -> bool:
+        return Hand(cards).in_range(self.push_percentile(position, stack))
+
+    def should_call(self, cards: List[str], pusher: str, caller: str, stack: float) -> bool:
+        return Hand(cards).in_range(self.call_percentile(pusher, caller, stack))
+
+
+_charts: Dict[Tuple[int, float], PushFoldChart] = {}
+
+
+def pushfold_chart(n_players: int = 2, ante: float = 0.0) -> PushFoldChart:
+    """The shared chart over 1 - 20 big blinds, solved once into the artifact cache."""
+    key = (n_players, ante)
+    if key not in _charts:
+        name = f'pushfold_{n_players}max' + (f'_ante{ante:g}' if ante else '')
+        arrays = artifacts.load(name, lambda: solve(n_players, ante=ante), _SOURCES)
+        _charts[key] = PushFoldChart(n_players, arrays)
+    return _charts[key]
+
+
+if __name__ == '__main__':
+    import time
+
+    preflop_equity_matrix()
+    start = time.perf_counter()
+    arrays = solve()
+    print(f"Solved heads-up over {len(STACKS)} stacks in {time.perf_counter() - start:.2f}s, "
+          f"largest best response gain {arrays['gain'].max():.4f}bb")
+    chart = pushfold_chart()
+    for stack in (2, 5, 10, 15, 20):
+        print(f"{stack:>2}bb  push top {1 - chart.push_percentile('SB', stack):.0%}".ljust(24)
+              + f"call top {1 - chart.call_percentile('SB', 'BB', stack):.0%}")
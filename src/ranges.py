@@ -0,0 +1,103 @@
+"""
+Hand ranges.
+
+A range is a weight for each of the 1326 two card combos in :data:`COMBOS`
+order. Ranges built from a percentile select the same hands as
+:meth:`hand.Hand.in_range`.
+"""
+
+__all__ = [
+    'COMBOS',
+    'COMBO_MASKS',
+    'COMBO_CLASSES',
+    'combo_index',
+    'class_name',
+    'in_range_weights',
+    'top_range',
+    'class_range',
+    'remove_dead',
+    'permute_range',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from itertools import combinations
+from typing import Iterable
+
+import numpy as np
+
+from cards import RANKS, SUIT_PERMUTATIONS, card_code, permute_suits, to_mask
+from hand import hand_index, hand_ranks
+
+# (1326, 2) card codes, lower code first.
+COMBOS = np.array(list(combinations(range(52), 2)), dtype=np.int8)
+COMBO_MASKS = to_mask(COMBOS)
+
+_COMBO_INDEX = np.full((52, 52), -1, dtype=np.int16)
+_COMBO_INDEX[COMBOS[:, 0], COMBOS[:, 1]] = np.arange(len(COMBOS))
+_COMBO_INDEX[COMBOS[:, 1], COMBOS[:, 0]] = np.arange(len(COMBOS))
+
+
+def class_name(c1: int, c2: int) -> str:
+    """Preflop class of two card codes, e.g. ``'AKs'``, as named in ``hand_ranks.csv``."""
+    r1, r2 = sorted((c1 % 13, c2 % 13), reverse=True)
+    if r1 == r2:
+        return RANKS[r1] * 2
+    return RANKS[r1] + RANKS[r2] + ('s' if c1 // 13 == c2 // 13 else 'o')
+
+
+# Row in hand_ranks() of each combo's class.
+COMBO_CLASSES = np.array([hand_index(class_name(c1, c2)) for c1, c2 in COMBOS.tolist()],
+                         dtype=np.int16)
+
+
+def combo_index(c1, c2):
+    """Index into :data:`COMBOS` of two card codes (or arrays of them), in either order."""
+    return _COMBO_INDEX[c1, c2]
+
+
+def in_range_weights(percentile: float) -> np.ndarray:
+    """Weights selecting every combo whose class is in range at ``percentile`` (0.0 - 1.0)."""
+    return (hand_ranks()['percentile'][COMBO_CLASSES] >= percentile).astype(np.float64)
+
+
+def top_range(fraction: float) -> np.ndarray:
+    """The top ``fraction`` of hands by Sklansky-Chubukov ranking."""
+    return in_range_weights(1.0 - fraction)
+
+
+def class_range(hands: Iterable[str]) -> np.ndarray:
+    """Weights selecting the combos of classes (``'AKs'``) or exact hands (``'AhKh'``)."""
+    weights = np.zeros(len(COMBOS))
+    for hand in hands:
+        if len(hand) == 4:
+            weights[combo_index(card_code(hand[:2]), card_code(hand[2:]))] = 1.0
+        else:
+            weights[COMBO_CLASSES == hand_index(hand)] = 1.0
+    return weights
+
+
+def remove_dead(weights: np.ndarray, dead_mask: int) -> np.ndarray:
+    """Zero the weight of combos holding a dead card."""
+    return np.where(COMBO_MASKS & np.uint64(dead_mask), 0.0, weights)
+
+
+# Row p holds, for every combo, the combo it becomes under SUIT_PERMUTATIONS[p].
+_PERMUTED_COMBOS = np.stack([
+    combo_index(permute_suits(COMBOS[:, 0], perm), permute_suits(COMBOS[:, 1], perm))
+    for perm in SUIT_PERMUTATIONS
+])
+
+
+def permute_range(weights: np.ndarray, perm: int) -> np.ndarray:
+    """A range with its suits relabelled by row ``perm`` of :data:`cards.SUIT_PERMUTATIONS`."""
+    permuted = np.empty_like(weights)
+    permuted[_PERMUTED_COMBOS[perm]] = weights
+    return permuted
+
+
+if __name__ == '__main__':
+    for fraction in (0.05, 0.1, 0.25, 0.5, 1.0):
+        print(f"top {fraction:.0%}".ljust(12, '.') + f"{top_range(fraction).sum():.0f} combos".rjust(14))
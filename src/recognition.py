@@ -0,0 +1,278 @@
+"""
+Card recognition.
+
+Templates and their hashes are rendered once per crop size, so a crop is matched
+at its native size and recognition never resizes at runtime. Whole card
+templates are matched by :class:`CardTemplates`; :class:`GlyphTemplates` matches
+the rank glyph and the suit symbol separately against 13 + 4 binarized templates.
+"""
+
+__all__ = [
+    'CardTemplates',
+    'GlyphTemplates',
+    'CardRecognizer',
+    'MATCHERS',
+    'load_card_images',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+import artifacts
+from cards import RANKS, SUITS
+from classifier import CardClassifier
+from layout import LayoutProfile
+from lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+imagehash = lazy_import('imagehash')
+Image = lazy_import('PIL.Image')
+
+CARD_IMAGES_PATH = Path(__file__).parent.joinpath('images', 'cards').resolve()
+
+# Mean absolute difference per channel above which the best match is rejected.
+MAX_PIXEL_DIFF = 1000 * 255 / (35 * 42 * 3)
+
+# (x, y, width, height) of the rank glyph and the suit symbol, as fractions of the crop.
+RANK_REGION = (0.0, 0.0, 0.72, 0.45)
+SUIT_REGION = (0.2, 0.48, 0.8, 0.52)
+
+# Darkest channel below which a pixel is ink (red or black), and above which it's card face.
+INK_LEVEL = 150
+FACE_LEVEL = 200
+
+# A crop less than this much card face holds no card.
+MIN_FACE_FRACTION = 0.4
+
+# Fraction of differing pixels above which the best glyph match is rejected.
+MAX_GLYPH_DIFF = 0.2
+
+# Pixels (of a base 35 x 42 hole card) glyphs may sit off their place.
+MAX_GLYPH_SHIFT = 2
+
+_templates: Dict[Tuple[int, int], 'CardTemplates'] = {}
+_glyphs: Dict[Tuple[int, int], 'GlyphTemplates'] = {}
+
+
+def card_image_files() -> List[Path]:
+    return sorted(CARD_IMAGES_PATH.glob('*'))
+
+
+def load_card_images() -> Dict[str, np.ndarray]:
+    """Card name -> BGR template image, decoded from the jpg files."""
+    return {file.stem: cv2.imread(str(file), cv2.IMREAD_COLOR) for file in card_image_files()}
+
+
+def phash_key(img: np.ndarray) -> int:
+    """The 64 bit perceptual hash of a BGR image as an int."""
+    bits = imagehash.phash(Image.fromarray(img)).hash
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def render_templates(size: Tuple[int, int]) -> Dict[str, np.ndarray]:
+    """Build the arrays of a :class:`CardTemplates` artifact."""
+    images = load_card_images()
+    rendered = np.stack([
+        img if img.shape[1::-1] == size else cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+        for img in images.values()
+    ])
+    return {
+        'names': np.array(list(images)),
+        'images': rendered,
+        'hashes': np.array([phash_key(img) for img in rendered], dtype=np.uint64),
+    }
+
+
+class CardTemplates:
+    """The card templates and their phashes at one (width, height) crop size."""
+
+    def __init__(self, size: Tuple[int, int], names: np.ndarray, images: np.ndarray,
+                 hashes: np.ndarray):
+        self.size = size
+        self.names = names.tolist()
+        self.images = images
+        self._diff_images = images.astype(np.int16)
+        self.hashes = {int(key): name for key, name in zip(hashes, self.names)}
+
+    @classmethod
+    def at_size(cls, size: Tuple[int, int]) -> 'CardTemplates':
+        """Shared templates for a crop size, loaded from the artifact cache on first use."""
+        if size not in _templates:
+            arrays = artifacts.load(
+                f'templates_{size[0]}x{size[1]}', lambda: render_templates(size),
+                card_image_files() + [Path(__file__)])
+            _templates[size] = cls(size, **arrays)
+        return _templates[size]
+
+    def match(self, img: np.ndarray) -> str:
+        """Name of the card in ``img``, or an empty string if nothing is close enough."""
+        try:
+            return self.hashes[phash_key(img)]
+        except KeyError:
+            return self.best_match(img)
+
+    def best_match(self, img: np.ndarray) -> str:
+        diffs = np.abs(self._diff_images - img).mean(axis=(1, 2, 3))
+        best = int(np.argmin(diffs))
+        if diffs[best] > MAX_PIXEL_DIFF:
+            return ""
+        return self.names[best]
+
+
+def _region(size: Tuple[int, int],
+            region: Tuple[float, float, float, float]) -> Tuple[slice, slice]:
+    """(rows, columns) of a region in a (width, height) crop."""
+    w, h = size
+    x, y, rw, rh = region
+    return slice(round(y * h), round((y + rh) * h)), slice(round(x * w), round((x + rw) * w))
+
+
+def _stride(size: Tuple[int, int]) -> int:
+    """Side of the pixel blocks glyphs are matched on, keeping large crops under twice the
+    resolution of a base hole card."""
+    return max(1, size[0] // 35)
+
+
+def _pooled_size(size: Tuple[int, int]) -> Tuple[int, int]:
+    return size[0] // _stride(size), size[1] // _stride(size)
+
+
+def _search(size: Tuple[int, int]) -> int:
+    """Pooled pixels a glyph is searched for around its place."""
+    return max(1, round(MAX_GLYPH_SHIFT * size[0] / 35 / _stride(size)))
+
+
+def binarize(img: np.ndarray, stride: int = 1) -> np.ndarray:
+    """Ink mask of a BGR image, red and black ink alike, as float32.
+
+    With a ``stride`` each stride x stride block becomes one pixel holding its ink fraction.
+    """
+    # Far faster than img.min(axis=2), reducing a 3 long axis is mostly overhead
+    ink = np.minimum(np.minimum(img[..., 0], img[..., 1]), img[..., 2]) < INK_LEVEL
+    if stride == 1:
+        return ink.astype(np.float32)
+    h, w = ink.shape[0] // stride, ink.shape[1] // stride
+    blocks = ink[:h * stride, :w * stride].reshape(h, stride, w, stride)
+    return blocks.sum(axis=(1, 3), dtype=np.float32) / (stride * stride)
+
+
+def render_glyphs(size: Tuple[int, int]) -> Dict[str, np.ndarray]:
+    """Build the arrays of a :class:`GlyphTemplates` artifact.
+
+    Each rank template is the majority ink of that rank's four cards, and each suit
+    template that of its thirteen cards, so the 52 card images reduce to 17 glyphs.
+    """
+    images = load_card_images()
+    resized = {name: img if img.shape[1::-1] == size
+               else cv2.resize(img, size, interpolation=cv2.INTER_AREA)
+               for name, img in images.items()}
+    masks = {name: binarize(img, _stride(size)) for name, img in resized.items()}
+
+    def glyph(names: List[str], region) -> np.ndarray:
+        rows, columns = _region(_pooled_size(size), region)
+        return np.mean([masks[name][rows, columns] for name in names], axis=0) > 0.5
+
+    return {
+        'ranks': np.stack([glyph([rank + suit for suit in SUITS], RANK_REGION) for rank in RANKS]),
+        'suits': np.stack([glyph([rank + suit for rank in RANKS], SUIT_REGION) for suit in SUITS]),
+    }
+
+
+class GlyphTemplates:
+    """Binarized rank and suit templates at one (width, height) crop size.
+
+    Each glyph is looked for at every offset up to a few pixels around its place, all
+    offsets and templates scored by one matrix multiply: with binary templates, the
+    difference of a window and a template is ``|window| + |template| - 2 window . template``.
+    Large crops are matched on pooled pixel blocks.
+    """
+
+    def __init__(self, size: Tuple[int, int], ranks: np.ndarray, suits: np.ndarray):
+        self.size = size
+        self.stride = _stride(size)
+        self.search = _search(size)
+        self.glyphs = []
+        for templates, region in ((ranks, RANK_REGION), (suits, SUIT_REGION)):
+            rows, columns = _region(_pooled_size(size), region)
+            flat = templates.reshape(len(templates), -1).astype(np.float32)
+            # The region in the crop padded by ``search`` on every side
+            window = (slice(rows.start, rows.stop + 2 * self.search),
+                      slice(columns.start, columns.stop + 2 * self.search))
+            self.glyphs.append((window, templates.shape[1:], flat.T.copy(), flat.sum(axis=1)))
+
+    @classmethod
+    def at_size(cls, size: Tuple[int, int]) -> 'GlyphTemplates':
+        """Shared templates for a crop size, loaded from the artifact cache on first use."""
+        if size not in _glyphs:
+            arrays = artifacts.load(
+                f'glyphs_{size[0]}x{size[1]}', lambda: render_glyphs(size),
+                card_image_files() + [Path(__file__)])
+            _glyphs[size] = cls(size, **arrays)
+        return _glyphs[size]
+
+    def match(self, img: np.ndarray) -> str:
+        """Name of the card in ``img``, or an empty string if nothing is close enough."""
+        face = np.minimum(np.minimum(img[::4, ::4, 0], img[::4, ::4, 1]), img[::4, ::4, 2])
+        if np.count_nonzero(face > FACE_LEVEL) < MIN_FACE_FRACTION * face.size:
+            return ""
+        glyphs = binarize(img, self.stride)
+        s = self.search
+        ink = np.zeros((glyphs.shape[0] + 2 * s, glyphs.shape[1] + 2 * s), dtype=np.float32)
+        ink[s:-s, s:-s] = glyphs
+        found = []
+        for window, shape, templates, template_ink in self.glyphs:
+            windows = np.lib.stride_tricks.sliding_window_view(ink[window], shape)
+            windows = windows.reshape(-1, shape[0] * shape[1])
+            diffs = windows.sum(axis=1)[:, None] + template_ink - 2 * (windows @ templates)
+            position, best = np.unravel_index(np.argmin(diffs), diffs.shape)
+            if diffs[position, best] > MAX_GLYPH_DIFF * windows.shape[1]:
+                return ""
+            found.append(best)
+        return RANKS[found[0]] + SUITS[found[1]]
+
+
+# Ways of matching a crop, each a class with ``at_size(size)`` and ``match(img)``.
+MATCHERS = {
+    'templates': CardTemplates,
+    'classifier': CardClassifier,
+    'glyphs': GlyphTemplates,
+}
+
+
+class CardRecognizer:
+    """Recognize hole and community card crops for a layout profile.
+
+    :param method: Key of the :data:`MATCHERS` entry to use
+    """
+
+    def __init__(self, profile: LayoutProfile, method: str = 'templates'):
+        if method not in MATCHERS:
+            raise ValueError(f"method must be one of {list(MATCHERS)}, got {method!r}")
+        self.profile = profile
+        self.method = method
+        self.hole = MATCHERS[method].at_size(profile.hole_card_size)
+        self.board = MATCHERS[method].at_size(profile.board_card_size)
+
+    def hole_card(self, img: np.ndarray) -> str:
+        return self.hole.match(img)
+
+    def community_card(self, img: np.ndarray) -> str:
+        return self.board.match(img)
+
+
+def build_artifacts():
+    """Render the templates and train the classifiers of every layout profile ahead of time."""
+    from layout import PROFILES
+    for profile in PROFILES.values():
+        for method in MATCHERS:
+            CardRecognizer(profile, method)
+
+
+if __name__ == '__main__':
+    build_artifacts()
@@ -0,0 +1,219 @@
+"""
+Annotated debug recording.
+
+The frame loop hands each frame and what the bot made of it (element boxes,
+recognized cards, state transitions) to :meth:`DebugRecorder.submit`, which only
+queues them. A background thread draws the overlay and encodes it with
+``cv2.VideoWriter``, or writes an image sequence when the target is a
+directory. The queue is bounded: when the writer falls behind, frames are
+dropped by the chosen policy instead of stalling the loop. Frames submitted to be
+written as their own image file were asked for explicitly, so they wait in a
+queue of their own that is never dropped from.
+"""
+
+__all__ = [
+    'Annotations',
+    'DebugRecorder',
+    'DROP_POLICIES',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from collections import deque
+from pathlib import Path
+from threading import Condition, Thread
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from lazy import lazy_import
+
+cv2 = lazy_import('cv2')
+
+# 'newest' drops the frame being submitted, 'oldest' evicts the oldest queued frame.
+DROP_POLICIES = ('newest', 'oldest')
+
+VIDEO_CODECS = {'.mp4': 'mp4v', '.avi': 'MJPG', '.mkv': 'XVID'}
+
+BOX_COLOR = (0, 200, 255)
+TEXT_COLOR = (255, 255, 255)
+EVENT_COLOR = (0, 0, 255)
+
+
+class Annotations(NamedTuple):
+    """What to draw over a frame."""
+    boxes: List[Tuple[str, Tuple[int, int, int, int]]] = []
+    lines: List[str] = []
+    events: List[str] = []
+
+
+class DebugRecorder:
+    """Draw annotations over frames and write them on a background thread.
+
+    :param path: Video file (``.mp4``, ``.avi``, ``.mkv``), or a directory for an image
+        sequence
+    :param fps: Frame rate of the video
+    :param max_queue: Recording frames waiting to be written before frames are dropped
+    :param drop: Which frame to drop when the queue is full, see :data:`DROP_POLICIES`
+    """
+
+    def __init__(self, path: Path, fps: float = 10.0, max_queue: int = 64,
+                 drop: str = 'oldest', image_format: str = 'png'):
+        if drop not in DROP_POLICIES:
+            raise ValueError(f"drop must be one of {DROP_POLICIES}, got {drop!r}")
+        self.path = Path(path)
+        self.fps = fps
+        self.max_queue = max_queue
+        self.drop = drop
+        self.image_format = image_format
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self._queue = deque()
+        self._images = deque()
+        self._condition = Condition()
+        self._stopping = False
+        self._thread: Optional[Thread] = None
+        self._writer = None
+
+    @property
+    def is_video(self) -> bool:
+        return self.path.suffix.lower() in VIDEO_CODECS
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running:
+            return
+        if self.is_video:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        else:
+            self.path.mkdir(parents=True, exist_ok=True)
+        self._stopping = False
+        self._thread = Thread(target=self._run, name='DebugRecorder', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Write what is still queued, then close the output."""
+        if self._thread is None:
+            return
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+        logger.info(f"Debug recording {self.path}: {self.written} frames written, "
+                    f"{self.dropped} dropped")
+
+    def submit(self, frame: np.ndarray, annotations: Annotations = Annotations(),
+               filename: Path = None) -> bool:
+        """Queue a frame without waiting on the writer.
+
+        The frame must not be modified afterwards; it is drawn on as a copy.
+
+        :param filename: Write this frame as its own image file instead of into the recording.
+            Such frames are always queued, whatever the drop policy.
+        :return: Whether the frame was queued rather than dropped
+        """
+        with self._condition:
+            self.submitted += 1
+            if filename is not None:
+                self._images.append((frame, annotations, filename))
+                self._condition.notify()
+                return True
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                if self.drop == 'newest':
+                    return False
+                self._queue.popleft()
+            self._queue.append((frame, annotations, None))
+            self._condition.notify()
+        return True
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    while not self._images and not self._queue and not self._stopping:
+                        self._condition.wait()
+                    if not self._images and not self._queue:
+                        break
+                    queue = self._images if self._images else self._queue
+                    frame, annotations, filename = queue.popleft()
+                image = draw(frame, annotations)
+                if filename is not None:
+                    cv2.imwrite(str(filename), image)
+                else:
+                    self._write(image)
+        finally:
+            if self._writer is not None:
+                self._writer.release()
+                self._writer = None
+
+    def _write(self, image: np.ndarray):
+        if not self.is_video:
+            cv2.imwrite(str(self.path / f"{self.written:06d}.{self.image_format}"), image)
+        else:
+            if self._writer is None:
+                fourcc = cv2.VideoWriter_fourcc(*VIDEO_CODECS[self.path.suffix.lower()])
+                self._writer = cv2.VideoWriter(str(self.path), fourcc, self.fps,
+                                               (image.shape[1], image.shape[0]))
+            self._writer.write(image)
+        self.written += 1
+
+
+def draw(frame: np.ndarray, annotations: Annotations) -> np.ndarray:
+    """A BGR copy of the frame with its annotations drawn over it."""
+    image = np.array(frame[..., :3], order='C')
+    for label, (x, y, w, h) in annotations.boxes:
+        cv2.rectangle(image, (x, y), (x + w - 1, y + h - 1), BOX_COLOR, 1)
+        if label:
+            cv2.putText(image, label, (x, max(y - 3, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+                        BOX_COLOR, 1, cv2.LINE_AA)
+    if annotations.lines:
+        width = max(cv2.getTextSize(line, cv2.FONT_HERSHEY_SIMPLEX, 0.45, 1)[0][0]
+                    for line in annotations.lines)
+        cv2.rectangle(image, (0, 0), (width + 12, 8 + 16 * len(annotations.lines)),
+                      (0, 0, 0), cv2.FILLED)
+    for i, line in enumerate(annotations.lines):
+        _text(image, line, (6, 16 + 16 * i), TEXT_COLOR)
+    if annotations.events:
+        # A state change frames the image and is listed at the bottom
+        cv2.rectangle(image, (0, 0), (image.shape[1] - 1, image.shape[0] - 1), EVENT_COLOR, 3)
+        for i, event in enumerate(reversed(annotations.events)):
+            _text(image, event, (6, image.shape[0] - 8 - 16 * i), EVENT_COLOR)
+    return image
+
+
+def _text(image: np.ndarray, text: str, origin: Tuple[int, int], color):
+    # Dark outline so the text reads on any background
+    cv2.putText(image, text, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 0, 0), 3, cv2.LINE_AA)
+    cv2.putText(image, text, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1, cv2.LINE_AA)
+
+
+if __name__ == '__main__':
+    import time
+
+    from synthetic import SyntheticCapture, TableSynthesizer
+    from layout import BASE_PROFILE
+
+    capture = SyntheticCapture(TableSynthesizer(seed=0), 200, frames_per_street=4)
+    recorder = DebugRecorder(Path(__file__).parent.parent / 'temp' / 'debug' / 'synthetic.mp4',
+                             max_queue=16)
+    recorder.start()
+    start = time.perf_counter()
+    while (frame := capture.get_screenshot()) is not None:
+        labels = capture.current
+        boxes = [(card or '', rect) for card, rect in
+                 zip(labels.hole_cards + labels.community_cards,
+                     BASE_PROFILE.h_cards + BASE_PROFILE.c_cards)]
+        recorder.submit(frame, Annotations(boxes, [f"hole {labels.hole_cards}",
+                                                   f"board {labels.community_cards}"]))
+    print(f"Submitted {recorder.submitted} frames in {time.perf_counter() - start:.2f}s")
+    recorder.stop()
+    print(f"{recorder.written} written, {recorder.dropped} dropped")
@@ -0,0 +1,139 @@
+"""
+Reference hand evaluator.
+
+A deliberately slow evaluator written straight from the rules, to check the
+fast paths against. A 5 card hand is ranked by counting its ranks and suits; a
+6 or 7 card hand is worth its best 5 card subset. Values use the encoding of
+:mod:`evaluator`, ``category << 20 | tiebreak``, where the tiebreak packs the
+ranks that decide the hand into nibbles, most significant first: rank groups
+ordered by size then rank (e.g. trips, then kickers), or the top card of a
+straight, counting the wheel as 5 high.
+
+Equity is enumerated over every villain combo and runout with the same
+evaluator, or sampled when that would take too long.
+"""
+
+__all__ = [
+    'hand_value',
+    'five_card_value',
+    'showdown',
+    'river_strength',
+    'sampled_equity',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from collections import Counter
+from itertools import combinations
+from typing import Sequence, Tuple
+
+import numpy as np
+
+from evaluator import (FLUSH, FULL_HOUSE, HIGH_CARD, PAIR, QUADS, STRAIGHT, STRAIGHT_FLUSH,
+                       TRIPS, TWO_PAIR)
+
+ACE, FIVE = 12, 3
+
+# Category of each shape, the rank counts of a hand from largest to smallest
+SHAPES = {
+    (4, 1): QUADS,
+    (3, 2): FULL_HOUSE,
+    (3, 1, 1): TRIPS,
+    (2, 2, 1): TWO_PAIR,
+    (2, 1, 1, 1): PAIR,
+    (1, 1, 1, 1, 1): HIGH_CARD,
+}
+
+
+def _pack(category: int, ranks: Sequence[int]) -> int:
+    value = 0
+    for rank in ranks:
+        value = value << 4 | rank
+    return category << 20 | value
+
+
+def five_card_value(cards: Sequence[int]) -> int:
+    """Value of exactly five card codes."""
+    ranks = [card % 13 for card in cards]
+    is_flush = len({card // 13 for card in cards}) == 1
+
+    descending = sorted(set(ranks), reverse=True)
+    straight_high = None
+    if len(descending) == 5:
+        if descending[0] - descending[4] == 4:
+            straight_high = descending[0]
+        elif descending == [ACE, FIVE, FIVE - 1, FIVE - 2, FIVE - 3]:
+            straight_high = FIVE
+
+    if straight_high is not None:
+        return _pack(STRAIGHT_FLUSH if is_flush else STRAIGHT, [straight_high])
+    if is_flush:
+        return _pack(FLUSH, descending)
+    counts = Counter(ranks)
+    groups = sorted(counts, key=lambda rank: (counts[rank], rank), reverse=True)
+    shape = tuple(counts[rank] for rank in groups)
+    return _pack(SHAPES[shape], groups)
+
+
+def hand_value(cards: Sequence[int]) -> int:
+    """Value of 5 to 7 distinct card codes: the best value of any 5 of them."""
+    cards = [int(card) for card in cards]
+    if not 5 <= len(cards) <= 7 or len(set(cards)) != len(cards):
+        raise ValueError(f"a hand is 5 to 7 distinct cards, got {cards}")
+    return max(five_card_value(five) for five in combinations(cards, 5))
+
+
+def showdown(hero: Sequence[int], villain: Sequence[int], board: Sequence[int]) -> float:
+    """Hero's share of the pot: 1, 0.5 or 0."""
+    hero_value = hand_value(list(hero) + list(board))
+    villain_value = hand_value(list(villain) + list(board))
+    return 1.0 if hero_value > villain_value else 0.5 if hero_value == villain_value else 0.0
+
+
+def river_strength(hole: Sequence[int], board: Sequence[int],
+                   weights: np.ndarray = None) -> float:
+    """Exact equity on a river against every live villain combo, weighted by a range."""
+    from ranges import combo_index
+
+    hole, board = [int(card) for card in hole], [int(card) for card in board]
+    hero_value = hand_value(hole + board)
+    live = [card for card in range(52) if card not in hole + board]
+    shares = total = 0.0
+    for combo in combinations(live, 2):
+        weight = 1.0 if weights is None else float(weights[combo_index(*combo)])
+        if weight:
+            villain_value = hand_value(list(combo) + board)
+            shares += weight * (1.0 if hero_value > villain_value
+                                else 0.5 if hero_value == villain_value else 0.0)
+            total += weight
+    return shares / total
+
+
+def sampled_equity(hole: Sequence[int], board: Sequence[int], trials: int,
+                   rng: np.random.Generator) -> Tuple[float, float]:
+    """Monte Carlo equity against a uniform villain combo, and its standard error."""
+    hole, board = [int(card) for card in hole], [int(card) for card in board]
+    live = np.array([card for card in range(52) if card not in hole + board])
+    shares = np.empty(trials)
+    for trial in range(trials):
+        dealt = rng.choice(live, 2 + 5 - len(board), replace=False).tolist()
+        shares[trial] = showdown(hole, dealt[:2], board + dealt[2:])
+    return float(shares.mean()), float(shares.std() / np.sqrt(trials))
+
+
+if __name__ == '__main__':
+    import time
+
+    from cards import card_codes
+
+    for hand in (['Ah', '2c', '3d', '4s', '5h', 'Kd', 'Kc'], ['9h', '9c', '8d', '8s', '7h', '7d', 'Ac'],
+                 ['Ah', 'Kh', 'Qh', 'Jh', 'Th', '9h', '2c']):
+        print(' '.join(hand), hex(hand_value(card_codes(hand))))
+    rng = np.random.default_rng(0)
+    hands = np.argsort(rng.random((10_000, 52)), axis=1)[:, :7]
+    start = time.perf_counter()
+    for hand in hands:
+        hand_value(hand)
+    print(f"{len(hands) / (time.perf_counter() - start):,.0f} 7 card hands/s")
@@ -0,0 +1,117 @@
+"""
+Terminal status display.
+
+The frame loop only hands over a snapshot of its state; formatting and terminal
+writes happen on a background thread at a fixed refresh rate, and only the lines
+whose text changed since the last refresh are rewritten.
+"""
+
+__all__ = ['StatusRenderer']
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import sys
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional
+
+UP = "\x1B[{}A"
+DOWN = "\x1B[{}B"
+CLR = "\x1B[0K"
+HIDE_CURSOR = "\033[?25l"
+SHOW_CURSOR = "\033[?25h"
+
+
+class StatusRenderer:
+    """Render a block of ``label.....value`` lines on its own thread.
+
+    :param title: Title centered in the header line
+    :param fields: Field names mapped to their labels, in display order
+    :param refresh_rate: Refreshes per second
+    """
+
+    left_width = 20
+    right_width = 57
+
+    def __init__(self, title: str, fields: Dict[str, str], refresh_rate: float = 10.0,
+                 stream=None):
+        self.title = title
+        self.fields = fields
+        self.refresh_rate = refresh_rate
+        self.stream = stream if stream is not None else sys.stdout
+        self._values = dict.fromkeys(fields)
+        self._lock = Lock()
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+        self._lines: List[str] = []
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def update(self, **values):
+        """Replace field values. Cheap enough to call every frame."""
+        with self._lock:
+            self._values.update(values)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def format(self, values: dict) -> List[str]:
+        width = self.left_width + self.right_width
+        lines = [f" {self.title} ".center(width, '-')]
+        for name, label in self.fields.items():
+            lines.append(label.ljust(self.left_width, '.') + f"{values[name]}".rjust(self.right_width))
+        return lines
+
+    def render(self):
+        """Write the lines that changed since the last render."""
+        lines = self.format(self.snapshot())
+        if not self._lines:
+            out = HIDE_CURSOR + ''.join(f"{line}{CLR}\n" for line in lines)
+        else:
+            out = ''
+            for i, (old, new) in enumerate(zip(self._lines, lines)):
+                if old != new:
+                    up = len(lines) - i
+                    out += f"{UP.format(up)}\r{new}{CLR}{DOWN.format(up)}\r"
+        if out:
+            self.stream.write(out)
+            self.stream.flush()
+        self._lines = lines
+
+    def start(self):
+        if self.refresh_rate <= 0 or self.is_running:
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name='StatusRenderer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread after a final render."""
+        if not self.is_running:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self.render()
+        self.stream.write(SHOW_CURSOR)
+        self.stream.flush()
+
+    def _run(self):
+        interval = 1 / self.refresh_rate
+        self.render()
+        while not self._stopped.wait(interval):
+            self.render()
+
+
+if __name__ == '__main__':
+    import time
+
+    renderer = StatusRenderer("Demo", {'tick': 'Tick', 'half': 'Half'}, refresh_rate=5)
+    renderer.start()
+    for tick in range(30):
+        renderer.update(tick=tick, half=tick // 2)
+        time.sleep(0.05)
+    renderer.stop()
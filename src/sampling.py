@@ -0,0 +1,127 @@
+"""
+Batched deck sampling.
+
+:func:`deal` draws ``(n, k)`` cards without replacement in one vectorized call,
+skipping dead cards that are either shared by every row (a 52 bit mask) or given
+per row (an ``(n, m)`` array of codes). Each row is drawn with Floyd's algorithm
+over the indices of its live cards, which only takes k uniforms and k^2 / 2
+comparisons per row; indices then step past the row's sorted dead cards.
+
+Random streams are counter-based (Philox) and keyed by ``(seed, worker)``, so
+parallel workers get independent streams that replay exactly.
+"""
+
+__all__ = [
+    'stream',
+    'streams',
+    'deal',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from typing import List, Union
+
+import numpy as np
+
+from cards import FULL_DECK, mask_to_codes
+
+
+def stream(seed: int = None, worker: int = 0) -> np.random.Generator:
+    """Philox stream ``worker`` of ``seed``, from fresh entropy when ``seed`` is None."""
+    if seed is None:
+        return np.random.Generator(np.random.Philox())
+    return np.random.Generator(np.random.Philox(key=[seed, worker]))
+
+
+def streams(seed: int, n: int) -> List[np.random.Generator]:
+    """Independent streams for ``n`` workers."""
+    return [stream(seed, worker) for worker in range(n)]
+
+
+def _uniforms(n: int, k: int, rng: np.random.Generator, antithetic: bool) -> np.ndarray:
+    """(k, n) uniforms, single precision is plenty to pick one of 52 cards."""
+    if not antithetic:
+        return rng.random((k, n), dtype=np.float32)
+    if n % 2:
+        raise ValueError(f"antithetic deals come in pairs, got {n} rows")
+    half = rng.random((k, n // 2), dtype=np.float32)
+    return np.concatenate((half, 1 - half), axis=1)
+
+
+def _floyd(uniforms: np.ndarray, n_live: int) -> np.ndarray:
+    """(k, n) distinct indices below ``n_live``, one column per column of uniforms."""
+    k, n = uniforms.shape
+    chosen = np.empty((k, n), dtype=np.int32)
+    for i in range(k):
+        j = n_live - k + i
+        pick = np.minimum((uniforms[i] * (j + 1)).astype(np.int32), j)
+        taken = np.zeros(n, dtype=bool)
+        for previous in chosen[:i]:
+            taken |= previous == pick
+        pick[taken] = j
+        chosen[i] = pick
+    return chosen
+
+
+def _skip_dead(indices: np.ndarray, dead: np.ndarray) -> np.ndarray:
+    """Live card codes of (k, n) indices into each row's live cards, ``dead`` sorted per row."""
+    codes = indices.copy()
+    for column in dead.T:
+        codes += codes >= column
+    return codes
+
+
+def deal(n: int, k: int, dead: Union[int, np.ndarray] = 0, rng: np.random.Generator = None,
+         antithetic: bool = False, stratified: bool = False,
+         ordered: bool = False) -> np.ndarray:
+    """Deal ``k`` distinct live cards to each of ``n`` rows.
+
+    :param dead: 52 bit mask of cards dead in every row, or an (n, m) array of each
+        row's distinct dead codes
+    :param rng: Random stream, see :func:`stream`
+    :param antithetic: Rows i and i + n / 2 are dealt from mirrored uniforms
+    :param stratified: The first card of the rows is spread evenly over the live cards
+    :param ordered: Shuffle the cards within each row. Without it only the set of
+        cards in a row is uniform, not which column each card lands in
+    :return: (n, k) int8 card codes
+    """
+    rng = stream() if rng is None else rng
+    if np.ndim(dead) == 0:
+        live = mask_to_codes(FULL_DECK & ~int(dead))
+        dead_codes = None
+        n_live = len(live)
+    else:
+        dead_codes = np.sort(np.asarray(dead, dtype=np.int32), axis=1)
+        n_live = 52 - dead_codes.shape[1]
+    if k > n_live:
+        raise ValueError(f"can't deal {k} cards from {n_live} live cards")
+
+    uniforms = _uniforms(n, k, rng, antithetic)
+    if stratified:
+        # Every live card leads about n / n_live rows, the rest come from what's left
+        first = ((rng.permutation(n) * n_live) // n).astype(np.int32)
+        rest = _floyd(uniforms[1:], n_live - 1)
+        indices = np.concatenate((first[None], rest + (rest >= first)))
+    else:
+        indices = _floyd(uniforms, n_live)
+
+    if dead_codes is None:
+        cards = live[indices.T]
+    else:
+        cards = _skip_dead(indices, dead_codes).T.astype(np.int8)
+    if ordered:
+        cards = np.take_along_axis(cards, np.argsort(rng.random((n, k)), axis=1), axis=1)
+    return cards
+
+
+if __name__ == '__main__':
+    from cards import card_mask, card_names
+
+    rng = stream(7)
+    print(card_names(deal(1, 5, card_mask(['Ah', 'Kh']), rng)[0]))
+    dead = card_mask(['Ah', 'Kh'])
+    counts = np.bincount(deal(1_000_000, 5, dead, rng).ravel(), minlength=52)
+    live = counts[mask_to_codes(FULL_DECK & ~dead)]
+    print(f"live cards dealt {live.min()} - {live.max()} times, dead cards {counts.sum() - live.sum()}")
@@ -0,0 +1,356 @@
+"""
+Local evaluation and equity service.
+
+A long-running localhost HTTP server that keeps the lookup tables warm for the
+analysis tools. Bodies are JSON::
+
+    POST /evaluate  {"hands": [["As", "Ks", "Qs", "Js", "Ts"], ...]}
+    POST /equity    {"hole": ["Ah", "Kh"], "board": ["Qh", "7h", "2c"], "range": {"top": 0.2}}
+    POST /range     {"range": {"hands": ["AKs", "QQ"]}}
+    GET  /stats
+
+Concurrent evaluation requests are coalesced into one vectorized batch by a
+batching thread, and so are preflop equity requests, whose sampled showdowns
+are evaluated together; postflop equity is an exact enumeration per spot.
+Equity results are shared between requests through a cache that also lets a
+repeat wait on the computation already in flight.
+A range is ``{"top": fraction}``, ``{"percentile": p}`` or ``{"hands": [...]}``,
+and every combo when left out.
+"""
+
+__all__ = [
+    'Batcher',
+    'SharedCache',
+    'EvaluationService',
+    'serve',
+    'query',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import argparse
+import json
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Hashable, List, Optional
+from urllib.request import Request, urlopen
+
+import numpy as np
+from loguru import logger
+
+from cards import card_mask, check_spot
+from equity import equity, preflop_equities
+from evaluator import CATEGORY_NAMES, category, evaluate
+from hand import hand_ranks
+from ranges import COMBO_CLASSES, class_range, in_range_weights, remove_dead, top_range
+
+HOST = '127.0.0.1'
+PORT = 8765
+
+
+class Stats:
+    """Recent samples of a measurement, summarized on demand."""
+
+    def __init__(self, size: int = 10000):
+        self._samples = deque(maxlen=size)
+        self._lock = Lock()
+        self.count = 0
+
+    def add(self, value: float):
+        with self._lock:
+            self._samples.append(value)
+            self.count += 1
+
+    def summary(self, scale: float = 1.0) -> Dict[str, float]:
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64) * scale
+        if not len(samples):
+            return {'count': self.count}
+        p50, p99 = np.percentile(samples, (50, 99))
+        return {'count': self.count, 'mean': float(samples.mean()), 'p50': float(p50),
+                'p99': float(p99), 'max': float(samples.max())}
+
+
+class _Pending:
+    __slots__ = ('items', 'submitted', 'done', 'result', 'error')
+
+    def __init__(self, items: np.ndarray):
+        self.items = items
+        self.submitted = time.perf_counter()
+        self.done = Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class Batcher:
+    """Coalesce concurrent calls of a vectorized function into batches.
+
+    The batching thread takes the first waiting request, then gathers whatever else
+    arrives within ``max_delay`` seconds (up to ``max_batch`` items) and makes one call.
+
+    :param func: Maps a 1d array of items to an array of results of the same length
+    """
+
+    def __init__(self, func: Callable[[np.ndarray], np.ndarray], max_batch: int = 1 << 16,
+                 max_delay: float = 0.0005):
+        self.func = func
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue_latency = Stats()
+        self.batch_size = Stats()
+        self._queue: Queue = Queue()
+        self._thread = Thread(target=self._run, name='batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, items: np.ndarray) -> np.ndarray:
+        """Results for ``items``, computed in the next batch."""
+        pending = _Pending(np.asarray(items))
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _gather(self) -> List[_Pending]:
+        batch = [self._queue.get()]
+        size = len(batch[0].items)
+        deadline = time.perf_counter() + self.max_delay
+        while size < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                pending = self._queue.get(timeout=timeout) if timeout > 0 \
+                    else self._queue.get_nowait()
+            except Empty:
+                break
+            batch.append(pending)
+            size += len(pending.items)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._gather()
+            start = time.perf_counter()
+            for pending in batch:
+                self.queue_latency.add(start - pending.submitted)
+            self.batch_size.add(sum(len(p.items) for p in batch))
+            try:
+                results = self.func(np.concatenate([p.items for p in batch]))
+                offsets = np.cumsum([len(p.items) for p in batch])[:-1]
+                for pending, result in zip(batch, np.split(results, offsets)):
+                    pending.result = result
+            except Exception as e:
+                for pending in batch:
+                    pending.error = e
+            for pending in batch:
+                pending.done.set()
+
+
+class SharedCache:
+    """Thread-safe LRU cache; concurrent misses on a key share one computation."""
+
+    def __init__(self, max_size: int = 100000):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._values: OrderedDict = OrderedDict()
+        self._in_flight: Dict[Hashable, Event] = {}
+        self._lock = Lock()
+
+    def get(self, key: Hashable, compute: Callable[[], object]):
+        while True:
+            with self._lock:
+                if key in self._values:
+                    self._values.move_to_end(key)
+                    self.hits += 1
+                    return self._values[key]
+                waiting = self._in_flight.get(key)
+                if waiting is None:
+                    self._in_flight[key] = Event()
+                    self.misses += 1
+                    break
+            waiting.wait()
+        try:
+            value = compute()
+            with self._lock:
+                self._values[key] = value
+                if len(self._values) > self.max_size:
+                    self._values.popitem(last=False)
+            return value
+        finally:
+            with self._lock:
+                self._in_flight.pop(key).set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'size': len(self._values), 'hits': self.hits, 'misses': self.misses}
+
+
+def parse_range(spec: Optional[dict]) -> Optional[np.ndarray]:
+    """Combo weights of a JSON range, None for every combo."""
+    if not spec:
+        return None
+    if 'top' in spec:
+        return top_range(float(spec['top']))
+    if 'percentile' in spec:
+        return in_range_weights(float(spec['percentile']))
+    if 'hands' in spec:
+        return class_range(spec['hands'])
+    raise ValueError(f"unknown range {spec}, expected 'top', 'percentile' or 'hands'")
+
+
+class EvaluationService:
+    """The queries the server answers, usable in process as well."""
+
+    def __init__(self, trials: int = 200_000, seed: int = 0):
+        self.trials = trials
+        self.seed = seed
+        self.batcher = Batcher(evaluate)
+        self.equity_batcher = Batcher(self._preflop_equities, max_batch=64)
+        self.cache = SharedCache()
+        self.request_latency: Dict[str, Stats] = {}
+        # Warm the tables before the first request
+        evaluate(np.array([card_mask(['As', 'Ks', 'Qs', 'Js', 'Ts'])], dtype=np.uint64))
+
+    def evaluate(self, body: dict) -> dict:
+        masks = np.array([card_mask(hand) for hand in body['hands']], dtype=np.uint64)
+        if len(masks) and not np.isin([bin(int(m)).count('1') for m in masks], (5, 6, 7)).all():
+            raise ValueError("every hand needs 5 to 7 distinct cards")
+        values = self.batcher.submit(masks)
+        return {'values': values.tolist(),
+                'categories': [CATEGORY_NAMES[c] for c in category(values)]}
+
+    def _preflop_equities(self, spots: np.ndarray) -> np.ndarray:
+        return preflop_equities(list(spots), self.seed)
+
+    def _preflop_equity(self, hole: List[str], weights: Optional[np.ndarray],
+                        trials: int) -> float:
+        spot = np.empty(1, dtype=object)
+        spot[0] = (hole, weights, trials)
+        return float(self.equity_batcher.submit(spot)[0])
+
+    def equity(self, body: dict) -> dict:
+        hole, board = list(body['hole']), list(body.get('board', []))
+        check_spot(hole, board)
+        spec = body.get('range')
+        weights = parse_range(spec)
+        # Before the cache, so a blocked range answers 400 instead of caching a NaN equity
+        if weights is not None and not remove_dead(weights, card_mask(hole + board)).any():
+            raise ValueError("villain range holds no live combos")
+        trials = int(body.get('trials', self.trials))
+        if trials < 1:
+            raise ValueError(f"trials must be positive, got {trials}")
+        key = ('equity', tuple(hole), tuple(board), json.dumps(spec, sort_keys=True), trials)
+        if board:
+            value = self.cache.get(key, lambda: equity(hole, board, weights, trials, self.seed))
+        else:
+            value = self.cache.get(key, lambda: self._preflop_equity(hole, weights, trials))
+        return {'equity': value}
+
+    def range(self, body: dict) -> dict:
+        weights = parse_range(body.get('range'))
+        weights = np.ones(len(COMBO_CLASSES)) if weights is None else weights
+        classes = np.unique(COMBO_CLASSES[weights > 0])
+        return {'combos': float(weights.sum()), 'fraction': float(weights.sum() / len(weights)),
+                'classes': hand_ranks()['hand'][classes].tolist()}
+
+    def stats(self, body: dict = None) -> dict:
+        return {
+            'queue_latency_ms': self.batcher.queue_latency.summary(1e3),
+            'batch_size': self.batcher.batch_size.summary(),
+            'equity_queue_latency_ms': self.equity_batcher.queue_latency.summary(1e3),
+            'equity_batch_size': self.equity_batcher.batch_size.summary(),
+            'request_latency_ms': {path: stats.summary(1e3)
+                                   for path, stats in self.request_latency.items()},
+            'cache': self.cache.stats(),
+        }
+
+    @property
+    def routes(self) -> Dict[str, Callable[[dict], dict]]:
+        return {'/evaluate': self.evaluate, '/equity': self.equity, '/range': self.range,
+                '/stats': self.stats}
+
+    def handle(self, path: str, body: dict) -> dict:
+        start = time.perf_counter()
+        result = self.routes[path](body)
+        self.request_latency.setdefault(path, Stats()).add(time.perf_counter() - start)
+        return result
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service: EvaluationService = None
+    protocol_version = 'HTTP/1.1'
+
+    def _respond(self, status: int, payload: dict):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, body: dict):
+        if self.path not in self.service.routes:
+            self._respond(404, {'error': f"no such endpoint {self.path}"})
+            return
+        try:
+            self._respond(200, self.service.handle(self.path, body))
+        except (KeyError, ValueError, TypeError) as e:
+            self._respond(400, {'error': f"{type(e).__name__}: {e}"})
+        except Exception as e:
+            logger.exception(f"{self.path} failed")
+            self._respond(500, {'error': f"{type(e).__name__}: {e}"})
+
+    def do_GET(self):
+        self._dispatch({})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except json.JSONDecodeError as e:
+            self._respond(400, {'error': f"invalid JSON: {e}"})
+            return
+        self._dispatch(body)
+
+    def log_message(self, format, *args):
+        logger.trace(f"{self.address_string()} {format % args}")
+
+
+def serve(host: str = HOST, port: int = PORT,
+          service: EvaluationService = None) -> ThreadingHTTPServer:
+    """A server bound to ``host:port``, started with ``serve_forever()``."""
+    handler = type('Handler', (_Handler,), {'service': service or EvaluationService()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def query(path: str, body: dict = None, host: str = HOST, port: int = PORT,
+          timeout: float = 30.0) -> dict:
+    """Send one request to a running service."""
+    data = None if body is None else json.dumps(body).encode()
+    request = Request(f"http://{host}:{port}{path}", data=data,
+                      headers={'Content-Type': 'application/json'})
+    with urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port)
+    logger.info(f"Serving on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
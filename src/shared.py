@@ -0,0 +1,181 @@
+"""
+Lookup tables shared between processes.
+
+The parent publishes artifacts once into ``multiprocessing.shared_memory``
+blocks with :class:`SharedTables`, and pool workers started with
+:meth:`SharedTables.pool` attach them zero-copy as read-only arrays. Once
+attached, :func:`artifacts.load` hands out the shared arrays instead of reading
+a private copy, so the modules loading their tables need no changes. Memory
+mapped artifacts (``mmap=True``) are shared through the page cache already.
+
+:func:`memory_usage` reports a process's resident and private memory, so
+:meth:`SharedTables.worker_memory` can confirm each worker only adds its own
+private state.
+"""
+
+__all__ = [
+    'SharedTables',
+    'attach',
+    'memory_usage',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import atexit
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import artifacts
+
+# Artifact name -> array name -> (block name, shape, dtype)
+Spec = Dict[str, Dict[str, Tuple[str, Tuple[int, ...], str]]]
+
+# Blocks attached by this process, kept open for as long as their arrays are used.
+_attached: List[shared_memory.SharedMemory] = []
+
+_NO_TRACK = {'track': False} if sys.version_info >= (3, 13) else {}
+
+
+class SharedTables:
+    """Owner of the shared memory blocks of published artifacts.
+
+    Blocks are unlinked by :meth:`close`, on leaving a ``with`` block, or at exit.
+    """
+
+    def __init__(self):
+        self.spec: Spec = {}
+        self._blocks: List[shared_memory.SharedMemory] = []
+        atexit.register(self.close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def publish(self, name: str, arrays: Dict[str, np.ndarray]):
+        """Copy an artifact's arrays into new shared memory blocks."""
+        self.spec[name] = {}
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self._blocks.append(block)
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self.spec[name][key] = (block.name, array.shape, array.dtype.str)
+
+    def publish_artifact(self, name: str, build: Callable[[], Dict[str, np.ndarray]],
+                         sources: List[Path] = ()):
+        """Load (or build) an artifact from the cache and publish it."""
+        self.publish(name, artifacts.load(name, build, sources, mmap=True))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(block.size for block in self._blocks)
+
+    def pool(self, processes: int = None) -> ProcessPoolExecutor:
+        """A process pool whose workers attach the published tables as they start."""
+        return ProcessPoolExecutor(processes, initializer=attach, initargs=(self.spec,))
+
+    def worker_memory(self, pool: ProcessPoolExecutor,
+                      n_workers: int) -> Dict[int, Dict[str, Optional[int]]]:
+        """:func:`memory_usage` of every worker of a pool, by pid."""
+        # Each call holds its worker briefly, so the calls spread over the workers
+        return dict(pool.map(_worker_memory, [0.2] * n_workers * 2))
+
+    def close(self):
+        while self._blocks:
+            block = self._blocks.pop()
+            block.close()
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        self.spec = {}
+
+
+def attach(spec: Spec):
+    """Attach published tables in this process and route :func:`artifacts.load` to them.
+
+    Meant for processes started by the publisher, e.g. as a pool initializer.
+    """
+    for name, arrays in spec.items():
+        views = {}
+        for key, (block_name, shape, dtype) in arrays.items():
+            # Pool workers share the publisher's resource tracker, which already tracks the
+            # block; newer Pythons can skip registering it again
+            block = shared_memory.SharedMemory(name=block_name, **_NO_TRACK)
+            _attached.append(block)
+            view = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+            view.flags.writeable = False
+            views[key] = view
+        artifacts.attached[name] = views
+
+
+def memory_usage() -> Dict[str, Optional[int]]:
+    """Resident (``rss``) and private (``uss``) bytes of this process, None if unknown.
+
+    Uses psutil when it is installed, ``/proc/self/smaps_rollup`` on Linux otherwise.
+    """
+    try:
+        import psutil
+        info = psutil.Process().memory_full_info()
+        return {'rss': info.rss, 'uss': info.uss}
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/smaps_rollup', 'r') as f:
+            fields = {line.split(':')[0]: int(line.split()[1]) * 1024
+                      for line in f if line.split()[-1] == 'kB'}
+        return {'rss': fields['Rss'],
+                'uss': fields['Private_Clean'] + fields['Private_Dirty']}
+    except (OSError, KeyError):
+        return {'rss': None, 'uss': None}
+
+
+def _worker_memory(hold: float) -> Tuple[int, Dict[str, Optional[int]]]:
+    time.sleep(hold)
+    return os.getpid(), memory_usage()
+
+
+def _touch_tables(n_cards: int) -> float:
+    """Read the preflop equity matrix and a texture index, the way a worker using them would."""
+    from equity import preflop_equity_matrix
+    from textures import texture_index
+
+    index = texture_index(n_cards)
+    return float(preflop_equity_matrix().equity.sum() + index['hs_hist'].sum()
+                 + index['rows'].sum())
+
+
+if __name__ == '__main__':
+    from equity import build_preflop_equity
+    from hand import HAND_RANKS_CSV
+    from textures import build_index
+
+    def megabytes(value):
+        return '?' if value is None else f"{value / 2 ** 20:.1f} MB"
+
+    n_workers = 4
+    here = Path(__file__).resolve().parent
+    with SharedTables() as tables:
+        tables.publish_artifact('preflop_equity', build_preflop_equity,
+                                [here / 'equity.py', HAND_RANKS_CSV])
+        tables.publish_artifact('textures_4', lambda: build_index(4),
+                                [here / 'textures.py', HAND_RANKS_CSV])
+        print(f"Published {megabytes(tables.nbytes)}")
+        for label, pool in (('shared', tables.pool(n_workers)),
+                            ('own copies', ProcessPoolExecutor(n_workers))):
+            with pool:
+                list(pool.map(_touch_tables, [4] * n_workers * 2))
+                for pid, usage in sorted(tables.worker_memory(pool, n_workers).items()):
+                    print(f"{label:<12} worker {pid}: rss {megabytes(usage['rss'])}, "
+                          f"private {megabytes(usage['uss'])}")
@@ -0,0 +1,118 @@
+"""
+Startup time report.
+
+Run in a fresh interpreter, so every import is timed from cold::
+
+    python startup.py --build    # build every cached artifact
+    python startup.py            # report
+"""
+
+__all__ = ['StartupReport']
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import argparse
+import importlib
+import sys
+import time
+from typing import List, Optional, Tuple
+
+import artifacts
+
+HEAVY_MODULES = [
+    'numpy', 'yaml', 'loguru', 'cv2', 'PIL.Image', 'imagehash', 'scipy.fftpack', 'pandas',
+    'win32gui',
+]
+
+
+class StartupReport:
+    """Import and artifact load timings of the current process."""
+
+    def __init__(self):
+        self.imports: List[Tuple[str, Optional[float], str]] = []
+        self.artifacts: List[Tuple[str, float, float]] = []
+
+    def time_import(self, name: str, note: str = '') -> Optional[float]:
+        """Seconds spent importing ``name`` and whatever it pulls in, None if it failed."""
+        if name in sys.modules:
+            self.imports.append((name, 0.0, 'already imported'))
+            return 0.0
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            self.imports.append((name, None, str(e)))
+            return None
+        seconds = time.perf_counter() - start
+        self.imports.append((name, seconds, note))
+        return seconds
+
+    def time_artifact(self, name: str, build, sources):
+        """Time loading an artifact from the cache against building it from its sources."""
+        artifacts.load(name, build, sources)
+        start = time.perf_counter()
+        artifacts.load(name, build, sources)
+        cached = time.perf_counter() - start
+        start = time.perf_counter()
+        build()
+        source = time.perf_counter() - start
+        self.artifacts.append((name, cached, source))
+
+    def run(self):
+        before = set(sys.modules)
+        self.time_import('bot')
+        pulled = [m for m in HEAVY_MODULES if m in sys.modules and m not in before]
+        if pulled:
+            name, seconds, note = self.imports[-1]
+            note = '; '.join(filter(None, (note, f"pulls in {', '.join(pulled)}")))
+            self.imports[-1] = (name, seconds, note)
+        for name in HEAVY_MODULES:
+            self.time_import(name)
+
+        import hand
+        import recognition
+        from layout import BASE_PROFILE
+
+        self.time_artifact('hand_ranks', hand.read_hand_ranks_csv, [hand.HAND_RANKS_CSV])
+        for size in (BASE_PROFILE.hole_card_size, BASE_PROFILE.board_card_size):
+            self.time_artifact(
+                f'templates_{size[0]}x{size[1]}', lambda: recognition.render_templates(size),
+                recognition.card_image_files())
+
+    def print(self):
+        print(" Imports ".center(79, '-'))
+        for name, seconds, note in self.imports:
+            took = 'failed' if seconds is None else f"{seconds * 1000:.1f} ms"
+            print(name.ljust(20, '.') + took.rjust(12) + f"  {note}")
+        print(" Artifacts (cached vs source) ".center(79, '-'))
+        for name, cached, source in self.artifacts:
+            print(name.ljust(20, '.') + f"{cached * 1000:.1f} ms".rjust(12)
+                  + f"{source * 1000:.1f} ms".rjust(12) + f"  {source / cached:.0f}x")
+
+
+def build_artifacts():
+    import hand
+    import pushfold
+    import recognition
+    import strength
+    import textures
+
+    hand.hand_ranks()
+    recognition.build_artifacts()
+    strength.load_tables()
+    textures.texture_index()
+    pushfold.pushfold_chart()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--build', action='store_true', help='build every cached artifact and exit')
+    args = parser.parse_args()
+    if args.build:
+        build_artifacts()
+        sys.exit()
+    report = StartupReport()
+    report.run()
+    report.print()
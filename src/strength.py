@@ -0,0 +1,430 @@
+"""
+Postflop hand strength metrics.
+
+Hand strength (HS), positive and negative potential (PPot, NPot), effective
+hand strength (EHS) and showdown equity of hole cards on a board against a range,
+enumerated exactly over every opponent combo and runout.
+
+The opponent's final hand only depends on the set of its hole cards plus the
+runout, so on the flop each of the 47C4 four card sets is evaluated once and
+shared by the six (combo, runout) splits of it, instead of evaluating all
+1081 x 990 pairs. Results are cached by the suit isomorphic spot.
+
+:class:`StreetStrength` follows one hand from the flop to the river. It keeps
+the flop's final status of every (combo, runout) split, grouped by turn card,
+so the turn and river come from slicing those instead of enumerating again.
+Its index tables for the flop and turn are a cached artifact (see
+:func:`load_tables`), and :class:`StrengthWorker` runs it on a background
+thread for the bot, loading them there, so a new flop never stalls the frame loop.
+"""
+
+__all__ = [
+    'HandStrength',
+    'hand_strength',
+    'StreetStrength',
+    'StrengthWorker',
+    'load_tables',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from functools import lru_cache
+from itertools import combinations
+from pathlib import Path
+from threading import Condition, Thread
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+import artifacts
+from cards import (CARD_BITS, FULL_DECK, canonical_spot, card_codes, check_spot, mask_to_codes,
+                   to_mask)
+from evaluator import evaluate
+from ranges import combo_index, permute_range
+
+AHEAD, TIED, BEHIND = 0, 1, 2
+
+# (live cards, runout cards) of the flop and the turn, whose split tables are cached
+STREET_SPLITS = ((47, 2), (46, 1))
+SPLIT_KEYS = ('runouts', 'subsets', 'combo', 'runout', 'subset')
+
+# River spot the worker evaluates once before its first board. The first evaluation loads
+# the evaluator's compiled kernel, which takes about a second; a river needs no tables.
+WARMUP_SPOT = (['As', 'Ks'], ['Qs', 'Js', 'Ts', '2c', '3d'])
+
+_tables: Dict[str, np.ndarray] = {}
+
+
+class HandStrength(NamedTuple):
+    hs: float
+    ppot: float
+    npot: float
+    ehs: float
+    equity: float
+
+    def __str__(self):
+        return f"HS= {self.hs:.3f} | PPot= {self.ppot:.3f} | NPot= {self.npot:.3f} | " \
+               f"EHS= {self.ehs:.3f} | Equity= {self.equity:.3f}"
+
+
+@lru_cache(maxsize=None)
+def _pairs(n_live: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Every pair of the live cards, and the pair id of (i, j) for i < j."""
+    pairs = np.array(list(combinations(range(n_live), 2)), dtype=np.int16)
+    pair_id = np.full((n_live, n_live), -1, dtype=np.int32)
+    pair_id[pairs[:, 0], pairs[:, 1]] = np.arange(len(pairs))
+    return pairs, pair_id
+
+
+def _build_splits(n_live: int, n_runout: int) -> Tuple[np.ndarray, ...]:
+    """Index tables splitting every (2 + n_runout) subset of the live cards.
+
+    :return: (live cards of each runout, live cards of each subset, and for every split of
+        every subset: its combo, its runout and its subset)
+    """
+    _, pair_id = _pairs(n_live)
+    runouts = np.array(list(combinations(range(n_live), n_runout)), dtype=np.int16)
+    subsets = np.array(list(combinations(range(n_live), 2 + n_runout)), dtype=np.int16)
+    combo, runout, subset = [], [], []
+    for opp in combinations(range(2 + n_runout), 2):
+        rest = [i for i in range(2 + n_runout) if i not in opp]
+        combo.append(pair_id[subsets[:, opp[0]], subsets[:, opp[1]]])
+        if n_runout == 1:
+            runout.append(subsets[:, rest[0]].astype(np.int32))
+        else:
+            runout.append(pair_id[subsets[:, rest[0]], subsets[:, rest[1]]])
+        subset.append(np.arange(len(subsets), dtype=np.int32))
+    return runouts, subsets, np.concatenate(combo), np.concatenate(runout), \
+        np.concatenate(subset)
+
+
+def _build_turn_groups(n_live: int, runouts: np.ndarray,
+                       split_runout: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """The flop splits of :func:`_splits` grouped by the turn card.
+
+    A runout of two live cards belongs to the group of either card, so each split
+    appears in two groups.
+
+    :return: (split of each group entry, start of each turn card's group in it, and the
+        river card of each entry)
+    """
+    cards = runouts[split_runout].T
+    turn = np.concatenate(cards)
+    order = np.argsort(turn, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(np.bincount(turn, minlength=n_live))))
+    river = np.concatenate(cards[::-1])[order]
+    return (order % len(split_runout)).astype(np.int32), starts, river
+
+
+def _build_tables() -> Dict[str, np.ndarray]:
+    tables = {}
+    for n_live, n_runout in STREET_SPLITS:
+        for key, table in zip(SPLIT_KEYS, _build_splits(n_live, n_runout)):
+            tables[f'{key}_{n_live}_{n_runout}'] = table
+    n_live, _ = STREET_SPLITS[0]
+    tables['turn_order'], tables['turn_starts'], tables['turn_river'] = _build_turn_groups(
+        n_live, tables[f'runouts_{n_live}_2'], tables[f'runout_{n_live}_2'])
+    return tables
+
+
+def load_tables() -> Dict[str, np.ndarray]:
+    """The flop and turn split tables, from the artifact cache on first use.
+
+    Building them takes about a second, so call this at startup rather than leave it to
+    the first flop.
+    """
+    if not _tables:
+        _tables.update(artifacts.load('street_tables', _build_tables, [Path(__file__).resolve()]))
+    return _tables
+
+
+@lru_cache(maxsize=None)
+def _splits(n_live: int, n_runout: int) -> Tuple[np.ndarray, ...]:
+    """:func:`_build_splits`, from the cached tables for the flop and turn."""
+    if (n_live, n_runout) in STREET_SPLITS:
+        tables = load_tables()
+        return tuple(tables[f'{key}_{n_live}_{n_runout}'] for key in SPLIT_KEYS)
+    return _build_splits(n_live, n_runout)
+
+
+@lru_cache(maxsize=None)
+def _turn_groups(n_live: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """:func:`_build_turn_groups`, from the cached tables for the flop."""
+    if (n_live, 2) in STREET_SPLITS:
+        tables = load_tables()
+        return tables['turn_order'], tables['turn_starts'], tables['turn_river']
+    runouts, _, _, split_runout, _ = _splits(n_live, 2)
+    return _build_turn_groups(n_live, runouts, split_runout)
+
+
+def _status(hero: np.ndarray, villain: np.ndarray) -> np.ndarray:
+    return np.where(hero > villain, AHEAD, np.where(hero == villain, TIED, BEHIND))
+
+
+def _live(combo_weights: np.ndarray) -> np.ndarray:
+    """Weights of the live combos, which must leave villain something to hold."""
+    if not combo_weights.sum() > 0:
+        raise ValueError("villain range holds no live combos")
+    return combo_weights
+
+
+def _hs(now: np.ndarray, combo_weights: np.ndarray) -> float:
+    totals = np.bincount(now, combo_weights, minlength=3)
+    return float((totals[AHEAD] + totals[TIED] / 2) / totals.sum())
+
+
+def _with_potential(hs: float, now: np.ndarray, final: np.ndarray, split_combo: np.ndarray,
+                    combo_weights: np.ndarray) -> HandStrength:
+    """Metrics from the status now of every combo and the final status of every split."""
+    # hp[now, final], weighted by the combo and counting every runout
+    hp = np.bincount(now[split_combo] * 3 + final, combo_weights[split_combo],
+                     minlength=9).reshape(3, 3)
+    hp_total = hp.sum(axis=1)
+    ppot_den = hp_total[BEHIND] + hp_total[TIED] / 2
+    npot_den = hp_total[AHEAD] + hp_total[TIED] / 2
+    ppot = (hp[BEHIND, AHEAD] + hp[BEHIND, TIED] / 2 + hp[TIED, AHEAD] / 2) / ppot_den \
+        if ppot_den else 0.0
+    npot = (hp[AHEAD, BEHIND] + hp[TIED, BEHIND] / 2 + hp[AHEAD, TIED] / 2) / npot_den \
+        if npot_den else 0.0
+    ehs = hs * (1 - npot) + (1 - hs) * ppot
+    # Showdown equity over every runout
+    final_totals = hp.sum(axis=0)
+    equity = (final_totals[AHEAD] + final_totals[TIED] / 2) / final_totals.sum()
+    return HandStrength(hs, float(ppot), float(npot), float(ehs), float(equity))
+
+
+def _flop_state(hole: Tuple[int, ...], board: Tuple[int, ...], weights: np.ndarray):
+    """Live cards, combo weights, status now of each combo, and the final status of each split."""
+    hole_mask = int(to_mask(np.array(hole)))
+    board_mask = int(to_mask(np.array(board)))
+    live = mask_to_codes(FULL_DECK & ~(hole_mask | board_mask))
+    live_bits = CARD_BITS[live]
+    pairs, _ = _pairs(len(live))
+
+    combo_bits = live_bits[pairs[:, 0]] | live_bits[pairs[:, 1]]
+    combo_weights = _live(weights[combo_index(live[pairs[:, 0]], live[pairs[:, 1]])])
+    hero_now, *villain_now = evaluate(np.concatenate(([hole_mask | board_mask],
+                                                      board_mask | combo_bits)))
+    now = _status(hero_now, np.array(villain_now))
+    n_runout = 5 - len(board)
+    if n_runout == 0:
+        return live, combo_weights, now, None
+
+    runouts, subsets, split_combo, split_runout, split_subset = _splits(len(live), n_runout)
+    runout_bits = np.bitwise_or.reduce(live_bits[runouts], axis=1)
+    subset_bits = np.bitwise_or.reduce(live_bits[subsets], axis=1)
+    hero_final = evaluate((hole_mask | board_mask) | runout_bits)
+    villain_final = evaluate(board_mask | subset_bits)
+    final = _status(hero_final[split_runout], villain_final[split_subset])
+    return live, combo_weights, now, final.astype(np.int8)
+
+
+def _compute(hole: Tuple[int, ...], board: Tuple[int, ...],
+             weights: np.ndarray) -> HandStrength:
+    live, combo_weights, now, final = _flop_state(hole, board, weights)
+    hs = _hs(now, combo_weights)
+    if final is None:
+        return HandStrength(hs, 0.0, 0.0, hs, hs)
+    split_combo = _splits(len(live), 5 - len(board))[2]
+    return _with_potential(hs, now, final, split_combo, combo_weights)
+
+
+@lru_cache(maxsize=4096)
+def _cached(hole: Tuple[int, ...], board: Tuple[int, ...], weights: bytes) -> HandStrength:
+    return _compute(hole, board, np.frombuffer(weights))
+
+
+def hand_strength(hole: List[str], board: List[str],
+                  villain_range: np.ndarray = None) -> HandStrength:
+    """HS, PPot, NPot, EHS and showdown equity of hole cards on a flop, turn or river.
+
+    :param hole: Hero's hole cards
+    :param board: Three to five board cards
+    :param villain_range: Combo weights (see :mod:`ranges`), every combo if not given
+    """
+    # Before the cache, so bad input is never cached
+    check_spot(hole, board, (3, 4, 5))
+    perm, hole, board = canonical_spot(card_codes(hole), card_codes(board))
+    if villain_range is None:
+        weights = np.ones(1326)
+    else:
+        weights = permute_range(np.asarray(villain_range, dtype=np.float64), perm)
+    return _cached(hole, board, weights.tobytes())
+
+
+class StreetStrength:
+    """Hand strength of one hand from the flop on, reusing the flop's work on later streets.
+
+    The flop is enumerated once, as by :func:`hand_strength`, keeping the final status
+    of every (villain combo, turn and river) split. A turn card then selects its
+    group of splits, and only the villain's six card hands on the turn board are new
+    evaluations; the river card selects a split per combo out of that group, with
+    nothing left to evaluate.
+
+    :param hole: Hero's hole cards
+    :param flop: The three flop cards
+    :param villain_range: Combo weights (see :mod:`ranges`), every combo if not given
+    """
+
+    def __init__(self, hole: Sequence[str], flop: Sequence[str],
+                 villain_range: np.ndarray = None):
+        check_spot(hole, flop, (3,))
+        self.hole = list(hole)
+        self.flop = list(flop)
+        weights = np.ones(1326) if villain_range is None \
+            else np.asarray(villain_range, dtype=np.float64)
+        self._hole = tuple(card_codes(hole).tolist())
+        self._board = tuple(card_codes(flop).tolist())
+        self._live, self._weights, self._now, self._final = \
+            _flop_state(self._hole, self._board, weights)
+        self._split_combo = _splits(len(self._live), 2)[2]
+        self._results = {}
+
+    def matches(self, hole: Sequence[str], board: Sequence[str]) -> bool:
+        """Whether a hand and board continue this one's flop."""
+        return list(hole) == self.hole and list(board[:3]) == self.flop
+
+    def update(self, board: Sequence[str]) -> HandStrength:
+        """Strength on a board of this flop plus nothing, a turn, or a turn and river."""
+        check_spot(self.hole, board, (3, 4, 5))
+        if list(board[:3]) != self.flop:
+            raise ValueError(f"{' '.join(board)} doesn't continue the flop {' '.join(self.flop)}")
+        key = tuple(board[3:])
+        if key not in self._results:
+            if len(key) == 0:
+                result = _with_potential(_hs(self._now, self._weights), self._now, self._final,
+                                         self._split_combo, self._weights)
+            elif len(key) == 1:
+                result = self._turn(self._index(key[0]))
+            else:
+                result = self._river(self._index(key[0]), self._index(key[1]))
+            self._results[key] = result
+        return self._results[key]
+
+    def _index(self, card: str) -> int:
+        index = np.flatnonzero(self._live == card_codes([card])[0])
+        if not len(index):
+            raise ValueError(f"{card} is already dealt")
+        return int(index[0])
+
+    def _group(self, turn: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Splits whose runout holds the turn card, and their river cards."""
+        order, starts, river = _turn_groups(len(self._live))
+        group = slice(starts[turn], starts[turn + 1])
+        return order[group], river[group]
+
+    def _turn_weights(self, turn: int) -> np.ndarray:
+        pairs, _ = _pairs(len(self._live))
+        return _live(np.where((pairs[:, 0] == turn) | (pairs[:, 1] == turn), 0.0, self._weights))
+
+    def _turn(self, turn: int) -> HandStrength:
+        pairs, _ = _pairs(len(self._live))
+        live_bits = CARD_BITS[self._live]
+        board_mask = int(to_mask(np.array(self._board))) | int(live_bits[turn])
+        values = evaluate(np.concatenate((
+            [int(to_mask(np.array(self._hole))) | board_mask],
+            board_mask | live_bits[pairs[:, 0]] | live_bits[pairs[:, 1]])))
+        now = _status(values[0], values[1:])
+        weights = self._turn_weights(turn)
+        splits, _ = self._group(turn)
+        return _with_potential(_hs(now, weights), now, self._final[splits],
+                               self._split_combo[splits], weights)
+
+    def _river(self, turn: int, river: int) -> HandStrength:
+        splits, rivers = self._group(turn)
+        splits = splits[rivers == river]
+        # One split per live combo, its final status is the river's status
+        weights = _live(self._turn_weights(turn)[self._split_combo[splits]])
+        totals = np.bincount(self._final[splits], weights, minlength=3)
+        hs = float((totals[AHEAD] + totals[TIED] / 2) / totals.sum())
+        return HandStrength(hs, 0.0, 0.0, hs, hs)
+
+
+class StrengthWorker:
+    """Strength of the hand being played, computed on a background thread.
+
+    The frame loop submits the hole cards and board whenever they change and reads
+    :attr:`strength` back, which is None until the latest submission is computed. One
+    :class:`StreetStrength` carries a hand from the flop to the river. A submission made
+    while another computes replaces any still waiting, so boards never queue up.
+
+    :meth:`start` loads the tables and warms the evaluator on the thread, so neither
+    holds up constructing the bot; boards submitted meanwhile wait for it.
+    """
+
+    def __init__(self):
+        self._spot: Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]] = None
+        self._waiting = False
+        self._strength: Optional[HandStrength] = None
+        self._street: Optional[StreetStrength] = None
+        self._changed = Condition()
+        self._thread: Optional[Thread] = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._thread = Thread(target=self._run, name='StrengthWorker', daemon=True)
+        self._thread.start()
+
+    @property
+    def strength(self) -> Optional[HandStrength]:
+        with self._changed:
+            return self._strength
+
+    def submit(self, hole: Sequence[str], board: Sequence[str]):
+        """Compute the strength of hole cards on a board of three to five cards."""
+        spot = (tuple(hole), tuple(board))
+        with self._changed:
+            if spot != self._spot:
+                self._spot, self._strength, self._waiting = spot, None, True
+                self._changed.notify()
+
+    def clear(self):
+        """Drop the strength, e.g. before the flop."""
+        with self._changed:
+            self._spot, self._strength, self._waiting = None, None, False
+
+    def _run(self):
+        load_tables()
+        hand_strength(*WARMUP_SPOT)
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._waiting)
+                self._waiting = False
+                spot = hole, board = self._spot
+            try:
+                strength = self._compute(list(hole), list(board))
+            except ValueError as e:
+                logger.warning(f"No hand strength for {' '.join(hole)} on {' '.join(board)}: {e}")
+                strength = None
+            with self._changed:
+                if self._spot == spot:
+                    self._strength = strength
+
+    def _compute(self, hole: List[str], board: List[str]) -> HandStrength:
+        # The flop's enumeration carries over to the turn and river of the same hand
+        if self._street is None or not self._street.matches(hole, board):
+            self._street = StreetStrength(hole, board[:3])
+        return self._street.update(board)
+
+
+if __name__ == '__main__':
+    from ranges import top_range
+
+    print(hand_strength(['Ah', 'Kh'], ['Qh', '7h', '2c']))
+    print(hand_strength(['Ah', 'Kh'], ['Qh', '7h', '2c', '3d']))
+    print(hand_strength(['Ah', 'Kh'], ['Qh', '7h', '2c', '3d', 'Ks'], top_range(0.2)))
+
+    import time
+    start = time.perf_counter()
+    hand = StreetStrength(['Ah', 'Kh'], ['Qh', '7h', '2c'])
+    for board in (['Qh', '7h', '2c'], ['Qh', '7h', '2c', '3d'], ['Qh', '7h', '2c', '3d', 'Ks']):
+        print(f"{' '.join(board):<16}{hand.update(board)}")
+    print(f"Flop to river in {(time.perf_counter() - start) * 1e3:.1f} ms")
@@ -0,0 +1,291 @@
+"""
+Synthetic table frames for load and accuracy testing.
+
+Card templates are composited onto the captured table background at the layout
+coordinates, so the frames go through the same recognition pipeline as a live table.
+Scaling, noise and JPEG compression degrade everything but the check pixels on
+settled cards, which the client draws losslessly and the bot tests for pure white.
+"""
+
+__all__ = [
+    'SyntheticFrame',
+    'TableSynthesizer',
+    'SyntheticCapture',
+    'ReplayCapture',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+import argparse
+import json
+from pathlib import Path
+from typing import Iterator, List, NamedTuple, Optional
+
+import cv2
+import numpy as np
+
+from layout import BASE_PROFILE, select_profile
+
+SRC_PATH = Path(__file__).parent.resolve()
+CARD_IMAGES_PATH = SRC_PATH / 'images' / 'cards'
+BACKGROUND_PATH = SRC_PATH / 'images' / 'captures' / 'screenshot.png'
+
+# Where dealt cards fly in from during the deal animation.
+DEAL_ORIGIN = (455, 110)
+
+# Number of board cards showing on each street.
+STREETS = (0, 3, 4, 5)
+
+
+class SyntheticFrame(NamedTuple):
+    """A rendered frame and its labels."""
+    image: np.ndarray
+    hole_cards: List[str]
+    community_cards: List[str]
+    animating: bool
+
+
+class TableSynthesizer:
+    """Render labelled table frames from the card templates.
+
+    :param noise: Standard deviation of the gaussian pixel noise
+    :param scale: Factor the whole frame is resized by
+    :param jpeg_quality: Re-encode each frame as JPEG at this quality, if given
+    :param animation_frames: Number of mid-deal frames rendered at the start of each street
+    :param seed: Seed for reproducible output
+    """
+
+    def __init__(self, noise: float = 0.0, scale: float = 1.0, jpeg_quality: int = None,
+                 animation_frames: int = 0, seed: int = None, background: np.ndarray = None):
+        self.noise = noise
+        self.scale = scale
+        self.jpeg_quality = jpeg_quality
+        self.animation_frames = animation_frames
+        self.rng = np.random.default_rng(seed)
+        if background is None:
+            background = cv2.imread(str(BACKGROUND_PATH), cv2.IMREAD_COLOR)
+        self.background = self.clear_slots(background)
+        self.hole_templates = {}
+        self.board_templates = {}
+        self.load_templates()
+
+    @property
+    def card_names(self) -> List[str]:
+        return list(self.hole_templates)
+
+    def load_templates(self):
+        for file in sorted(CARD_IMAGES_PATH.glob('*')):
+            img = cv2.imread(str(file), cv2.IMREAD_COLOR)
+            # The client renders card faces losslessly, the jpg templates don't
+            img[np.all(img >= 245, axis=-1)] = 255
+            name = file.stem
+            self.hole_templates[name] = cv2.resize(img, BASE_PROFILE.hole_card_size)
+            self.board_templates[name] = cv2.resize(img, BASE_PROFILE.board_card_size)
+
+    @staticmethod
+    def clear_slots(background: np.ndarray) -> np.ndarray:
+        """Paint over every card slot with the felt just above it."""
+        background = background.copy()
+        # The captured cards sit a few pixels above and below the cropped slots
+        slots = [(rect, 2) for rect in BASE_PROFILE.h_cards]
+        slots += [(rect, 12) for rect in BASE_PROFILE.c_cards]
+        for (x, y, w, h), pad_bottom in slots:
+            felt = np.median(background[y - 12:y - 8, x:x + w].reshape(-1, 3), axis=0)
+            background[y - 8:y + h + pad_bottom, x - 3:x + w + 3] = felt.astype(np.uint8)
+        return background
+
+    @staticmethod
+    def paste(frame: np.ndarray, img: np.ndarray, x: int, y: int, alpha: float = 1.0):
+        """Paste ``img`` with its top left corner at (x, y), clipped to the frame."""
+        h, w = img.shape[:2]
+        left, top = max(x, 0), max(y, 0)
+        right, bottom = min(x + w, frame.shape[1]), min(y + h, frame.shape[0])
+        if left >= right or top >= bottom:
+            return
+        src = img[top - y:bottom - y, left - x:right - x]
+        if alpha >= 1.0:
+            frame[top:bottom, left:right] = src
+        else:
+            dst = frame[top:bottom, left:right]
+            frame[top:bottom, left:right] = cv2.addWeighted(src, alpha, dst, 1 - alpha, 0)
+
+    def render(self, hole_cards: List[str], community_cards: List[str],
+               progress: float = 1.0, dealing: int = 0) -> np.ndarray:
+        """Render a frame.
+
+        :param hole_cards: Hero's hole cards, empty when sitting out
+        :param community_cards: Board cards showing
+        :param progress: Deal animation progress (0.0 - 1.0) of the last ``dealing`` board cards
+        :param dealing: Number of board cards still flying in
+        """
+        frame = self.background.copy()
+        for (x, y, _, _), card in zip(BASE_PROFILE.h_cards, hole_cards):
+            self.paste(frame, self.hole_templates[card], x, y)
+
+        n_settled = len(community_cards) - dealing
+        for i, ((x, y, _, _), card) in enumerate(zip(BASE_PROFILE.c_cards, community_cards)):
+            if i < n_settled:
+                self.paste(frame, self.board_templates[card], x, y)
+            else:
+                cx = round(DEAL_ORIGIN[0] + (x - DEAL_ORIGIN[0]) * progress)
+                cy = round(DEAL_ORIGIN[1] + (y - DEAL_ORIGIN[1]) * progress)
+                self.paste(frame, self.board_templates[card], cx, cy, alpha=progress)
+
+        return self.paint_check_pixels(self.degrade(frame), frame)
+
+    def degrade(self, frame: np.ndarray) -> np.ndarray:
+        """Apply the configured scaling, noise and compression artifacts."""
+        if self.scale != 1.0:
+            frame = cv2.resize(frame, None, fx=self.scale, fy=self.scale,
+                               interpolation=cv2.INTER_AREA)
+        if self.noise > 0:
+            noise = self.rng.normal(0, self.noise, frame.shape)
+            frame = np.clip(frame + noise, 0, 255).astype(np.uint8)
+        if self.jpeg_quality is not None:
+            _, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            frame = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        return frame
+
+    @staticmethod
+    def paint_check_pixels(frame: np.ndarray, clean: np.ndarray) -> np.ndarray:
+        """Restore the check pixels that are pure white in the undegraded frame.
+
+        The client draws card faces losslessly, so a check pixel on a settled card reads
+        exactly 255 on a live table whatever the capture does to the rest of the frame.
+        """
+        profile = select_profile(frame.shape[1], frame.shape[0])
+        for (x, y, w, h), rect in zip([BASE_PROFILE.h_check_pixel, *BASE_PROFILE.c_check_pixels],
+                                      [profile.h_check_pixel, *profile.c_check_pixels]):
+            if np.all(clean[y:y + h, x:x + w] == 255):
+                x, y, w, h = rect
+                frame[y:y + h, x:x + w] = 255
+        return frame
+
+    def hand(self, frames_per_street: int = 1,
+             sitting_out: bool = False) -> Iterator[SyntheticFrame]:
+        """Render one hand street by street, from preflop to the river."""
+        names = self.card_names
+        deck = [names[i] for i in self.rng.permutation(len(names))]
+        hole_cards = [] if sitting_out else deck[:2]
+        board = deck[2:7]
+        for prev, n in zip((0,) + STREETS, STREETS):
+            community_cards = board[:n]
+            for i in range(frames_per_street):
+                if i < self.animation_frames and n > prev:
+                    progress = (i + 1) / (self.animation_frames + 1)
+                    image = self.render(hole_cards, community_cards, progress, n - prev)
+                    yield SyntheticFrame(image, hole_cards, community_cards, True)
+                else:
+                    image = self.render(hole_cards, community_cards)
+                    yield SyntheticFrame(image, hole_cards, community_cards, False)
+
+    def frames(self, n: int = None, frames_per_street: int = 1,
+               sitting_out_rate: float = 0.0) -> Iterator[SyntheticFrame]:
+        """Render ``n`` frames of consecutive hands, or an endless stream if ``n`` is None."""
+        count = 0
+        while True:
+            sitting_out = self.rng.random() < sitting_out_rate
+            for frame in self.hand(frames_per_street, sitting_out):
+                if n is not None and count >= n:
+                    return
+                yield frame
+                count += 1
+
+    def write(self, directory: Path, n: int, **kwargs):
+        """Write ``n`` frames as png files plus a ``labels.jsonl`` describing them."""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / 'labels.jsonl', 'w') as f:
+            for i, frame in enumerate(self.frames(n, **kwargs)):
+                filename = f'frame_{i:06d}.png'
+                cv2.imwrite(str(directory / filename), frame.image)
+                f.write(json.dumps({
+                    'file': filename,
+                    'hole_cards': frame.hole_cards,
+                    'community_cards': frame.community_cards,
+                    'animating': frame.animating,
+                    'scale': self.scale,
+                }) + '\n')
+
+
+class SyntheticCapture:
+    """A frame source serving synthetic frames in place of :class:`window.WindowCapture`.
+
+    The labels of the most recent frame are kept in :attr:`current`.
+    """
+
+    def __init__(self, synthesizer: TableSynthesizer, n: int = None, **kwargs):
+        self.synthesizer = synthesizer
+        self._frames = synthesizer.frames(n, **kwargs)
+        self.current: Optional[SyntheticFrame] = None
+        self.w = round(BASE_PROFILE.table_size[0] * synthesizer.scale)
+        self.h = round(BASE_PROFILE.table_size[1] * synthesizer.scale)
+
+    @property
+    def rect(self):
+        from rectangle import Rectangle
+        return Rectangle(0, 0, self.w, self.h, "SyntheticTable")
+
+    def get_screenshot(self) -> Optional[np.ndarray]:
+        self.current = next(self._frames, None)
+        return None if self.current is None else self.current.image
+
+
+class ReplayCapture:
+    """A frame source replaying a directory of frames in place of :class:`window.WindowCapture`.
+
+    Plays the files listed in ``labels.jsonl`` as written by :meth:`TableSynthesizer.write`
+    (their labels are kept in :attr:`current`), or every png in name order otherwise,
+    e.g. a :class:`recorder.DebugRecorder` image sequence.
+    """
+
+    def __init__(self, directory: Path):
+        directory = Path(directory)
+        labels_path = directory / 'labels.jsonl'
+        if labels_path.exists():
+            with open(labels_path, 'r') as f:
+                self.labels = [json.loads(line) for line in f if line.strip()]
+        else:
+            self.labels = [{'file': path.name} for path in sorted(directory.glob('*.png'))]
+        if not self.labels:
+            raise FileNotFoundError(f"no frames to replay in {directory}")
+        self.directory = directory
+        self.current: Optional[dict] = None
+        self._index = 0
+        self.h, self.w = cv2.imread(str(directory / self.labels[0]['file'])).shape[:2]
+
+    @property
+    def rect(self):
+        from rectangle import Rectangle
+        return Rectangle(0, 0, self.w, self.h, "ReplayTable")
+
+    def get_screenshot(self) -> Optional[np.ndarray]:
+        if self._index >= len(self.labels):
+            self.current = None
+            return None
+        self.current = self.labels[self._index]
+        self._index += 1
+        return cv2.imread(str(self.directory / self.current['file']))
+
+
+if __name__ == '__main__':
+    import profiling
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--write', type=Path, default=SRC_PATH.parent / 'temp' / 'synthetic',
+                        metavar='DIR', help='directory to write the frames to')
+    parser.add_argument('--replay', action='store_true',
+                        help='run the bot over the frames instead of writing them')
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
+    synthesizer = TableSynthesizer(noise=2.0, jpeg_quality=90, animation_frames=2, seed=0)
+    if args.replay:
+        from bot import Bot
+        Bot(SyntheticCapture(synthesizer, args.frames, frames_per_street=4),
+            show_status=False).run(profiling.from_args(args))
+    else:
+        synthesizer.write(args.write, args.frames, frames_per_street=4)
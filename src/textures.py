@@ -0,0 +1,177 @@
+"""
+Precomputed board texture index.
+
+Every suit isomorphic flop (1,755 of them, or 16,432 turns) gets one row of
+texture features, plus the distribution of hand strengths each of a few top
+ranges has on it. The index is generated once into the artifact cache and
+memory-mapped at load, and any board finds its row in O(1) through the
+combinatorial rank of its sorted cards.
+"""
+
+__all__ = [
+    'RANGE_FRACTIONS',
+    'HIGH_CLASSES',
+    'TextureIndex',
+    'texture_index',
+]
+
+__author__ = 'Dusti Johnson'
+__copyright__ = '2023, Dusti Johnson'
+__status__ = 'Development'
+
+from itertools import combinations
+from math import comb
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+import artifacts
+from cards import SUIT_PERMUTATIONS, card_codes, to_mask
+from evaluator import FLUSH, STRAIGHT, STRAIGHT_FLUSH, STRAIGHT_HIGH, category, evaluate
+from hand import HAND_RANKS_CSV
+from ranges import COMBO_MASKS, COMBOS, top_range
+
+# Top ranges whose hand strength distribution is stored for every board.
+RANGE_FRACTIONS = (0.1, 0.25, 0.5, 1.0)
+HS_BINS = 10
+
+# Board classes by top card: ace high, broadway, middle and low.
+HIGH_CLASSES = ('ace', 'broadway', 'middle', 'low')
+
+# BINOMIAL[n, k] = n choose k
+BINOMIAL = np.array([[comb(n, k) for k in range(6)] for n in range(53)], dtype=np.int64)
+
+
+def board_rank(codes: np.ndarray) -> np.ndarray:
+    """Combinatorial rank of boards, an (..., k) array of ascending card codes."""
+    codes = np.asarray(codes, dtype=np.int64)
+    return sum(BINOMIAL[codes[..., i], i + 1] for i in range(codes.shape[-1]))
+
+
+def canonical_boards(n_cards: int):
+    """(canonical boards, row of the canonical board of every board in rank order)."""
+    boards = np.array(list(combinations(range(52), n_cards)), dtype=np.int64)
+    relabelled = SUIT_PERMUTATIONS[:, boards // 13].astype(np.int64) * 13 + boards % 13
+    keys = board_rank(np.sort(relabelled, axis=-1)).min(axis=0)
+    canonical, row = np.unique(keys, return_inverse=True)
+    by_rank = np.empty(len(boards), dtype=np.int64)
+    by_rank[board_rank(boards)] = np.arange(len(boards))
+    rows = np.empty(len(boards), dtype=np.int32)
+    rows[board_rank(boards)] = row
+    return boards[by_rank[canonical]], rows
+
+
+def _straight_draws(ranks: np.ndarray) -> np.ndarray:
+    """Whether one more rank would complete a straight that ``ranks`` doesn't hold yet."""
+    completed = STRAIGHT_HIGH[ranks[:, None] | (1 << np.arange(13))] >= 0
+    return completed.any(axis=1) & (STRAIGHT_HIGH[ranks] < 0)
+
+
+def _features(board: np.ndarray, disjoint: np.ndarray,
+              range_weights: np.ndarray) -> Dict[str, np.ndarray]:
+    board_mask = to_mask(board)
+    live = (COMBO_MASKS & board_mask) == 0
+    combos = COMBO_MASKS[live]
+    hands = board_mask | combos
+    values = evaluate(hands)
+    categories = category(values)
+
+    ranks = board % 13
+    suit_counts = np.bincount(board // 13, minlength=4)
+    rank_counts = np.bincount(ranks, minlength=13)
+    top = ranks.max()
+
+    # Rank and suit masks of the board plus every combo
+    all_cards = np.concatenate((np.broadcast_to(board, (len(combos), len(board))),
+                                COMBOS[live]), axis=1).astype(np.int64)
+    rank_masks = np.bitwise_or.reduce(1 << (all_cards % 13), axis=1)
+    max_suit = np.stack([(all_cards // 13 == s).sum(axis=1) for s in range(4)]).max(axis=0)
+
+    # Hand strength of every live combo against each range, card removal included
+    beats = (values[:, None] > values[None, :]) + (values[:, None] == values[None, :]) * 0.5
+    mask = disjoint[np.ix_(live, live)]
+    weights = range_weights[:, live].T
+    hs = ((beats * mask) @ weights) / np.maximum(mask @ weights, 1e-12)
+    bins = np.minimum((hs * HS_BINS).astype(np.int64), HS_BINS - 1)
+    hist = np.stack([
+        np.bincount(bins[:, r], weights[:, r], minlength=HS_BINS) / max(weights[:, r].sum(), 1)
+        for r in range(len(range_weights))
+    ])
+
+    return {
+        'paired': np.int8(rank_counts.max() - 1),
+        'suits': np.int8(suit_counts.max()),
+        'high_rank': np.int8(top),
+        'high_class': np.int8(0 if top == 12 else 1 if top >= 8 else 2 if top >= 5 else 3),
+        'spread': np.int8(_spread(rank_counts)),
+        'straight_made': np.float32(np.isin(categories, (STRAIGHT, STRAIGHT_FLUSH)).mean()),
+        'straight_draws': np.float32(_straight_draws(rank_masks).mean()),
+        'flush_made': np.float32(np.isin(categories, (FLUSH, STRAIGHT_FLUSH)).mean()),
+        'flush_draws': np.float32((max_suit == 4).mean()),
+        'hs_hist': hist.astype(np.float32),
+    }
+
+
+def _spread(rank_counts: np.ndarray) -> int:
+    """Smallest span of ranks covering the board's distinct ranks, aces also playing low."""
+    ranks = np.flatnonzero(rank_counts)
+    spread = ranks.max() - ranks.min()
+    if 12 in ranks:
+        low = np.where(ranks == 12, -1, ranks)
+        spread = min(spread, low.max() - low.min())
+    return spread
+
+
+def build_index(n_cards: int = 3) -> Dict[str, np.ndarray]:
+    """Generate the texture index of every canonical ``n_cards`` board."""
+    boards, rows = canonical_boards(n_cards)
+    disjoint = (COMBO_MASKS[:, None] & COMBO_MASKS[None, :]) == 0
+    range_weights = np.stack([top_range(f) for f in RANGE_FRACTIONS])
+    features = [_features(board, disjoint, range_weights) for board in boards]
+    arrays = {name: np.stack([f[name] for f in features]) for name in features[0]}
+    arrays['boards'] = boards.astype(np.int8)
+    arrays['rows'] = rows
+    return arrays
+
+
+class TextureIndex:
+    """Texture features of every canonical board, memory-mapped from the artifact cache."""
+
+    def __init__(self, n_cards: int = 3):
+        self.n_cards = n_cards
+        self.arrays = artifacts.load(
+            f'textures_{n_cards}', lambda: build_index(n_cards),
+            [Path(__file__).resolve(), HAND_RANKS_CSV], mmap=True)
+        self.rows = self.arrays['rows']
+
+    def __len__(self):
+        return len(self.arrays['boards'])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+    def row(self, board: List[str]) -> int:
+        """Row of the canonical form of a board."""
+        return int(self.rows[board_rank(np.sort(card_codes(board)))])
+
+    def features(self, board: List[str]) -> Dict[str, np.ndarray]:
+        row = self.row(board)
+        return {name: array[row] for name, array in self.arrays.items() if name != 'rows'}
+
+
+_indexes: Dict[int, TextureIndex] = {}
+
+
+def texture_index(n_cards: int = 3) -> TextureIndex:
+    """The shared index of ``n_cards`` boards, 3 for flops, 4 for turns."""
+    if n_cards not in _indexes:
+        _indexes[n_cards] = TextureIndex(n_cards)
+    return _indexes[n_cards]
+
+
+if __name__ == '__main__':
+    index = texture_index()
+    print(f"{len(index)} canonical flops")
+    for flop in (['Qh', '7h', '2c'], ['9s', '8s', '7s'], ['Ac', 'Ad', 'Kh']):
+        print(flop, index.features(flop))